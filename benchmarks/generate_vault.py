@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic vault generator for benchmarks.
+
+The generated vault mimics a real Zettelkasten: link targets follow a
+power-law distribution (a few hub notes are linked from everywhere), notes
+carry hashtags, front matter is a mix of YAML, TOML, JSON and none, some
+notes live in Inbox folders, and images are embedded from notes.
+"""
+
+import os
+import sys
+import json
+import random
+import argparse
+import itertools
+
+WORDS = [
+    "atomic", "note", "idea", "memory", "index", "link", "graph", "thought",
+    "source", "draft", "concept", "review", "project", "question", "insight",
+    "method", "theory", "practice", "summary", "reading", "writing", "habit",
+]
+
+TAGS = [
+    "zettelkasten", "reading", "writing", "idea", "project", "todo", "book",
+    "paper", "meeting", "journal", "research", "method", "review", "draft",
+]
+
+FOLDERS = ["", "", "", "Inbox", "Projects", "Projects/Archive", "Literature", "Draft"]
+
+FRONT_MATTER_WEIGHTS = [("none", 40), ("yaml", 30), ("toml", 15), ("json", 15)]
+
+LINK_EXPONENT = 1.1  # Zipf exponent of the link target distribution
+
+
+def _note_title(rng, index):
+    """Build a readable, unique note title"""
+    words = rng.sample(WORDS, 2)
+    return f"{words[0]} {words[1]} {index:06d}"
+
+
+def _front_matter(format_type, title, tags):
+    """Render an existing front matter block in the given format"""
+    if format_type == "yaml":
+        return f"---\ntitle: {title}\ntags: [{', '.join(tags)}]\n---\n\n"
+    if format_type == "toml":
+        tag_list = ", ".join(f'"{tag}"' for tag in tags)
+        return f'+++\ntitle = "{title}"\ntags = [{tag_list}]\n+++\n\n'
+    if format_type == "json":
+        return json.dumps({"title": title, "tags": tags}, indent=2) + "\n\n"
+    return ""
+
+
+def _link(rng, title):
+    """Render a link to a note in one of the styles found in real vaults"""
+    style = rng.random()
+    if style < 0.5:
+        return f"[[{title}]]"
+    if style < 0.7:
+        return f"[[{title} | {rng.choice(WORDS)}]]"
+    return f"[{rng.choice(WORDS)}]({title}.md)"
+
+
+def generate_vault(root_path, note_count, seed=0, image_ratio=0.1, max_links=8):
+    """Generate a synthetic vault under root_path and return a summary"""
+    rng = random.Random(seed)
+    os.makedirs(root_path, exist_ok=True)
+
+    titles = [_note_title(rng, i) for i in range(note_count)]
+    folders = [rng.choice(FOLDERS) for _ in range(note_count)]
+    image_count = int(note_count * image_ratio)
+    images = [f"image {i:06d}.png" for i in range(image_count)]
+
+    # Power-law weights: note i is linked with probability ~ 1 / (i + 1) ** s
+    cum_weights = list(itertools.accumulate(
+        1.0 / (rank + 1) ** LINK_EXPONENT for rank in range(note_count)
+    ))
+    formats, format_weights = zip(*FRONT_MATTER_WEIGHTS)
+
+    link_cnt = 0
+    format_cnt = {format_type: 0 for format_type in formats}
+    for i, title in enumerate(titles):
+        tags = rng.sample(TAGS, rng.randint(0, 3))
+        format_type = rng.choices(formats, weights=format_weights)[0]
+        format_cnt[format_type] += 1
+
+        targets = rng.choices(range(note_count), cum_weights=cum_weights, k=rng.randint(0, max_links))
+        links = [_link(rng, titles[target]) for target in targets if target != i]
+        link_cnt += len(links)
+
+        lines = [f"# {title}", ""]
+        if format_type == "none" and tags:
+            lines.append(" ".join("#" + tag for tag in tags))
+            lines.append("")
+        for paragraph in range(rng.randint(1, 4)):
+            sentence = " ".join(rng.choices(WORDS, k=rng.randint(8, 30)))
+            if links:
+                sentence += " " + links.pop()
+            if rng.random() < 0.2:
+                sentence += " #" + rng.choice(TAGS)
+            lines.append(sentence)
+            lines.append("")
+        if links:
+            lines.append("Related: " + ", ".join(links))
+        if images and rng.random() < 0.2:
+            lines.append(f"![[{rng.choice(images)}]]")
+
+        content = _front_matter(format_type, title, tags) + "\n".join(lines) + "\n"
+        folder = os.path.join(root_path, folders[i])
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, title + ".md"), "w", encoding="utf-8", newline="\n") as f:
+            f.write(content)
+
+    image_folder = os.path.join(root_path, "images")
+    if images:
+        os.makedirs(image_folder, exist_ok=True)
+    for image in images:
+        with open(os.path.join(image_folder, image), "wb") as f:
+            f.write(b"\x89PNG\r\n\x1a\n" + rng.randbytes(64))
+
+    return {
+        "notes": note_count,
+        "images": image_count,
+        "links": link_cnt,
+        "front_matter": format_cnt,
+        "seed": seed,
+    }
+
+
+def main():
+    """Generate a vault from the command line"""
+    parser = argparse.ArgumentParser(description="Generate a synthetic Zettelkasten vault")
+    parser.add_argument("root", help="folder to generate the vault in")
+    parser.add_argument("-n", "--notes", type=int, default=1000, help="number of notes (default: 1000)")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="random seed (default: 0)")
+    parser.add_argument("--image-ratio", type=float, default=0.1, help="images per note (default: 0.1)")
+    args = parser.parse_args()
+    if os.path.exists(args.root) and os.listdir(args.root):
+        print("The specified folder is not empty")
+        sys.exit(1)
+    summary = generate_vault(args.root, args.notes, args.seed, args.image_ratio)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Benchmark harness for Zettelkasten note normalization.
+
+Generates synthetic vaults of increasing size, times each normalization
+stage and the single-pass pipeline on them, and reports throughput and
+scaling so that super-linear behavior shows up before a release. Every
+size is run several times on a fresh vault and the best time is kept.
+Only steps between sizes large enough and far enough apart to measure a
+trend can fail the run; the others are reported only.
+
+    python benchmarks/run_benchmarks.py --sizes 1000 10000 100000
+
+With --io-delay, every open, stat and rename waits the given number of
+milliseconds first, standing in for a vault on a network share:
+
+    python benchmarks/run_benchmarks.py --sizes 1000 --io-delay 2 --io-jobs 1 16
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import builtins
+import tempfile
+import contextlib
+
+# Add the src directory to the Python path
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "src"))
+sys.path.insert(0, HERE)
+
+from zettelkasten_normalizer.file_operations import get_files
+from zettelkasten_normalizer.yfm_processor import check_and_create_yfm
+from zettelkasten_normalizer.link_processor import (
+    convert_wikilinks_to_markdown,
+    rename_notes_with_links,
+    rename_images_with_links,
+)
+from zettelkasten_normalizer.pipeline import run_pipeline
+from zettelkasten_normalizer.parallel import set_io_jobs
+from generate_vault import generate_vault
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+# Scaling exponent above which a stage is flagged (1.0 is linear, 2.0 quadratic)
+SCALING_WARNING_EXPONENT = 1.5
+
+# Runs per size; the best time is kept, since noise only ever makes a run slower
+DEFAULT_REPEAT = 3
+
+# A scaling step is only checked from this many notes on and over at least this size ratio
+SCALING_MIN_NOTES = 1000
+SCALING_MIN_RATIO = 4.0
+
+STAGES = [
+    ("check_and_create_yfm", lambda vault: check_and_create_yfm(get_files(vault, "note"), "yaml")),
+    ("convert_wikilinks_to_markdown", lambda vault: convert_wikilinks_to_markdown(get_files(vault, "note"), vault)),
+    ("rename_notes_with_links", lambda vault: rename_notes_with_links(get_files(vault, "note"), vault)),
+    ("rename_images_with_links", lambda vault: rename_images_with_links(get_files(vault, "image"), vault)),
+]
+
+ALL_FUNCTIONS = {
+    "function_create_yfm": True,
+    "function_rename_notes": True,
+    "function_rename_images": True,
+    "function_convert_wikilinks": True,
+}
+
+
+def _delayed(func, delay):
+    """Wrap a filesystem call so that it waits delay seconds first"""
+    def wrapper(*args, **kwargs):
+        time.sleep(delay)
+        return func(*args, **kwargs)
+    return wrapper
+
+
+@contextlib.contextmanager
+def simulated_latency(delay_ms):
+    """Add a round trip of delay_ms to every open, stat and rename"""
+    if not delay_ms:
+        yield
+        return
+    delay = delay_ms / 1000
+    patched = [(builtins, "open"), (os, "stat"), (os, "rename"), (os, "replace"), (shutil, "move")]
+    originals = [(module, name, getattr(module, name)) for module, name in patched]
+    for module, name, func in originals:
+        setattr(module, name, _delayed(func, delay))
+    try:
+        yield
+    finally:
+        for module, name, func in originals:
+            setattr(module, name, func)
+
+
+def time_call(func, *args):
+    """Return the wall and CPU time of a call in seconds"""
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    func(*args)
+    return time.perf_counter() - wall_start, time.process_time() - cpu_start
+
+
+def best_time(timings):
+    """The (wall, cpu) time of the fastest of several runs"""
+    return min(timings, key=lambda timing: timing[0])
+
+
+def stage_result(size, wall, cpu, repeat):
+    """Result of the best run of a stage"""
+    return {
+        "wall_seconds": wall,
+        "cpu_seconds": cpu,
+        "notes_per_second": size / wall if wall else None,
+        "runs": repeat,
+    }
+
+
+def benchmark_size(size, seed, workdir, jobs, io_jobs_list=(1,), io_delay=0, repeat=DEFAULT_REPEAT):
+    """Benchmark every stage and the pipeline on a vault of the given size,
+    keeping the best of repeat runs on a fresh vault each"""
+    vault = os.path.join(workdir, f"vault_{size}")
+    result = {"notes": size, "stages": {}}
+
+    print(f"--- {size} notes: generating vault...", flush=True)
+    timings = {name: [] for name, stage in STAGES}
+    for run in range(repeat):
+        # The stages run one after the other on the same vault, as in a staged run
+        summary = generate_vault(vault, size, seed)
+        for name, stage in STAGES:
+            with simulated_latency(io_delay):
+                timings[name].append(time_call(stage, vault))
+        shutil.rmtree(vault)
+    result["vault"] = summary
+    for name, stage in STAGES:
+        wall, cpu = best_time(timings[name])
+        result["stages"][name] = stage_result(size, wall, cpu, repeat)
+        print(f"{name:32s} {wall:9.3f}s  {size / wall if wall else 0:10.0f} notes/s", flush=True)
+
+    # The pipeline runs all stages at once on a fresh copy of the same vault
+    for io_jobs in io_jobs_list:
+        set_io_jobs(io_jobs)
+        pipeline_timings = []
+        for run in range(repeat):
+            generate_vault(vault, size, seed)
+            with simulated_latency(io_delay):
+                pipeline_timings.append(time_call(run_pipeline, vault, vault, ALL_FUNCTIONS, "yaml", jobs))
+            shutil.rmtree(vault)
+        wall, cpu = best_time(pipeline_timings)
+        name = "pipeline" if len(io_jobs_list) == 1 else f"pipeline (io_jobs={io_jobs})"
+        result["stages"][name] = stage_result(size, wall, cpu, repeat)
+        label = f"pipeline (jobs={jobs}, io_jobs={io_jobs})"
+        print(f"{label:32s} {wall:9.3f}s  {size / wall if wall else 0:10.0f} notes/s", flush=True)
+    return result
+
+
+def is_checked_step(from_notes, to_notes):
+    """Whether the exponent between two sizes is reliable enough to fail the run.
+    Small vaults are dominated by fixed costs, and close sizes by noise."""
+    return from_notes >= SCALING_MIN_NOTES and to_notes / from_notes >= SCALING_MIN_RATIO
+
+
+def compute_scaling(results):
+    """Estimate the scaling exponent of every stage between consecutive sizes.
+    An exponent of 1 means linear time, 2 means quadratic time."""
+    scaling = {}
+    for previous, current in zip(results, results[1:]):
+        size_ratio = current["notes"] / previous["notes"]
+        checked = is_checked_step(previous["notes"], current["notes"])
+        for name, stage in current["stages"].items():
+            previous_wall = previous["stages"][name]["wall_seconds"]
+            if previous_wall <= 0 or stage["wall_seconds"] <= 0:
+                continue
+            exponent = math.log(stage["wall_seconds"] / previous_wall) / math.log(size_ratio)
+            scaling.setdefault(name, []).append({
+                "from": previous["notes"],
+                "to": current["notes"],
+                "exponent": exponent,
+                "checked": checked,
+            })
+    return scaling
+
+
+def find_super_linear(steps):
+    """The checked steps whose exponent is above SCALING_WARNING_EXPONENT"""
+    return [step for step in steps if step["checked"] and step["exponent"] > SCALING_WARNING_EXPONENT]
+
+
+def print_report(results, scaling):
+    """Print the throughput table and the scaling curves"""
+    print("\n====== Throughput (notes/s) ======")
+    names = list(results[0]["stages"])
+    print(f"{'stage':32s}" + "".join(f"{result['notes']:>12d}" for result in results))
+    for name in names:
+        row = "".join(
+            f"{result['stages'][name]['notes_per_second'] or 0:12.0f}" for result in results
+        )
+        print(f"{name:32s}{row}")
+
+    if not scaling:
+        return
+    print("\n====== Scaling exponent (1.0 = linear, 2.0 = quadratic) ======")
+    for name in names:
+        steps = scaling.get(name, [])
+        row = "  ".join(
+            f"{step['from']}->{step['to']}: {step['exponent']:.2f}" + ("" if step["checked"] else "*") for step in steps
+        )
+        warning = bool(find_super_linear(steps))
+        print(f"{name:32s}{row}" + ("  <-- SUPER-LINEAR" if warning else ""))
+    if any(not step["checked"] for steps in scaling.values() for step in steps):
+        print(f"* not checked: sizes below {SCALING_MIN_NOTES} notes or less than {SCALING_MIN_RATIO:g}x apart")
+
+
+def main():
+    """Run the benchmarks from the command line"""
+    parser = argparse.ArgumentParser(description="Benchmark the normalization stages")
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+        help="vault sizes in notes (default: 1000 10000 100000)",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="random seed (default: 0)")
+    parser.add_argument(
+        "--repeat", type=int, default=DEFAULT_REPEAT,
+        help=f"runs per size, the best time is kept (default: {DEFAULT_REPEAT})",
+    )
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="worker processes for the pipeline (default: 1)")
+    parser.add_argument(
+        "--io-jobs", type=int, nargs="+", default=[1],
+        help="I/O threads for the pipeline, one run per value (default: 1)",
+    )
+    parser.add_argument(
+        "--io-delay", type=float, default=0,
+        help="milliseconds added to every open, stat and rename, to simulate a network share",
+    )
+    parser.add_argument("--workdir", help="folder for the generated vaults (default: a temporary folder)")
+    parser.add_argument("--json", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="zettel_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        results = [
+            benchmark_size(size, args.seed, workdir, args.jobs, args.io_jobs, args.io_delay, max(1, args.repeat))
+            for size in sorted(args.sizes)
+        ]
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    scaling = compute_scaling(results)
+    print_report(results, scaling)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"results": results, "scaling": scaling}, f, indent=2)
+        print("\nResults written to " + args.json)
+
+    # Exit with an error if a stage looks super-linear, so CI can catch it
+    if any(find_super_linear(steps) for steps in scaling.values()):
+        sys.exit(2)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,5 +10,7 @@ __author__ = "jMatsuzaki"
 # Import main functions for easier access
 from .yfm_processor import check_and_create_yfm
 from .link_processor import rename_notes_with_links, rename_images_with_links
+from .pipeline import run_pipeline
+from .plan import apply_plan
 from .file_operations import get_files
 from .utils import setup_logger, query_yes_no
\ No newline at end of file
@@ -0,0 +1,122 @@
+"""
+Thin client of the normalization server (--serve).
+
+Only the standard library is imported, so that a request costs little more
+than starting the interpreter. The client can also be run as a script,
+without importing the package:
+
+    python src/zettelkasten_normalizer/client.py ROOT note.md other.md
+
+Requests and responses are single JSON lines sent over the Unix domain socket.
+"""
+
+import os
+import sys
+import json
+import socket
+import argparse
+
+try:
+    from .config import SERVER_SOCKET, SERVER_TIMEOUT
+except ImportError:
+    # Run as a script: config.py is next to this file
+    from config import SERVER_SOCKET, SERVER_TIMEOUT
+
+
+def get_socket_path(root_path):
+    """Path of the socket of the server of a root folder"""
+    return os.path.join(root_path, SERVER_SOCKET)
+
+
+def read_message(connection):
+    """Read one JSON message from a socket, or return None if nothing was sent"""
+    chunks = []
+    while True:
+        chunk = connection.recv(64 * 1024)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        if chunk.endswith(b"\n"):
+            break
+    data = b"".join(chunks)
+    if not data.strip():
+        return None
+    return json.loads(data.decode("utf-8"))
+
+
+def write_message(connection, message):
+    """Send one JSON message over a socket"""
+    connection.sendall(json.dumps(message, ensure_ascii=False).encode("utf-8") + b"\n")
+
+
+def send_request(socket_path, request, timeout=SERVER_TIMEOUT):
+    """Send a request to the server and return its response"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(timeout)
+        connection.connect(socket_path)
+        write_message(connection, request)
+        return read_message(connection)
+
+
+def parse_arguments(argv=None):
+    """Parse the arguments of the client"""
+    parser = argparse.ArgumentParser(description="Send notes to a running normalization server (--serve)")
+    parser.add_argument("root", help="Zettelkasten's root folder the server was started for")
+    parser.add_argument("paths", nargs="*", help="notes, images or folders to normalize")
+    parser.add_argument(
+        "--files-from", metavar="PATH",
+        help="also normalize the files listed in PATH, one per line or NUL-separated (- for stdin)"
+    )
+    parser.add_argument("--socket", metavar="PATH", help="socket of the server (default: in the root folder)")
+    parser.add_argument("--ping", action="store_true", help="only check that the server is running")
+    parser.add_argument("--stop", action="store_true", help="stop the server")
+    parser.add_argument(
+        "--timeout", type=float, default=SERVER_TIMEOUT,
+        help=f"seconds to wait for the result (default: {SERVER_TIMEOUT})"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Send one request to the server and print the result"""
+    args = parse_arguments(argv)
+    if args.ping:
+        request = {"command": "ping"}
+    elif args.stop:
+        request = {"command": "stop"}
+    else:
+        paths = list(args.paths)
+        if args.files_from:
+            with (sys.stdin if args.files_from == "-" else open(args.files_from, "r", encoding="utf-8")) as f:
+                data = f.read()
+            separator = "\0" if "\0" in data else "\n"
+            paths.extend(line.rstrip("\r") for line in data.split(separator) if line.strip())
+        request = {"command": "normalize", "cwd": os.getcwd(), "paths": paths}
+
+    socket_path = args.socket or get_socket_path(args.root)
+    try:
+        response = send_request(socket_path, request, args.timeout)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print("No normalization server is running for " + args.root + " (start one with --serve)")
+        sys.exit(2)
+    except (OSError, ValueError) as e:
+        print(f"The request failed: {e}")
+        sys.exit(1)
+    if response is None or not response.get("ok"):
+        print("The server could not process the request: " + str((response or {}).get("error")))
+        sys.exit(1)
+
+    for target, reason in response.get("skipped", []):
+        print(f"Skipped {target}: {reason}")
+    if request["command"] == "normalize":
+        print(
+            f"{response['notes_loaded']} notes normalized, {response['files_written']} written, "
+            f"{response['files_renamed']} renamed, {response['linked_files_updated']} linked files updated "
+            f"in {response['seconds']:.3f}s"
+        )
+    elif request["command"] == "ping":
+        print("The normalization server is running for " + response["root"])
+
+
+if __name__ == "__main__":
+    main()
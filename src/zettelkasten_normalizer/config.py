@@ -37,6 +37,12 @@ YFM = {
 
 # Front matter format settings
 FRONT_MATTER_FORMAT = "yaml"  # Supported formats: "yaml", "toml", "json"
+FRONT_MATTER_HEAD_BYTES = 4096  # Bytes read to detect and parse front matter without loading the note body
+FRONT_MATTER_MAX_BYTES = 1024 * 1024  # Front matter not closed within this many bytes is treated as invalid
+STREAM_MIN_BYTES = 32 * 1024 * 1024  # Notes at least this large are transformed line by line instead of being loaded into memory
+
+# UID settings
+UID_STRATEGY = "uuid4"  # How new UIDs are made: "uuid4" (random), "timestamp" (yyyymmddhhmmss of the creation date) or "content" (hash of the content)
 
 # Function execution settings
 EXECUTION_FUNCTION_LIST = {
@@ -45,3 +51,51 @@ EXECUTION_FUNCTION_LIST = {
     "function_rename_images": True,  # Replace the file name of the image with the UID and replace the linked part from the other note
     "function_convert_wikilinks": True,  # Convert WikiLinks [[link]] to Markdown links [link](link.md)
 }
+
+# Parallel execution settings
+PARALLEL_MIN_FILES = 100  # Process pools are only used when at least this many files are processed
+IO_JOBS = 8  # File reads and stats overlapped in threads (set higher for network shares, 1 to disable)
+PREFETCH_DEPTH = 4  # Files read ahead per I/O thread, bounding the memory used for prefetched contents
+
+# Incremental mode settings
+MANIFEST_FILE = "normalization_zettel.manifest.json"  # Stored in the Zettelkasten's root folder
+
+# Vault index settings
+INDEX_FILE = "normalization_zettel.index.sqlite"  # SQLite index of notes, tags and links kept with --index, stored in the Zettelkasten's root folder
+
+# Rename journal settings
+JOURNAL_FILE = "normalization_zettel.journal"  # Stored in the Zettelkasten's root folder while renames are in progress
+JOURNAL_BATCH_OPERATIONS = 1000  # Planned operations per journal line, so no line holds the plan of a whole vault
+
+# Watch mode settings
+WATCH_DEBOUNCE_SECONDS = 1.0  # Changes are normalized once no new event arrived for this long
+WATCH_POLL_INTERVAL = 2.0  # Seconds between scans when inotify is not available
+
+# Server settings
+SERVER_SOCKET = "normalization_zettel.sock"  # Unix domain socket of --serve, stored in the Zettelkasten's root folder
+SERVER_TIMEOUT = 600  # Seconds a client waits for the result of a request
+
+# Write settings
+ATOMIC_WRITES = True  # Write to a temporary file and rename it into place, so a crash never leaves a half-written note
+FSYNC_WRITES = False  # fsync every written file and, once per run, its folder (also enabled with --fsync)
+KEEP_FILE_FORMAT = True  # Write notes back in the encoding and line endings they were read with (False, or --utf8-lf: always UTF-8 with LF)
+
+# Link prefilter settings
+PREFILTER_MMAP_BYTES = 64 * 1024  # Notes at least this large are memory-mapped instead of read when searching for links
+
+# Logging settings
+LOG_FILE = "normalization_zettel.log"  # Log file in the Zettelkasten's root folder
+LOG_LEVEL = "INFO"  # Level of the log file (DEBUG also logs every processed file; also set with --log-level)
+LOG_MAX_BYTES = 10 * 1024 * 1024  # The log file is rotated once it reaches this size
+LOG_BACKUP_COUNT = 5  # Number of rotated log files kept
+PROGRESS_INTERVAL = 2.0  # Seconds between progress messages of a long stage
+
+# Run history settings
+HISTORY_FILE = "normalization_zettel.history.jsonl"  # One line per run, stored in the Zettelkasten's root folder
+HISTORY_ENABLED = True  # Append a record of every run to the history (False, or --no-history: do not)
+HISTORY_MAX_RUNS = 1000  # Only the most recent runs are kept in the history
+HISTORY_BASELINE_RUNS = 10  # The baseline of a stage is its median over this many earlier comparable runs
+HISTORY_MIN_BASELINE_RUNS = 3  # Stages are only compared once this many comparable runs were recorded
+HISTORY_SIZE_TOLERANCE = 0.2  # Runs are comparable if their vault sizes differ by at most this share
+HISTORY_SLOWDOWN_FACTOR = 1.5  # A stage is flagged if it took this many times its baseline...
+HISTORY_MIN_SLOWDOWN_SECONDS = 1.0  # ...and at least this many seconds longer
@@ -7,49 +7,185 @@ import uuid
 import re
 import logging
 from .config import EXCLUDE_DIR, EXCLUDE_FILE, NOTE_EXT, IMG_EXT
-from .utils import get_file_name
+from .utils import get_file_name, get_file_stat, get_stat_cache, invalidate_stat, path_exists
+from .parallel import prefetch
+from . import stats
 
 # Get logger
 logger = logging.getLogger(__name__)
 
 
+# Extension tuples for str.endswith, built once
+NOTE_EXT_TUPLE = tuple(NOTE_EXT)
+IMG_EXT_TUPLE = tuple(IMG_EXT)
+
+
+class VaultScan:
+    """Notes and images found by one scan of a folder, with their stat results.
+    The scan is shared by all stages and kept up to date as files are renamed."""
+
+    def __init__(self, start_path):
+        """Initialize an empty scan of start_path."""
+        self.start_path = start_path
+        self.notes = []
+        self.images = []
+        self.entries = {}  # path -> DirEntry or stat result
+        self.positions = {}  # path -> index in notes or images
+
+    def add(self, path, entry=None):
+        """Add a file found by the scan (or created afterwards)"""
+        if check_note_type(path, "note"):
+            files = self.notes
+        elif check_note_type(path, "image"):
+            files = self.images
+        else:
+            return
+        self.positions[path] = len(files)
+        files.append(path)
+        self.entries[path] = entry
+
+    def files(self, type, start_path=None):
+        """Return the files of the type, optionally only those below start_path"""
+        files = self.notes if type == "note" else self.images
+        if start_path is None or start_path == self.start_path:
+            return list(files)
+        if os.path.isfile(start_path):
+            return [start_path] if check_note_type(start_path, type) else []
+        prefix = os.path.join(os.path.abspath(start_path), "")
+        if not prefix.startswith(os.path.join(os.path.abspath(self.start_path), "")):
+            # Not covered by this scan
+            return get_files(start_path, type)
+        return [file for file in files if os.path.abspath(file).startswith(prefix)]
+
+    def select(self, paths, type):
+        """Return the files of the type among paths, with folders expanded.
+        The paths may be relative or absolute; the paths of the scan are returned,
+        so files it excluded (hidden or in excluded folders) are skipped."""
+        files = self.notes if type == "note" else self.images
+        by_abspath = {os.path.abspath(file): file for file in files}
+        selected = {}  # Ordered set
+        for path in paths:
+            if os.path.isdir(path):
+                selected.update(dict.fromkeys(self.files(type, path)))
+                continue
+            file = by_abspath.get(os.path.abspath(path))
+            if file is not None:
+                selected[file] = None
+        return list(selected)
+
+    def stat(self, path):
+        """Return the stat result of a file, from the scan when possible"""
+        entry = self.entries.get(path)
+        if isinstance(entry, os.DirEntry):
+            # DirEntry caches its stat result after the first call
+            return entry.stat()
+        if entry is None:
+            entry = get_file_stat(path)
+            if path in self.entries:
+                self.entries[path] = entry
+        return entry
+
+    def _try_stat(self, path):
+        """stat a file for prefetch_stats, ignoring files that disappeared"""
+        try:
+            self.stat(path)
+        except OSError:
+            pass
+
+    def prefetch_stats(self, files):
+        """stat the files in I/O threads, so later lookups are answered from the scan"""
+        for _ in prefetch(self._try_stat, files):
+            pass
+
+    def invalidate(self, path):
+        """Forget the cached stat result of a file that has been written"""
+        if path in self.entries:
+            self.entries[path] = None
+        invalidate_stat(path)
+
+    def rename(self, old_path, new_path):
+        """Update the scan after a file has been renamed"""
+        position = self.positions.pop(old_path, None)
+        if position is None:
+            return
+        files = self.notes if check_note_type(old_path, "note") else self.images
+        files[position] = new_path
+        self.positions[new_path] = position
+        del self.entries[old_path]
+        self.entries[new_path] = None
+
+
+def scan_vault(start_path):
+    """Find all notes and images below start_path in one os.scandir pass.
+    Files are returned in the same order as a top-down os.walk.
+    The listings seed the stat cache of the run, if there is one."""
+    scan = VaultScan(start_path)
+    cache = get_stat_cache()
+    if os.path.isfile(start_path):
+        scan.add(start_path)
+        stats.record("files_scanned", len(scan.entries))
+        return scan
+    stack = [start_path]
+    while stack:
+        pathname = stack.pop()
+        subdirs = []
+        try:
+            with os.scandir(pathname) as it:
+                entries = list(it)
+        except OSError as e:
+            logger.error(f"Error scanning folder {pathname}: {e}")
+            continue
+        if cache is not None:
+            cache.seed_directory(pathname, entries)
+        for entry in entries:
+            name = entry.name
+            # Hidden folders and files beginning with "." are excluded
+            if name[0] == ".":
+                continue
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                continue
+            if is_dir:
+                if name not in EXCLUDE_DIR and not entry.is_symlink():
+                    subdirs.append(entry.path)
+            elif name not in EXCLUDE_FILE:
+                scan.add(entry.path, entry)
+        # Visit the subfolders in order, after the files of this folder
+        stack.extend(reversed(subdirs))
+    stats.record("files_scanned", len(scan.entries))
+    return scan
+
+
+def filter_targets(targets, root_path):
+    """Split requested targets into those that can be normalized and those that cannot.
+    Returns the targets and a list of (target, reason) for the skipped ones."""
+    root_prefix = os.path.join(os.path.abspath(root_path), "")
+    selected = []
+    skipped = []
+    for target in targets:
+        if not os.path.join(os.path.abspath(target), "").startswith(root_prefix):
+            skipped.append((target, "outside of the root folder"))
+        elif not os.path.exists(target):
+            # e.g. a file deleted in the commit
+            skipped.append((target, "does not exist"))
+        else:
+            selected.append(target)
+    return selected, skipped
+
+
 def get_files(start_path, type):
     """Retrieves a file of the specified path and type"""
-    files = []
-    if os.path.isfile(start_path):
-        if check_note_type(start_path, type):
-            files.append(start_path)
-    else:
-        # get all files
-        for pathname, dirnames, filenames in os.walk(start_path, topdown=True):
-            # exclude dir and files
-            dirnames[:] = list(filter(lambda d: not d in EXCLUDE_DIR, dirnames))
-            filenames[:] = list(filter(lambda f: not f in EXCLUDE_FILE, filenames))
-            dirnames[:] = list(
-                filter(lambda d: not d[0] == ".", dirnames)
-            )  # Hidden directory beginning with "."
-            filenames[:] = list(
-                filter(lambda f: not f[0] == ".", filenames)
-            )  # Hidden files beginning with "."
-            for filename in filenames:
-                file_path = os.path.join(pathname, filename)
-                if check_note_type(file_path, type):
-                    # append target notes to array
-                    files.append(file_path)
-    return files
+    return scan_vault(start_path).files(type)
 
 
 def check_note_type(file_path, type):
     """Check if the specified file has an extension of the specified type"""
     if type == "note":
-        target_ext = tuple(NOTE_EXT)
+        return file_path.endswith(NOTE_EXT_TUPLE)
     elif type == "image":
-        target_ext = tuple(IMG_EXT)
-    # Filtering files
-    if file_path.endswith(target_ext):
-        return True
-    else:
-        return False
+        return file_path.endswith(IMG_EXT_TUPLE)
+    return False
 
 
 def check_note_has_uid(file):
@@ -69,7 +205,7 @@ def get_new_filepath_with_uid(file, root_path):
     else:
         path = os.path.dirname(file)
     # Generate new UUID if duplicated (very unlikely but possible)
-    while os.path.exists(build_filepath_by_uid(uid, path, ext)):
+    while path_exists(build_filepath_by_uid(uid, path, ext)):
         uid = uuid.uuid4().hex
     return build_filepath_by_uid(uid, path, ext)
 
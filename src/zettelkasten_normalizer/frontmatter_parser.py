@@ -19,6 +19,14 @@ except ImportError:
     except ImportError:
         tomllib = None
 
+# Closing delimiter lines, matched like line.strip() == delimiter
+_CLOSING_LINES = {
+    "yaml": re.compile(r'^[^\S\n]*---[^\S\n]*$', re.MULTILINE),
+    "toml": re.compile(r'^[^\S\n]*\+\+\+[^\S\n]*$', re.MULTILINE),
+}
+_BRACES = re.compile(r'[{}]')
+_LINE_BREAKS = re.compile(r'\n*')
+
 
 class FrontMatterParser:
     """Parser for different front matter formats."""
@@ -35,11 +43,9 @@ class FrontMatterParser:
     
     def detect_format(self, content: str) -> Optional[str]:
         """Detect front matter format from content."""
-        lines = content.split('\n')
-        if not lines:
-            return None
-        
-        first_line = lines[0].strip()
+        # Only the first line is needed, so the rest of the content is not split
+        line_end = content.find('\n')
+        first_line = (content if line_end == -1 else content[:line_end]).strip()
         
         # YAML format
         if first_line == "---":
@@ -55,44 +61,82 @@ class FrontMatterParser:
         
         return None
     
-    def parse_frontmatter(self, content: str) -> Tuple[Optional[Dict], str]:
-        """Parse front matter from content and return metadata and remaining content."""
+    def locate_frontmatter(self, content: str) -> Optional[Tuple[str, int, int, int]]:
+        """Find the front matter block at the start of content without copying it.
+        Returns the format, the start and end offsets of the header text and the
+        offset where the body starts, or None if there is no closed block."""
         detected_format = self.detect_format(content)
         if not detected_format:
+            return None
+        
+        header_start = content.find('\n') + 1
+        if header_start == 0:
+            return None
+        
+        if detected_format == "json":
+            # The block ends with the line of the brace that closes the first one
+            brace_count = 0
+            for match in _BRACES.finditer(content):
+                if match.group() == '{':
+                    brace_count += 1
+                else:
+                    brace_count -= 1
+                    if brace_count == 0:
+                        line_end = content.find('\n', match.end())
+                        if line_end == -1:
+                            return detected_format, 0, len(content), len(content)
+                        return detected_format, 0, line_end, line_end + 1
+            return None
+        
+        match = _CLOSING_LINES[detected_format].search(content, header_start)
+        if match is None:
+            return None
+        return detected_format, header_start, match.start(), min(match.end() + 1, len(content))
+    
+    def frontmatter_length(self, content: str) -> Optional[int]:
+        """Return the length of the front matter block at the start of content,
+        including the line break of its closing line, or None if it is not closed in content."""
+        location = self.locate_frontmatter(content)
+        if location is None:
+            return None
+        detected_format, header_start, header_end, body_start = location
+        if detected_format != "json" and content[body_start - 1] != '\n':
+            # The last line may still be incomplete
+            return None
+        return body_start
+    
+    def parse_frontmatter(self, content: str) -> Tuple[Optional[Dict], str]:
+        """Parse front matter from content and return metadata and remaining content."""
+        metadata, body_start = self.parse_frontmatter_span(content)
+        if metadata is None:
             return None, content
+        return metadata, content[body_start:]
+    
+    def parse_frontmatter_span(self, content: str) -> Tuple[Optional[Dict], int]:
+        """Parse front matter from content and return metadata and the offset of the body.
+        Only the header is copied; the body can be spliced with serialize_frontmatter."""
+        location = self.locate_frontmatter(content)
+        if location is None:
+            return None, 0
+        detected_format, header_start, header_end, body_start = location
+        header = content[header_start:header_end]
         
         if detected_format == "yaml":
-            return self._parse_yaml(content)
+            metadata = self._parse_yaml(header)
         elif detected_format == "toml":
-            return self._parse_toml(content)
-        elif detected_format == "json":
-            return self._parse_json(content)
+            metadata = self._parse_toml(header)
+        else:
+            metadata = self._parse_json(header)
         
-        return None, content
+        if metadata is None:
+            return None, 0
+        return metadata, body_start
     
-    def _parse_yaml(self, content: str) -> Tuple[Optional[Dict], str]:
+    def _parse_yaml(self, header: str) -> Optional[Dict]:
         """Parse YAML front matter."""
-        lines = content.split('\n')
-        if not lines or lines[0].strip() != "---":
-            return None, content
-        
-        # Find the closing ---
-        end_index = -1
-        for i, line in enumerate(lines[1:], 1):
-            if line.strip() == "---":
-                end_index = i
-                break
-        
-        if end_index == -1:
-            return None, content
-        
-        # Extract YAML content
-        yaml_lines = lines[1:end_index]
-        yaml_content = '\n'.join(yaml_lines)
-        
         # Simple YAML parser (basic key: value pairs)
         metadata = {}
-        for line in yaml_lines:
+        for line in header.split('\n'):
             line = line.strip()
             if ':' in line and not line.startswith('#'):
                 key, value = line.split(':', 1)
@@ -104,97 +148,50 @@ class FrontMatterParser:
                 elif value.startswith("'") and value.endswith("'"):
                     value = value[1:-1]
                 metadata[key] = value
-        
-        # Return remaining content
-        remaining_content = '\n'.join(lines[end_index + 1:])
-        return metadata, remaining_content
+        return metadata
     
-    def _parse_toml(self, content: str) -> Tuple[Optional[Dict], str]:
+    def _parse_toml(self, header: str) -> Optional[Dict]:
         """Parse TOML front matter."""
         if tomllib is None:
             logger.error("TOML parser not available")
-            return None, content
-        
-        lines = content.split('\n')
-        if not lines or lines[0].strip() != "+++":
-            return None, content
-        
-        # Find the closing +++
-        end_index = -1
-        for i, line in enumerate(lines[1:], 1):
-            if line.strip() == "+++":
-                end_index = i
-                break
-        
-        if end_index == -1:
-            return None, content
-        
-        # Extract TOML content
-        toml_lines = lines[1:end_index]
-        toml_content = '\n'.join(toml_lines)
+            return None
         
         try:
-            metadata = tomllib.loads(toml_content)
+            return tomllib.loads(header)
         except Exception as e:
             logger.error(f"Failed to parse TOML: {e}")
-            return None, content
-        
-        # Return remaining content
-        remaining_content = '\n'.join(lines[end_index + 1:])
-        return metadata, remaining_content
+            return None
     
-    def _parse_json(self, content: str) -> Tuple[Optional[Dict], str]:
+    def _parse_json(self, header: str) -> Optional[Dict]:
         """Parse JSON front matter."""
-        lines = content.split('\n')
-        if not lines or not lines[0].strip().startswith('{'):
-            return None, content
-        
-        # Find the closing }
-        brace_count = 0
-        end_index = -1
-        json_lines = []
-        
-        for i, line in enumerate(lines):
-            json_lines.append(line)
-            for char in line:
-                if char == '{':
-                    brace_count += 1
-                elif char == '}':
-                    brace_count -= 1
-                    if brace_count == 0:
-                        end_index = i
-                        break
-            if end_index != -1:
-                break
-        
-        if end_index == -1:
-            return None, content
-        
-        # Extract JSON content
-        json_content = '\n'.join(json_lines)
-        
         try:
-            metadata = json.loads(json_content)
+            return json.loads(header)
         except Exception as e:
             logger.error(f"Failed to parse JSON: {e}")
-            return None, content
-        
-        # Return remaining content
-        remaining_content = '\n'.join(lines[end_index + 1:])
-        return metadata, remaining_content
+            return None
     
-    def serialize_frontmatter(self, metadata: Dict, content: str) -> str:
-        """Serialize metadata and content into the specified format."""
+    def serialize_frontmatter(self, metadata: Dict, content: str, body_start: int = 0) -> str:
+        """Serialize metadata and content into the specified format.
+        The body is content from body_start on (e.g. the offset returned by
+        parse_frontmatter_span), so it is spliced in without being copied first."""
+        frontmatter = self.format_frontmatter(metadata)
+        # Ensure content doesn't start with extra newlines
+        content_start = _LINE_BREAKS.match(content, body_start).end()
+        if self.format_type == "json":
+            return frontmatter + "\n" + content[content_start:]
+        if body_start < len(content):
+            return frontmatter + '\n' + content[content_start:]
+        return frontmatter
+    
+    def format_frontmatter(self, metadata: Dict) -> str:
+        """Return the front matter block of the metadata, ending with a line break."""
         if self.format_type == "yaml":
-            return self._serialize_yaml(metadata, content)
+            return self._serialize_yaml(metadata)
         elif self.format_type == "toml":
-            return self._serialize_toml(metadata, content)
-        elif self.format_type == "json":
-            return self._serialize_json(metadata, content)
-        
-        return content
+            return self._serialize_toml(metadata)
+        return self._serialize_json(metadata)
     
-    def _serialize_yaml(self, metadata: Dict, content: str) -> str:
+    def _serialize_yaml(self, metadata: Dict) -> str:
         """Serialize to YAML format."""
         yaml_lines = ["---"]
         
@@ -219,19 +216,10 @@ class FrontMatterParser:
                     yaml_lines.append(f"{key}: {value}")
         
         yaml_lines.append("---")
-        yaml_lines.append("")  # Empty line after front matter
-        
-        # Join frontmatter lines and ensure blank line before content
-        frontmatter = '\n'.join(yaml_lines)
-        
-        # Ensure content doesn't start with extra newlines
-        if content:
-            content = content.lstrip('\n')
-            return frontmatter + '\n' + content
-        else:
-            return frontmatter
+        yaml_lines.append("")  # Line break after front matter
+        return '\n'.join(yaml_lines)
     
-    def _serialize_toml(self, metadata: Dict, content: str) -> str:
+    def _serialize_toml(self, metadata: Dict) -> str:
         """Serialize to TOML format."""
         toml_lines = ["+++"]
         
@@ -268,19 +256,10 @@ class FrontMatterParser:
                     toml_lines.append(f"{key} = {json.dumps(value)}")
         
         toml_lines.append("+++")
-        toml_lines.append("")  # Empty line after front matter
-        
-        # Join frontmatter lines and ensure blank line before content
-        frontmatter = '\n'.join(toml_lines)
-        
-        # Ensure content doesn't start with extra newlines
-        if content:
-            content = content.lstrip('\n')
-            return frontmatter + '\n' + content
-        else:
-            return frontmatter
+        toml_lines.append("")  # Line break after front matter
+        return '\n'.join(toml_lines)
     
-    def _serialize_json(self, metadata: Dict, content: str) -> str:
+    def _serialize_json(self, metadata: Dict) -> str:
         """Serialize to JSON format."""
         # Define the order of fields
         field_order = ["uid", "title", "aliases", "date", "update", "tags", "draft"]
@@ -316,12 +295,7 @@ class FrontMatterParser:
             else:
                 converted_metadata[key] = value
         
-        json_str = json.dumps(converted_metadata, indent=2, ensure_ascii=False)
-        # Ensure content doesn't start with extra newlines
-        if content and not content.startswith('\n'):
-            return json_str + "\n\n" + content
-        else:
-            return json_str + "\n\n" + content.lstrip('\n')
+        return json.dumps(converted_metadata, indent=2, ensure_ascii=False) + "\n"
 
 
 def get_frontmatter_delimiters(format_type: str) -> Tuple[str, str]:
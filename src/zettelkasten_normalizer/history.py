@@ -0,0 +1,198 @@
+"""
+Run history for Zettelkasten note normalization.
+
+Every normalization run appends one JSON line to a history file in the
+root folder with the version, the size of the vault, the wall time of each
+stage, the bytes read and written and the number of changed files. The
+history subcommand shows the trend of the recent runs.
+
+A stage is flagged as a regression if it took notably longer than its
+baseline: the median over the latest earlier runs of the same mode on a
+vault of about the same size. Runs with another mode or number of workers,
+or on a much smaller or larger vault are not compared, so vault growth
+alone is not flagged.
+"""
+
+import os
+import json
+import datetime
+import statistics
+import logging
+from . import __version__
+from .config import (
+    HISTORY_FILE,
+    HISTORY_MAX_RUNS,
+    HISTORY_BASELINE_RUNS,
+    HISTORY_MIN_BASELINE_RUNS,
+    HISTORY_SIZE_TOLERANCE,
+    HISTORY_SLOWDOWN_FACTOR,
+    HISTORY_MIN_SLOWDOWN_SECONDS,
+)
+
+# Get logger
+logger = logging.getLogger(__name__)
+
+# Name under which the wall time of the whole run is compared
+TOTAL_STAGE = "total"
+
+
+def get_history_path(root_path):
+    """Path of the history file of a root folder"""
+    return os.path.join(root_path, HISTORY_FILE)
+
+
+def build_run_record(run_stats, mode, jobs=1, targets=False):
+    """Return the history record of a finished RunStats.
+    mode is "pipeline", "incremental" or "staged"; targets is set when only
+    some files were normalized."""
+    totals = run_stats.totals()
+    started = datetime.datetime.now() - datetime.timedelta(seconds=run_stats.wall_seconds)
+    record = {
+        "version": __version__,
+        "started": started.replace(microsecond=0).isoformat(),
+        "mode": mode,
+        "jobs": jobs,
+        "vault_files": totals["files_scanned"],
+        "wall_seconds": round(run_stats.wall_seconds, 3),
+        "stages": {name: round(stage_stats.wall_seconds, 3) for name, stage_stats in run_stats.stages.items()},
+        "bytes_read": totals["bytes_read"],
+        "bytes_written": totals["bytes_written"],
+        "files_written": totals["files_written"],
+        "files_renamed": totals["files_renamed"],
+        "links_rewritten": totals["links_rewritten"],
+    }
+    if targets:
+        record["targets"] = True
+    return record
+
+
+def load_history(root_path):
+    """Return the recorded runs, oldest first. Unreadable lines are skipped."""
+    runs = []
+    try:
+        with open(get_history_path(root_path), "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    run = json.loads(line)
+                except ValueError:
+                    logger.debug("Skipped an unreadable line of the run history")
+                    continue
+                if isinstance(run, dict) and isinstance(run.get("stages"), dict):
+                    runs.append(run)
+    except FileNotFoundError:
+        pass
+    return runs
+
+
+def append_run(root_path, record):
+    """Append a run to the history, dropping the oldest runs beyond HISTORY_MAX_RUNS.
+    Returns whether the run was recorded."""
+    path = get_history_path(root_path)
+    try:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        runs = load_history(root_path)
+        if len(runs) > HISTORY_MAX_RUNS:
+            temp_path = path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                for run in runs[-HISTORY_MAX_RUNS:]:
+                    f.write(json.dumps(run, ensure_ascii=False) + "\n")
+            os.replace(temp_path, path)
+    except OSError as e:
+        logger.error(f"Failed to record the run in {path}: {e}")
+        return False
+    return True
+
+
+def is_comparable(run, other):
+    """Whether two runs did the same kind of work with as many workers on vaults of about the same size"""
+    for key in ("mode", "jobs", "targets"):
+        if run.get(key) != other.get(key):
+            return False
+    size, other_size = run.get("vault_files", 0), other.get("vault_files", 0)
+    return abs(size - other_size) <= HISTORY_SIZE_TOLERANCE * max(size, other_size)
+
+
+def stage_seconds(run):
+    """Wall time of every stage of a run, and of the whole run"""
+    seconds = dict(run["stages"])
+    seconds[TOTAL_STAGE] = run.get("wall_seconds", 0.0)
+    return seconds
+
+
+def baseline(runs, run):
+    """Return the median wall time of every stage over the latest comparable
+    runs before run, for the stages recorded in at least
+    HISTORY_MIN_BASELINE_RUNS of them, with the number of runs used"""
+    earlier = [other for other in runs if is_comparable(run, other)]
+    earlier = earlier[-HISTORY_BASELINE_RUNS:]
+    medians = {}
+    for name in stage_seconds(run):
+        values = [stage_seconds(other)[name] for other in earlier if name in stage_seconds(other)]
+        if len(values) >= HISTORY_MIN_BASELINE_RUNS:
+            medians[name] = statistics.median(values)
+    return medians, len(earlier)
+
+
+def find_regressions(runs, run):
+    """Return (stage, seconds, baseline seconds) for the stages of run that
+    took notably longer than their baseline. runs are the runs before it."""
+    medians, _ = baseline(runs, run)
+    regressions = []
+    for name, seconds in stage_seconds(run).items():
+        expected = medians.get(name)
+        if expected is None:
+            continue
+        if seconds >= expected * HISTORY_SLOWDOWN_FACTOR and seconds - expected >= HISTORY_MIN_SLOWDOWN_SECONDS:
+            regressions.append((name, seconds, expected))
+    return regressions
+
+
+def format_regression(regression):
+    """One line describing a regression"""
+    name, seconds, expected = regression
+    ratio = seconds / expected if expected else float("inf")
+    return f"{name} took {seconds:.2f}s, {ratio:.1f}x its baseline of {expected:.2f}s"
+
+
+def report_lines(runs, last=20):
+    """Human-readable trend of the last runs, with the regressions of each"""
+    lines = ["====== Run History ======"]
+    header = f"{'started':21s}{'version':>9s}{'mode':>13s}{'files':>9s}{'wall':>10s}{'KB read':>11s}{'KB writ.':>11s}{'written':>9s}{'renamed':>9s}"
+    lines.append(header)
+    start = max(0, len(runs) - last)
+    flagged = []
+    for position in range(start, len(runs)):
+        run = runs[position]
+        mode = run.get("mode", "?") + ("*" if run.get("targets") else "")
+        regressions = find_regressions(runs[:position], run)
+        lines.append(
+            f"{str(run.get('started', '?')):21s}{str(run.get('version', '?')):>9s}{mode:>13s}"
+            f"{run.get('vault_files', 0):9d}{run.get('wall_seconds', 0.0):9.2f}s"
+            f"{run.get('bytes_read', 0) / 1024:11.1f}{run.get('bytes_written', 0) / 1024:11.1f}"
+            f"{run.get('files_written', 0):9d}{run.get('files_renamed', 0):9d}"
+            + ("  SLOWER" if regressions else "")
+        )
+        if regressions:
+            flagged.append((run, regressions))
+    if any(run.get("targets") for run in runs[start:]):
+        lines.append("* only some files were normalized")
+
+    latest = runs[-1]
+    medians, run_cnt = baseline(runs[:-1], latest)
+    lines.append(f"Latest run against the median of {run_cnt} earlier comparable runs:")
+    for name, seconds in stage_seconds(latest).items():
+        if name in medians:
+            expected = medians[name]
+            change = f"{(seconds - expected) / expected * 100:+.0f}%" if expected else "n/a"
+            lines.append(f"  {name:28s}{seconds:9.2f}s{expected:10.2f}s{change:>8s}")
+        else:
+            lines.append(f"  {name:28s}{seconds:9.2f}s{'no baseline':>18s}")
+    if flagged:
+        lines.append("Regressions:")
+        for run, regressions in flagged:
+            for regression in regressions:
+                lines.append(f"  {run.get('started', '?')}: {format_regression(regression)}")
+    return lines
@@ -0,0 +1,136 @@
+"""
+Write-ahead rename journal for Zettelkasten note normalization.
+
+Before files are renamed, every planned operation (renames, UID insertions,
+note writes and backlink rewrites) is appended to a journal in the root
+folder, and each operation is marked complete once it has been executed.
+If a run is interrupted, --resume executes the remaining operations without
+redoing the finished ones. The journal is removed when the run completes.
+
+The journal is a JSON-lines file: a header, then the planned operations in
+lines of at most JOURNAL_BATCH_OPERATIONS operations, each plan closed by a
+marker (so a plan is either recorded completely or not at all), and
+completion markers. A torn last line left by a crash is ignored. Note
+contents are not stored in the journal: write operations refer to a staged
+copy of the new content next to the note, by its path and hash.
+"""
+
+import os
+import json
+import itertools
+import logging
+from .config import JOURNAL_FILE, JOURNAL_BATCH_OPERATIONS
+from .utils import is_fsync_enabled
+
+# Get logger
+logger = logging.getLogger(__name__)
+
+JOURNAL_VERSION = 1
+
+
+class RenameJournal:
+    """Journal of the operations of one rename run, stored in the root folder."""
+
+    def __init__(self, root_path):
+        """Initialize an empty journal for the root folder."""
+        self.root_path = root_path
+        self.path = os.path.join(root_path, JOURNAL_FILE)
+        self.header = {}
+        self.operations = []
+        self.plan_count = 0
+        self.unplanned = []  # Operations of a plan a crash stopped recording
+        self.done = set()
+        self._file = None
+
+    @staticmethod
+    def exists(root_path):
+        """Whether an interrupted run left a journal in the root folder"""
+        return os.path.exists(os.path.join(root_path, JOURNAL_FILE))
+
+    @classmethod
+    def load(cls, root_path):
+        """Load the journal of an interrupted run, or return None"""
+        journal = cls(root_path)
+        if not os.path.exists(journal.path):
+            return None
+        with open(journal.path, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    if next(f, None) is None:
+                        # Torn write at the end of the journal
+                        logger.debug("Ignoring incomplete last line of the journal")
+                        break
+                    raise ValueError(f"journal is corrupted at line {line_no}")
+                if "version" in record:
+                    if record["version"] != JOURNAL_VERSION:
+                        raise ValueError(f"unsupported journal version: {record['version']}")
+                    journal.header = record
+                elif "operations" in record:
+                    journal.unplanned.extend(record["operations"])
+                elif "planned" in record:
+                    journal._close_plan()
+                elif "done" in record:
+                    journal.done.add(record["done"])
+        return journal
+
+    def _close_plan(self):
+        """Accept the operations recorded since the last plan"""
+        self.operations.extend(self.unplanned)
+        self.unplanned = []
+        self.plan_count += 1
+
+    def _append(self, record):
+        """Append one record and make sure it reached the file"""
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._file.flush()
+        if is_fsync_enabled():
+            os.fsync(self._file.fileno())
+
+    def begin(self, header, operations):
+        """Start a new journal with its first plan of operations"""
+        if os.path.exists(self.path):
+            raise FileExistsError(f"an interrupted run has to be resumed first: {self.path}")
+        self.header = dict(header, version=JOURNAL_VERSION)
+        self._append(self.header)
+        self.add(operations)
+
+    def add(self, operations):
+        """Record a plan of operations, JOURNAL_BATCH_OPERATIONS per line"""
+        operations = iter(operations)
+        while True:
+            batch = list(itertools.islice(operations, JOURNAL_BATCH_OPERATIONS))
+            if not batch:
+                break
+            self._append({"operations": batch})
+            self.unplanned.extend(batch)
+        self._append({"planned": len(self.operations) + len(self.unplanned)})
+        self._close_plan()
+
+    def complete(self, index):
+        """Mark an operation as executed"""
+        self._append({"done": index})
+        self.done.add(index)
+
+    def pending(self):
+        """Operations that have not been executed yet, with their index"""
+        return [(index, operation) for index, operation in enumerate(self.operations) if index not in self.done]
+
+    def close(self):
+        """Close the journal file, keeping it for --resume"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def finish(self):
+        """Remove the journal once every operation has been executed"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,96 @@
+"""
+Multi-name link matcher for Zettelkasten note normalization.
+
+All Wikilinks and Markdown links of a note are found in a single linear pass
+with one compiled pattern, and their targets are resolved against the old
+names of a whole rename batch with a hash lookup.
+"""
+
+import re
+import unicodedata
+from .utils import get_file_name
+
+# One pattern for both link styles. The character classes never overlap the
+# delimiters, so a scan is linear in the length of the content.
+#   [[name]] / [[name.ext]] / [[name | alias]]
+#   [text](target)
+LINK_PATTERN = re.compile(
+    r"\[\[([^\[\]|]*?)(?:\s*\|\s*([^\[\]]*?))?\]\]"
+    r"|\[([^\[\]]*)\]\(([^()]*)\)"
+)
+
+
+def _normalize_name(name):
+    """Normalize a link name for lookups"""
+    return unicodedata.normalize("NFC", name.strip())
+
+
+def get_markdown_link_name(target):
+    """Return the file name a Markdown link target points to, or None for URLs"""
+    target = target.strip()
+    if not target or target.startswith("http"):
+        return None
+    return _normalize_name(target.split("/")[-1])
+
+
+def iter_link_names(content):
+    """Yield the name referenced by every Wikilink and Markdown link in the content"""
+    if "[" not in content:
+        return
+    for match in LINK_PATTERN.finditer(content):
+        if match.group(4) is None:
+            name = _normalize_name(match.group(1))
+        else:
+            name = get_markdown_link_name(match.group(4))
+        if name:
+            yield name
+
+
+class LinkMatcher:
+    """Rewrites the links to every file of a rename batch in one pass."""
+
+    def __init__(self, rename_map):
+        """Compile the old -> new names of the batch into lookup tables."""
+        self.wikilink_targets = {}  # "name" and "name.ext" -> new link
+        self.markdown_targets = {}  # "name.ext" -> new link
+        for old_file_path, new_file_path in rename_map.items():
+            old_file_names = get_file_name(old_file_path)
+            new_file_link = get_file_name(new_file_path)[0]
+            # The first file of the batch wins if two files share a name
+            self.wikilink_targets.setdefault(_normalize_name(old_file_names[0]), new_file_link)
+            self.wikilink_targets.setdefault(_normalize_name(old_file_names[1]), new_file_link)
+            self.markdown_targets.setdefault(_normalize_name(old_file_names[0]), new_file_link)
+
+    def __bool__(self):
+        return bool(self.wikilink_targets)
+
+    def names(self):
+        """All names that are matched by this matcher"""
+        return set(self.wikilink_targets) | set(self.markdown_targets)
+
+    def substitute(self, content):
+        """Rewrite all matching links in the content.
+        Returns the new content and the number of replaced links"""
+        if "[" not in content:
+            return content, 0
+        replaced_cnt = 0
+
+        def replace_link(match):
+            nonlocal replaced_cnt
+            if match.group(4) is None:
+                # Wikilink: use the alias as the link text if there is one
+                name = match.group(1).strip()
+                new_file_link = self.wikilink_targets.get(_normalize_name(name))
+                if new_file_link is None:
+                    return match.group(0)
+                link_text = match.group(2).strip() if match.group(2) else name
+            else:
+                name = get_markdown_link_name(match.group(4))
+                new_file_link = self.markdown_targets.get(name) if name else None
+                if new_file_link is None:
+                    return match.group(0)
+                link_text = match.group(3)
+            replaced_cnt += 1
+            return "[" + link_text + "](" + new_file_link + ")"
+
+        return LINK_PATTERN.sub(replace_link, content), replaced_cnt
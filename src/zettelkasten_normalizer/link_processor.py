@@ -6,157 +6,534 @@ import re
 import os
 import shutil
 import logging
-from .utils import get_file_name, read_file_cross_platform, write_file_cross_platform
-from .file_operations import get_files, check_note_has_uid, get_new_filepath_with_uid
+from .utils import (
+    get_file_name,
+    read_file_cross_platform,
+    write_file_cross_platform,
+    encode_search_terms,
+    file_contains_any,
+    schedule_directory_sync,
+    sync_directories,
+    to_root_relative,
+    from_root_relative,
+    path_exists,
+    invalidate_stat,
+    move_file_format,
+    normalize_line_endings,
+    write_file_atomic,
+)
+from .file_operations import get_files
+from .uid_allocator import UidAllocator
 from .frontmatter_parser import FrontMatterParser
+from .link_matcher import LinkMatcher, iter_link_names
+from .manifest import hash_content
+from .journal import RenameJournal
+from .streaming import stream_transform_file
+from .parallel import prefetch
+from .progress import Progress, track
+from . import stats
 
 # Get logger
 logger = logging.getLogger(__name__)
 
 
-def substitute_wikilinks_to_markdown_links(old_file_path, new_file_path, root_path):
-    """substitute wikilinks to markdown links"""
-    # build file info
-    old_file_names = get_file_name(old_file_path)
-    new_file_link = get_file_name(new_file_path)[0]
+# Pattern matches [[filename]] or [[filename|alias text]]
+WIKILINK_CONVERT_PATTERN = re.compile(r'\[\[([^\]\|]+)(\s*\|\s*([^\]]+))?\]\]')
+WIKILINK_NEEDLES = encode_search_terms(["[["])
+
+
+def extract_link_names(content):
+    """Collect the names referenced by Wikilinks and Markdown links in the content"""
+    return set(iter_link_names(content))
+
+
+def add_to_backlink_index(index, file, content):
+    """Register the link names referenced by a note in the reverse index"""
+    for name in extract_link_names(content):
+        index.setdefault(name, set()).add(file)
+
+
+def build_backlink_index(files):
+    """Build a reverse index of link name -> notes that reference it (single scan)"""
+    index = {}
+    for file in files:
+        add_to_backlink_index(index, file, read_file_cross_platform(file))
+    return index
+
+
+def get_link_names_of_file(file_path):
+    """Return the names under which a file can be linked"""
+    file_names = get_file_name(file_path)
+    return (file_names[0], file_names[1])
+
+
+def substitute_links_in_content(content, matcher, file_label=""):
+    """Rewrite the links to all renamed files in the content in a single pass.
+    Returns the new content and the number of replaced links"""
+    modified_content, substitute_link_cnt = matcher.substitute(content)
+    if substitute_link_cnt:
+        stats.record("links_rewritten", substitute_link_cnt)
+        logger.debug(str(substitute_link_cnt) + " links replaced in: " + file_label)
+    return modified_content, substitute_link_cnt
+
+
+def find_linking_files(rename_map, backlink_index):
+    """Collect the notes that link to any of the renamed files"""
+    linking_files = set()
+    for old_file_path in rename_map:
+        for name in get_link_names_of_file(old_file_path):
+            linking_files |= backlink_index.get(name, set())
+    return linking_files
+
+
+def find_files_linking_to(rename_map, root_path, scan=None):
+    """Find the notes that link to any of the renamed files with one scan of the vault.
+    Only the notes whose raw bytes contain a renamed name are decoded and indexed.
+    A VaultScan of the root folder is reused if given."""
+    update_link_files = scan.files("note") if scan is not None else get_files(root_path, "note")
+    needles = encode_search_terms(LinkMatcher(rename_map).names())
+    update_link_files = [file for file in update_link_files if file_contains_any(file, needles)]
+    logger.debug("indexing " + str(len(update_link_files)) + " files...")
+    backlink_index = build_backlink_index(update_link_files)
+    return sorted(find_linking_files(rename_map, backlink_index))
+
+
+def substitute_links_in_file(file, matcher, scan=None):
+    """Rewrite the links to the renamed files in one note.
+    Returns the number of replaced links and whether the note was written"""
+    content = read_file_cross_platform(file)
+    modified_content, link_cnt = substitute_links_in_content(content, matcher, file)
+    written = bool(link_cnt) and write_file_cross_platform(file, modified_content, original=content)
+    if written and scan is not None:
+        scan.invalidate(file)
+    return link_cnt, written
+
+
+def substitute_links_in_batch(rename_map, root_path, scan=None):
+    """Rewrite the backlinks of all renamed files at once.
+    The notes are scanned once to build a reverse index, then every affected
+    note is rewritten exactly once with all of its substitutions applied.
+    A VaultScan of the root folder is reused if given.
+    Returns the number of linked files that have been updated."""
+    if not rename_map:
+        return 0
     logger.debug("substitute Wikilinks...")
-    update_link_files = get_files(root_path, "note")
-    check_substitute_flg = False  # Whether it has been replaced or not
-    # check all notes links
-    logger.debug("checking " + str(len(update_link_files)) + " files...")
-    substitute_file_cnt = 0  # For counting the number of replaced files
-    substitute_line_cnt = 0
-    
-    for update_link_file in update_link_files:
-        substitute_flg = False  # For counting the number of replaced files
-        
-        # Use cross-platform file reading
-        content = read_file_cross_platform(update_link_file)
-        lines = content.split('\n')
-        
-        for i, line in enumerate(lines):
-                # Replace the target Wikilinks if any
-                match = re.search(
-                    "\[\[("
-                    + re.escape(old_file_names[1])
-                    + "("
-                    + re.escape(old_file_names[2])
-                    + ")?"
-                    + "(\s\|\s(.+))?)?\]\]",
-                    line,
-                )
-                if match:
-                    logger.debug("Wikilink match: " + update_link_file)
-                    logger.debug("substitute: " + match.group(0))
-                    if not check_substitute_flg:
-                        check_substitute_flg = True
-                    if not substitute_flg:
-                        substitute_flg = True
-                    substitute_line_cnt += 1
-                    # If Alias is set in the Link, use Alias as the Link Text
-                    if match.group(4):
-                        lines[i] = line.replace(
-                            match.group(0),
-                            "[" + match.group(4) + "](" + new_file_link + ")",
-                        )
-                    else:
-                        lines[i] = line.replace(
-                            match.group(0),
-                            "[" + match.group(1) + "](" + new_file_link + ")",
-                        )
-                    logger.debug(lines[i])
-                
-                # Replace the target Markdownlinks if any
-                match = re.search(
-                    "\[.+\]\(((?!http.*).*" + re.escape(old_file_names[0]) + ")\)", line
-                )
-                if match:
-                    logger.debug("Markdown link match: " + update_link_file)
-                    logger.debug("substitute: " + match.group(0))
-                    if not check_substitute_flg:
-                        check_substitute_flg = True
-                    if not substitute_flg:
-                        substitute_flg = True
-                    substitute_line_cnt += 1
-                    lines[i] = line.replace(match.group(1), new_file_link)
-                    logger.debug(lines[i])
-        
-        # Write back the modified content using cross-platform function
-        if substitute_flg:
-            modified_content = '\n'.join(lines)
-            write_file_cross_platform(update_link_file, modified_content)
+    linking_files = find_files_linking_to(rename_map, root_path, scan)
+    logger.debug("rewriting " + str(len(linking_files)) + " files...")
+    matcher = LinkMatcher(rename_map)
+    substitute_file_cnt = 0
+    substitute_link_cnt = 0
+    for update_link_file in linking_files:
+        link_cnt, written = substitute_links_in_file(update_link_file, matcher, scan)
+        if written:
             substitute_file_cnt += 1
-    
-    logger.debug(str(substitute_line_cnt) + " lines replaced!")
+        substitute_link_cnt += link_cnt
+
+    logger.debug(str(substitute_link_cnt) + " links replaced!")
     logger.debug(
         "The link that existed in file "
         + str(substitute_file_cnt)
         + " has been updated!"
     )
     logger.debug("done!")
-    return check_substitute_flg
+    return substitute_file_cnt
+
+
+def substitute_wikilinks_to_markdown_links(old_file_path, new_file_path, root_path):
+    """substitute wikilinks to markdown links"""
+    return substitute_links_in_batch({old_file_path: new_file_path}, root_path) > 0
+
+
+def plan_renames(files, root_path, allocator=None, contents=None, digests=None):
+    """Work out the old -> new file path mapping for all files without a UID.
+    UIDs come from the allocator, which never hands out the same UID twice;
+    without one, every UID is checked on disk. contents (path -> content) and
+    digests (path -> hash_file_content()) are used by the content hash strategy."""
+    if allocator is None:
+        allocator = UidAllocator(probe=True)
+    rename_map = {}
+    for file in files:
+        if allocator.is_uid(get_file_name(file)[1]):
+            logger.debug("It seems that this file already has a UID: " + file)
+            continue
+        content = contents.get(file) if contents is not None else None
+        digest = digests.get(file) if digests is not None else None
+        rename_map[file] = allocator.new_filepath(file, root_path, content, digest)
+    return rename_map
+
+
+def insert_uid_into_content(content, uid):
+    """Insert or update the UID in the Front Matter of the content"""
+    # Detect front matter format and parse it
+    parser = FrontMatterParser()
+    detected_format = parser.detect_format(content)
+
+    if detected_format:
+        # Parse existing front matter
+        metadata, body_start = parser.parse_frontmatter_span(content)
+        if metadata is not None:
+            # Update or add the uid property
+            metadata['uid'] = uid
+
+            # Use the detected format to serialize back onto the untouched body
+            parser_with_format = FrontMatterParser(detected_format)
+            return parser_with_format.serialize_frontmatter(metadata, content, body_start)
+        # Failed to parse, fallback to simple insertion
+        logger.warning("Failed to parse frontmatter, using fallback method")
+
+    # No front matter detected, use original logic
+    lines = content.split('\n')
+    lines.insert(1, "uid: " + uid)
+    return '\n'.join(lines)
+
+
+def get_staged_path(path, content_hash):
+    """Root-relative path of the staged content of a write operation.
+    The file is hidden and has no note extension, so it is never scanned."""
+    folder, name = path.rpartition("/")[::2]
+    staged = "." + name + "." + content_hash[:16] + ".staged"
+    return folder + "/" + staged if folder else staged
+
+
+def stage_write_operation(operation, content, root_path):
+    """Store the new content of a write operation next to its file, so the
+    journal only has to record its path and hash"""
+    content = normalize_line_endings(content)
+    content_hash = hash_content(content)
+    staged_path = get_staged_path(operation["path"], content_hash)
+    write_file_atomic(from_root_relative(staged_path, root_path), content.encode("utf-8"))
+    operation["staged"], operation["hash"] = staged_path, content_hash
+    return operation
+
+
+def _stage_write_task(item):
+    """Stage the new content of one journaled write.
+    If it cannot be staged, the content stays in the journal."""
+    operation, root_path = item
+    try:
+        stage_write_operation(operation, operation["content"], root_path)
+        del operation["content"]
+    except OSError as e:
+        logger.warning(f"Failed to stage {operation['path']}, its content is journaled instead: {e}")
+    return operation
+
+
+def stage_writes(operations, root_path):
+    """Stage the contents of the write operations before they are journaled"""
+    writes = [(operation, root_path) for operation in operations if operation["op"] == "write"]
+    for _ in track(prefetch(_stage_write_task, writes), "Staging notes", len(writes)):
+        pass
+
+
+def discard_staged_contents(operations, root_path):
+    """Remove the staged contents of write operations that will not be executed"""
+    for operation in operations:
+        if "staged" in operation:
+            try:
+                os.remove(from_root_relative(operation["staged"], root_path))
+            except FileNotFoundError:
+                pass
+
+
+def _write_staged(file_path, operation, root_path):
+    """Write the staged content of a write operation and remove the staged copy.
+    Returns whether the file was written"""
+    staged_path = from_root_relative(operation["staged"], root_path)
+    try:
+        with open(staged_path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        # The copy is removed once it has been written
+        if path_exists(file_path) and hash_content(read_file_cross_platform(file_path)) == operation["hash"]:
+            return False
+        raise FileNotFoundError("the staged content is missing: " + staged_path)
+    content = data.decode("utf-8")
+    if hash_content(content) != operation["hash"]:
+        raise ValueError("the staged content is damaged: " + staged_path)
+    written = write_file_cross_platform(
+        file_path, content, operation.get("encoding"), operation.get("newline"), original_hash=operation.get("sha256"),
+    )
+    os.remove(staged_path)
+    return written
 
 
-def rename_notes_with_links(files, root_path):
-    """Rename the all file names to UID and update wikilinks to Markdownlinks"""
+def apply_journal_operation(operation, root_path, matcher=None, scan=None):
+    """Execute one operation of a rename journal.
+    Every operation can be executed again after a crash without harm.
+    Returns whether a file was changed."""
+    kind = operation["op"]
+    if kind == "rename":
+        old_file_path = from_root_relative(operation["from"], root_path)
+        new_file_path = from_root_relative(operation["to"], root_path)
+        if path_exists(new_file_path):
+            if not path_exists(old_file_path):
+                logger.debug("already renamed: " + new_file_path)
+                return False
+            # Never replace a file; the rename stays pending until the conflict is resolved
+            raise FileExistsError("the destination already exists: " + new_file_path)
+        try:
+            if operation.get("type") == "image":
+                os.rename(old_file_path, new_file_path)
+            else:
+                shutil.move(old_file_path, new_file_path)
+        finally:
+            invalidate_stat(old_file_path)
+            invalidate_stat(new_file_path)
+        move_file_format(old_file_path, new_file_path)
+        schedule_directory_sync(old_file_path)
+        schedule_directory_sync(new_file_path)
+        if scan is not None:
+            scan.rename(old_file_path, new_file_path)
+        stats.record("files_renamed")
+        return True
+    file_path = from_root_relative(operation["path"], root_path)
+    if kind == "insert_uid":
+        # add or update UID in front matter
+        logger.debug("Insert or update UID in Front Matter")
+        content = read_file_cross_platform(file_path)
+        if operation["uid"] in content:
+            return False
+        return write_file_cross_platform(file_path, insert_uid_into_content(content, operation["uid"]), original=content)
+    if kind == "write":
+        if "staged" in operation:
+            return _write_staged(file_path, operation, root_path)
+        return write_file_cross_platform(
+            file_path, operation["content"], operation.get("encoding"), operation.get("newline"), original_hash=operation.get("sha256"),
+        )
+    if kind == "substitute":
+        return substitute_links_in_file(file_path, matcher, scan)[1]
+    if kind == "stream":
+        return stream_note(file_path, operation, root_path)
+    raise ValueError("unknown journal operation: " + kind)
+
+
+def stream_note(file_path, operation, root_path):
+    """Apply the transforms of a stream operation to a large note line by line.
+    Returns whether the note was written"""
+    line_transforms = []
+    if operation.get("convert_wikilinks"):
+        line_transforms.append(lambda line: convert_wikilinks_in_content(line, file_path))
+    if operation.get("renames"):
+        matcher = LinkMatcher({
+            from_root_relative(old, root_path): from_root_relative(new, root_path)
+            for old, new in operation["renames"].items()
+        })
+        line_transforms.append(lambda line: substitute_links_in_content(line, matcher, file_path))
+    return stream_transform_file(
+        file_path, operation.get("header"), operation.get("head_lines", 0), operation.get("body", "keep"),
+        line_transforms, operation.get("insert_line"),
+    )
+
+
+def get_operation_paths(operation):
+    """The files a journal operation touches"""
+    if operation["op"] == "rename":
+        return {operation["from"], operation["to"]}
+    return {operation["path"]}
+
+
+def split_journal_steps(pending):
+    """Split pending journal operations into steps whose operations can run concurrently.
+    Consecutive operations are grouped as long as none of them touch the same file."""
+    steps = []
+    paths = None  # Files touched by the last step
+    for index, operation in pending:
+        operation_paths = get_operation_paths(operation)
+        if paths is None or not paths.isdisjoint(operation_paths):
+            steps.append([])
+            paths = set()
+        steps[-1].append((index, operation))
+        paths |= operation_paths
+    return steps
+
+
+def run_journal(journal, root_path, scan=None):
+    """Execute the pending operations of a journal and mark each one complete.
+    Operations on different files are overlapped in I/O threads.
+    Failed operations are logged and stay pending for --resume, and so do the
+    operations on the destination of a rename that has not succeeded, so they
+    never create the renamed file next to the original.
+    Returns the number of changed files per kind of operation and the number of failures."""
+    matcher = None
+    if "rename_map" in journal.header:
+        matcher = LinkMatcher(journal.header["rename_map"])
+    changed_cnt = dict.fromkeys(["rename", "insert_uid", "write", "substitute", "stream"], 0)
+    failed_cnt = 0
+
+    def run_operation(task):
+        index, operation = task
+        try:
+            return apply_journal_operation(operation, root_path, matcher, scan), None
+        except Exception as e:
+            return False, e
+
+    pending = journal.pending()
+    # Destinations of the renames that have not been executed yet
+    unrenamed = {operation["to"] for index, operation in pending if operation["op"] == "rename"}
+    progress = Progress("Applying changes", len(pending), unit="operations")
+    for step in split_journal_steps(pending):
+        runnable = []
+        for index, operation in step:
+            if operation["op"] != "rename" and operation["path"] in unrenamed:
+                logger.warning(f"Skipped {operation['op']} of {operation['path']}: the file has not been renamed yet")
+                failed_cnt += 1
+                progress.update()
+            else:
+                runnable.append((index, operation))
+        for (index, operation), (changed, error) in zip(runnable, prefetch(run_operation, runnable)):
+            progress.update()
+            if error is not None:
+                logger.error(f"Error executing {operation['op']} of {operation.get('path', operation.get('from'))}: {error}")
+                failed_cnt += 1
+                continue
+            if operation["op"] == "rename":
+                unrenamed.discard(operation["to"])
+            if changed:
+                changed_cnt[operation["op"]] += 1
+                if operation["op"] == "rename":
+                    # Logged here, so the log follows the journal order
+                    logger.debug("rename done: " + from_root_relative(operation["to"], root_path))
+            journal.complete(index)
+    progress.finish()
+    return changed_cnt, failed_cnt
+
+
+def finish_journal(journal, failed_cnt):
+    """Remove the journal if every operation succeeded, keep it for --resume otherwise"""
+    sync_directories()
+    if failed_cnt:
+        journal.close()
+        logger.warning(str(failed_cnt) + " operations failed. Fix the cause and run again with --resume")
+    else:
+        journal.finish()
+
+
+def journal_backlinks(journal, root_path, scan=None):
+    """Plan the backlink rewrites of a rename journal and execute them.
+    Returns the number of changed files and the number of failures"""
+    rename_map = {
+        from_root_relative(old, root_path): from_root_relative(new, root_path)
+        for old, new in journal.header["rename_map"].items()
+    }
+    linking_files = find_files_linking_to(rename_map, root_path, scan)
+    logger.debug("rewriting " + str(len(linking_files)) + " files...")
+    journal.add({"op": "substitute", "path": to_root_relative(file, root_path)} for file in linking_files)
+    changed_cnt, failed_cnt = run_journal(journal, root_path, scan)
+    return changed_cnt["substitute"], failed_cnt
+
+
+def rename_with_journal(stage, rename_map, root_path, scan=None, insert_uid=False):
+    """Rename the files of a stage and rewrite their backlinks, recording every
+    step in a journal so an interrupted run can be resumed.
+    Returns the number of renamed files and of updated linked files"""
+    operations = []
+    for file, new_file_path in rename_map.items():
+        logger.debug("target: " + file)
+        uid = get_file_name(new_file_path)[1]
+        logger.debug("uid: " + uid)
+        logger.debug("rename: " + new_file_path)
+        operations.append({
+            "op": "rename",
+            "type": "note" if insert_uid else "image",
+            "from": to_root_relative(file, root_path),
+            "to": to_root_relative(new_file_path, root_path),
+        })
+        if insert_uid:
+            operations.append({"op": "insert_uid", "path": to_root_relative(new_file_path, root_path), "uid": uid})
+    relative_map = {operation["from"]: operation["to"] for operation in operations if operation["op"] == "rename"}
+    journal = RenameJournal(root_path)
+    journal.begin({"stage": stage, "rename_map": relative_map}, operations)
+    changed_cnt, failed_cnt = run_journal(journal, root_path, scan)
+
+    # Replace backlinks of all renamed files at once
+    substitute_file_cnt, substitute_failed_cnt = journal_backlinks(journal, root_path, scan)
+    finish_journal(journal, failed_cnt + substitute_failed_cnt)
+    return changed_cnt["rename"], substitute_file_cnt
+
+
+def resume_journal(root_path, scan=None):
+    """Execute the remaining operations of an interrupted run.
+    Returns False if there is no journal to resume"""
+    journal = RenameJournal.load(root_path)
+    if journal is None:
+        logger.info("No interrupted run was found")
+        return False
+    if journal.unplanned:
+        # Nothing of an incomplete plan has been executed
+        logger.warning(str(len(journal.unplanned)) + " operations whose plan was not recorded completely are dropped")
+        discard_staged_contents(journal.unplanned, root_path)
+    pending = journal.pending()
+    logger.info("====== Resume Interrupted Run ======")
+    logger.info("stage: " + str(journal.header.get("stage")) + ", "
+                + str(len(pending)) + " of " + str(len(journal.operations)) + " operations remaining")
+    changed_cnt, failed_cnt = run_journal(journal, root_path, scan)
+    if "rename_map" in journal.header and journal.plan_count == 1:
+        # The run stopped before the backlinks were planned
+        substitute_file_cnt, substitute_failed_cnt = journal_backlinks(journal, root_path, scan)
+        changed_cnt["substitute"] += substitute_file_cnt
+        failed_cnt += substitute_failed_cnt
+    finish_journal(journal, failed_cnt)
+    logger.info(str(changed_cnt["rename"]) + " files have been renamed!")
+    logger.info(str(changed_cnt["write"] + changed_cnt["insert_uid"] + changed_cnt["stream"]) + " files have been written!")
+    logger.info(str(changed_cnt["substitute"]) + " linked files have been updated!")
+    return True
+
+
+def rename_notes_with_links(files, root_path, scan=None, digests=None):
+    """Rename the all file names to UID and update wikilinks to Markdownlinks.
+    A VaultScan of the root folder is reused and updated if given. digests are
+    the hashes of the notes before the earlier stages rewrote them, for the
+    content UID strategy."""
     logger.info("====== Start Rename Notes And Substitute Wikilinks ======")
     logger.info("the target is: " + str(len(files)) + " files")
-    rename_file_cnt = 0  # Counting the number of files processed
-    substitute_file_cnt = 0  # Number of files with links
+
+    # Work out every old -> new mapping before touching the disk
+    rename_map = plan_renames(files, root_path, UidAllocator.from_scan(scan) if scan is not None else None, digests=digests)
+    rename_file_cnt, substitute_file_cnt = 0, 0
+    if rename_map:
+        rename_file_cnt, substitute_file_cnt = rename_with_journal(
+            "rename_notes", rename_map, root_path, scan, insert_uid=True)
+
+    logger.info(str(rename_file_cnt) + " files have been renamed!")
+    logger.info(str(substitute_file_cnt) + " linked files have been updated!")
+
+
+def convert_wikilinks_in_content(content, file_label=""):
+    """Convert all WikiLinks in the content to Markdown links.
+    Returns the new content and the number of converted links"""
+    if "[[" not in content:
+        return content, 0
+    lines = content.split('\n')
+    links_in_file = 0
     
-    for i, file in enumerate(files):
-        logger.debug("target: " + file)
-        if check_note_has_uid(file):
-            logger.debug("It seems that this file already has a UID")
-            continue
+    def replace_wikilink(match):
+        nonlocal links_in_file
+        links_in_file += 1
+        
+        target = match.group(1).strip()
+        alias = match.group(3).strip() if match.group(3) else None
+        
+        # Remove .md extension if present in the target
+        if target.endswith('.md'):
+            target_without_ext = target[:-3]
         else:
-            new_file_path = get_new_filepath_with_uid(file, root_path)
-            uid = get_file_name(new_file_path)[1]
-            logger.debug("uid: " + uid)
-            logger.debug("rename: " + new_file_path)
-            # rename and move ROOT PATH
-            new_file_path_result = shutil.move(file, new_file_path)
-            logger.info("rename done: " + new_file_path_result)
-            rename_file_cnt += 1
-            # add or update UID in front matter
-            logger.debug("Insert or update UID in Front Matter")
-            content = read_file_cross_platform(new_file_path_result)
-            
-            # Detect front matter format and parse it
-            parser = FrontMatterParser()
-            detected_format = parser.detect_format(content)
-            
-            if detected_format:
-                # Parse existing front matter
-                metadata, body_content = parser.parse_frontmatter(content)
-                if metadata is not None:
-                    # Update or add the uid property
-                    metadata['uid'] = uid
-                    
-                    # Use the detected format to serialize back
-                    parser_with_format = FrontMatterParser(detected_format)
-                    modified_content = parser_with_format.serialize_frontmatter(metadata, body_content)
-                    write_file_cross_platform(new_file_path_result, modified_content)
-                else:
-                    # Failed to parse, fallback to simple insertion
-                    logger.warning(f"Failed to parse frontmatter for {new_file_path_result}, using fallback method")
-                    lines = content.split('\n')
-                    lines.insert(1, "uid: " + uid)
-                    modified_content = '\n'.join(lines)
-                    write_file_cross_platform(new_file_path_result, modified_content)
-            else:
-                # No front matter detected, use original logic
-                lines = content.split('\n')
-                lines.insert(1, "uid: " + uid)
-                modified_content = '\n'.join(lines)
-                write_file_cross_platform(new_file_path_result, modified_content)
-            # Replace backlinks
-            if substitute_wikilinks_to_markdown_links(file, new_file_path_result, root_path):
-                substitute_file_cnt += 1
-        logger.debug("processing done! [" + str(i + 1) + "/" + str(len(files)) + "]")
+            target_without_ext = target
+        
+        # Create the markdown link
+        link_text = alias if alias else target_without_ext
+        link_target = target_without_ext + '.md'
+        
+        return f'[{link_text}]({link_target})'
     
-    logger.info(str(rename_file_cnt) + " files have been renamed!")
-    logger.info(str(substitute_file_cnt) + " linked files have been updated!")
+    for i, line in enumerate(lines):
+        # Replace all WikiLinks in the line
+        new_line = WIKILINK_CONVERT_PATTERN.sub(replace_wikilink, line)
+        if new_line != line:
+            lines[i] = new_line
+            logger.debug(f"Converted in {file_label}: {line.strip()} -> {new_line.strip()}")
+    
+    stats.record("links_rewritten", links_in_file)
+    return '\n'.join(lines), links_in_file
 
 
 def convert_wikilinks_to_markdown(files, root_path):
@@ -166,80 +543,36 @@ def convert_wikilinks_to_markdown(files, root_path):
     total_files_modified = 0
     total_links_converted = 0
     
-    for file in files:
+    for file in track(files, "Converting WikiLinks"):
         logger.debug("Processing: " + file)
+        # Most notes have no WikiLinks and are never decoded
+        if not file_contains_any(file, WIKILINK_NEEDLES):
+            continue
         content = read_file_cross_platform(file)
-        lines = content.split('\n')
-        file_modified = False
-        links_in_file = 0
-        
-        for i, line in enumerate(lines):
-            # Convert WikiLinks [[target]] or [[target|alias]] to Markdown links
-            # Pattern matches [[filename]] or [[filename|alias text]]
-            pattern = r'\[\[([^\]\|]+)(\s*\|\s*([^\]]+))?\]\]'
-            
-            def replace_wikilink(match):
-                nonlocal file_modified, links_in_file
-                file_modified = True
-                links_in_file += 1
-                
-                target = match.group(1).strip()
-                alias = match.group(3).strip() if match.group(3) else None
-                
-                # Remove .md extension if present in the target
-                if target.endswith('.md'):
-                    target_without_ext = target[:-3]
-                else:
-                    target_without_ext = target
-                
-                # Create the markdown link
-                link_text = alias if alias else target_without_ext
-                link_target = target_without_ext + '.md'
-                
-                return f'[{link_text}]({link_target})'
-            
-            # Replace all WikiLinks in the line
-            new_line = re.sub(pattern, replace_wikilink, line)
-            if new_line != line:
-                lines[i] = new_line
-                logger.debug(f"Converted in {file}: {line.strip()} -> {new_line.strip()}")
+        modified_content, links_in_file = convert_wikilinks_in_content(content, file)
         
         # Write back the modified content
-        if file_modified:
-            modified_content = '\n'.join(lines)
-            write_file_cross_platform(file, modified_content)
+        if links_in_file:
+            write_file_cross_platform(file, modified_content, original=content)
             total_files_modified += 1
             total_links_converted += links_in_file
-            logger.info(f"Modified {file}: converted {links_in_file} WikiLinks")
+            logger.debug(f"Modified {file}: converted {links_in_file} WikiLinks")
     
     logger.info(f"Converted {total_links_converted} WikiLinks in {total_files_modified} files")
     logger.info("====== WikiLinks Conversion Complete ======")
 
 
-def rename_images_with_links(files, root_path):
-    """Rename image files to UID and update links"""
+def rename_images_with_links(files, root_path, scan=None):
+    """Rename image files to UID and update links.
+    A VaultScan of the root folder is reused and updated if given."""
     logger.info("====== Start Rename Images And Substitute Wikilinks ======")
     logger.info("the target is: " + str(len(files)) + " files")
-    rename_file_cnt = 0  # Counting the number of files processed
-    substitute_file_cnt = 0  # Number of files with links
-    
-    for i, file in enumerate(files):
-        logger.debug("target: " + file)
-        if check_note_has_uid(file):
-            logger.debug("It seems that this file already has a UID")
-            continue
-        else:
-            # rename image
-            new_file_path = get_new_filepath_with_uid(file, root_path)
-            uid = get_file_name(new_file_path)[1]
-            logger.debug("uid: " + uid)
-            os.rename(file, new_file_path)
-            rename_file_cnt += 1
-            logger.info("rename done: " + new_file_path)
-            # Replace backlinks
-            if substitute_wikilinks_to_markdown_links(file, new_file_path, root_path):
-                substitute_file_cnt += 1
-        logger.debug("processing done! [" + str(i + 1) + "/" + str(len(files)) + "]")
-    
+
+    # Work out every old -> new mapping before touching the disk
+    rename_map = plan_renames(files, root_path, UidAllocator.from_scan(scan) if scan is not None else None)
+    rename_file_cnt, substitute_file_cnt = 0, 0
+    if rename_map:
+        rename_file_cnt, substitute_file_cnt = rename_with_journal("rename_images", rename_map, root_path, scan)
+
     logger.info(str(rename_file_cnt) + " files have been renamed!")
-    logger.info(str(substitute_file_cnt) + " linked files have been updated!")
\ No newline at end of file
+    logger.info(str(substitute_file_cnt) + " linked files have been updated!")
@@ -0,0 +1,225 @@
+"""
+Persistent per-vault manifest for incremental normalization.
+
+The manifest records size, mtime, content hash and the extracted metadata of
+every note and image that has been normalized, so later runs only process
+the files that were added or changed since.
+"""
+
+import os
+import json
+import hashlib
+import logging
+from .config import MANIFEST_FILE
+from .utils import normalize_path, get_file_stat
+from .frontmatter_parser import FrontMatterParser
+from .link_matcher import iter_link_names
+
+# Get logger
+logger = logging.getLogger(__name__)
+
+MANIFEST_VERSION = 1
+
+
+def hash_content(content):
+    """Hash the content of a file (str or bytes)"""
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    return hashlib.sha256(content).hexdigest()
+
+
+def extract_note_metadata(content):
+    """Extract the metadata cached for a note: front matter format, uid, title, aliases, tags and links"""
+    parser = FrontMatterParser()
+    detected_format = parser.detect_format(content)
+    metadata = {}
+    if detected_format:
+        try:
+            metadata = parser.parse_frontmatter_span(content)[0] or {}
+        except Exception as e:
+            logger.debug(f"Failed to parse front matter for the manifest: {e}")
+    return {
+        "format": detected_format,
+        "uid": metadata.get("uid"),
+        "title": metadata.get("title"),
+        "aliases": metadata.get("aliases"),
+        "tags": metadata.get("tags"),
+        "links": sorted(set(iter_link_names(content))),
+    }
+
+
+class VaultManifest:
+    """Manifest of the normalized files of a vault, stored in the root folder."""
+
+    def __init__(self, root_path):
+        """Initialize an empty manifest for the root folder."""
+        self.root_path = normalize_path(root_path)
+        self.path = os.path.join(self.root_path, MANIFEST_FILE)
+        self.entries = {}
+        self.backlinks = None  # link name -> keys of the notes linking to it, built on demand
+        self.dirty = set()  # keys of notes changed on disk since recorded, whose links are unknown
+
+    @classmethod
+    def load(cls, root_path):
+        """Load the manifest of the root folder, or start an empty one"""
+        manifest = cls(root_path)
+        if not os.path.exists(manifest.path):
+            logger.info("No manifest found, all files will be processed")
+            return manifest
+        try:
+            with open(manifest.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                manifest.entries = data.get("files", {})
+            else:
+                logger.info("Manifest version has changed, all files will be processed")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Failed to load manifest {manifest.path}: {e}")
+        logger.info("Manifest loaded: " + str(len(manifest.entries)) + " files")
+        return manifest
+
+    def save(self):
+        """Write the manifest atomically"""
+        data = {"version": MANIFEST_VERSION, "files": self.entries}
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, sort_keys=True)
+        os.replace(temp_path, self.path)
+        logger.debug("Manifest saved: " + self.path)
+
+    def _key(self, path):
+        """Manifest entries are keyed by the path relative to the root"""
+        return os.path.relpath(normalize_path(path), self.root_path)
+
+    def get(self, path):
+        """Return the entry of a file, or None"""
+        return self.entries.get(self._key(path))
+
+    def is_unchanged(self, path, stat=None):
+        """Whether size and mtime of the file match its entry"""
+        entry = self.get(path)
+        if entry is None:
+            return False
+        try:
+            if stat is None:
+                stat = get_file_stat(path)
+        except OSError:
+            return False
+        return entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime
+
+    def _scanned_stat(self, path, scan):
+        """Return the stat result of a file from a VaultScan, or None"""
+        if scan is None:
+            return None
+        try:
+            return scan.stat(path)
+        except OSError:
+            return None
+
+    def filter_changed(self, files, scan=None):
+        """Return the files that were added or changed since the last run.
+        With a VaultScan, the stat results of the scan are used."""
+        return [file for file in files if not self.is_unchanged(file, self._scanned_stat(file, scan))]
+
+    def has_same_content(self, path, content):
+        """Whether the content hash matches the entry (e.g. the file was only touched)"""
+        return self.has_same_hash(path, hash_content(content))
+
+    def has_same_hash(self, path, content_hash):
+        """Whether the entry has this content hash"""
+        entry = self.get(path)
+        return entry is not None and entry["hash"] == content_hash
+
+    def cached_link_names(self, path, scan=None):
+        """Return the link names of an unchanged note, or None if they are unknown"""
+        if not self.is_unchanged(path, self._scanned_stat(path, scan)):
+            return None
+        return set(self.get(path)["metadata"].get("links", []))
+
+    def _index_links(self, key):
+        """Add the links of an entry to the backlink index"""
+        for name in self.entries[key]["metadata"].get("links", []):
+            self.backlinks.setdefault(name, set()).add(key)
+
+    def _unindex_links(self, key):
+        """Remove the links of an entry from the backlink index"""
+        entry = self.entries.get(key)
+        if entry is None or self.backlinks is None:
+            return
+        for name in entry["metadata"].get("links", []):
+            keys = self.backlinks.get(name)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.backlinks[name]
+
+    def mark_dirty(self, path):
+        """Note that a file changed on disk without being recorded again.
+        Its cached links can no longer be trusted, so it is returned by linking_files."""
+        self.dirty.add(self._key(path))
+
+    def linking_files(self, names):
+        """Return the paths of the recorded notes that link to any of the names,
+        and of the notes marked dirty, whose links have to be checked.
+        The backlink index is built on the first call and kept up to date."""
+        if self.backlinks is None:
+            self.backlinks = {}
+            for key in self.entries:
+                self._index_links(key)
+        keys = set(self.dirty)
+        for name in names:
+            keys.update(self.backlinks.get(name, ()))
+        return {os.path.join(self.root_path, key) for key in keys}
+
+    def record(self, path, content=None, file_type="note", summary=None):
+        """Record the current state of a file.
+        Notes need their content for hashing and metadata, or the NoteSummary
+        of a large note read line by line; images are read as bytes."""
+        stat = get_file_stat(path)
+        if summary is not None:
+            content_hash = summary.hash
+            metadata = summary.metadata()
+        elif content is None:
+            with open(path, "rb") as f:
+                content_hash = hash_content(f.read())
+            metadata = {}
+        else:
+            content_hash = hash_content(content)
+            metadata = extract_note_metadata(content) if file_type == "note" else {}
+        key = self._key(path)
+        self._unindex_links(key)
+        self.dirty.discard(key)
+        self.entries[key] = {
+            "type": file_type,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "hash": content_hash,
+            "metadata": metadata,
+        }
+        if self.backlinks is not None:
+            self._index_links(key)
+
+    def touch(self, path):
+        """Refresh size and mtime of an entry whose content has not changed"""
+        entry = self.get(path)
+        if entry is not None:
+            stat = get_file_stat(path)
+            entry["size"] = stat.st_size
+            entry["mtime"] = stat.st_mtime
+
+    def remove(self, path):
+        """Forget a file (e.g. after it has been renamed)"""
+        key = self._key(path)
+        self._unindex_links(key)
+        self.dirty.discard(key)
+        self.entries.pop(key, None)
+
+    def prune(self, existing_files, start_path):
+        """Forget files below start_path that no longer exist"""
+        existing = {self._key(file) for file in existing_files}
+        prefix = self._key(start_path)
+        for key in list(self.entries):
+            under_start = prefix == "." or key == prefix or key.startswith(prefix + os.sep)
+            if under_start and key not in existing:
+                self._unindex_links(key)
+                del self.entries[key]
@@ -14,16 +14,31 @@ Repository: https://github.com/jmatsuzaki/note-normalization-for-zettelkasten
 import sys
 import os
 import argparse
+import logging
+import subprocess
 
 # Import our modules
-from .config import EXECUTION_FUNCTION_LIST
-from .utils import setup_logger, query_yes_no
-from .file_operations import get_files
+from .config import EXECUTION_FUNCTION_LIST, IO_JOBS, UID_STRATEGY, LOG_LEVEL
+from .utils import setup_logger, LOG_LEVELS, query_yes_no, enable_fsync, keep_file_format, sync_directories, stat_cache
+from .file_operations import scan_vault, filter_targets
 from .yfm_processor import check_and_create_yfm
-from .link_processor import rename_notes_with_links, rename_images_with_links, convert_wikilinks_to_markdown
+from .link_processor import rename_notes_with_links, rename_images_with_links, convert_wikilinks_to_markdown, resume_journal
+from .pipeline import run_pipeline, plan_pipeline
+from .plan import build_change_plan, render_diff, save_plan, save_diff, load_plan, apply_plan
+from .parallel import get_default_jobs, set_io_jobs, set_log_level
+from .uid_allocator import UID_STRATEGIES, set_uid_strategy, content_digests
+from .manifest import VaultManifest
+from .vault_index import VaultIndex
+from .journal import RenameJournal
+from .config import JOURNAL_FILE, HISTORY_ENABLED
+from .history import build_run_record, load_history, append_run, find_regressions, format_regression, report_lines
+from .watcher import watch
+from .server import serve
+from . import client
+from . import stats
 
 
-def parse_arguments():
+def parse_arguments(argv=None):
     """Parse command line arguments"""
     parser = argparse.ArgumentParser(
         description="This program will normalize Markdown notes for Zettelkasten",
@@ -31,7 +46,18 @@ def parse_arguments():
         formatter_class=argparse.RawTextHelpFormatter,
     )
     parser.add_argument("root", help="Zettelkasten's root folder")
-    parser.add_argument("-t", "--target", help="normalization target folder or file")
+    parser.add_argument(
+        "-t", "--target", action="append",
+        help="normalization target folder or file (can be repeated to process several at once)"
+    )
+    parser.add_argument(
+        "--files-from", metavar="PATH",
+        help="Also normalize the files listed in PATH, one per line or NUL-separated (- for stdin)"
+    )
+    parser.add_argument(
+        "--changed-since", metavar="REV",
+        help="Also normalize the files changed since the git revision REV (resolved with git in the root folder)"
+    )
     parser.add_argument(
         "-y", "--yes", action="store_true", help="automatically answer yes to all questions"
     )
@@ -55,7 +81,133 @@ def parse_arguments():
         "--skip-wikilinks", action="store_true",
         help="Skip WikiLinks to Markdown links conversion"
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--uid-strategy", choices=UID_STRATEGIES, default=UID_STRATEGY,
+        help=f"How new UIDs are made: random uuid4, timestamp of the creation date or hash of the content (default: {UID_STRATEGY})"
+    )
+    parser.add_argument(
+        "--staged", action="store_true",
+        help="Run each stage separately over the files instead of the single-pass pipeline"
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=get_default_jobs(),
+        help="Number of worker processes for per-note work (default: CPU count)"
+    )
+    parser.add_argument(
+        "--io-jobs", type=int, default=IO_JOBS,
+        help=f"Number of threads overlapping file reads and stats (default: {IO_JOBS}, raise it for network shares)"
+    )
+    parser.add_argument(
+        "-i", "--incremental", action="store_true",
+        help="Only process files added or changed since the last run (uses a manifest in the root folder)"
+    )
+    parser.add_argument(
+        "--index", action="store_true",
+        help="Keep a SQLite index of notes, UIDs, titles, aliases, tags and links in the root folder\n"
+             "and find backlinks with it instead of scanning the vault"
+    )
+    parser.add_argument(
+        "--stats", action="store_true",
+        help="Print per-stage timing and throughput statistics at the end"
+    )
+    parser.add_argument(
+        "--stats-json", metavar="PATH",
+        help="Write per-stage timing and throughput statistics as JSON to PATH"
+    )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="Finish an interrupted run from the journal in the root folder and exit"
+    )
+    parser.add_argument(
+        "--fsync", action="store_true",
+        help="fsync every written file and, once per run, the folders that changed"
+    )
+    parser.add_argument(
+        "--utf8-lf", action="store_true",
+        help="Write every changed note as UTF-8 with LF line endings instead of keeping its encoding and line endings"
+    )
+    parser.add_argument(
+        "--no-history", action="store_true",
+        help="Do not record the run in the run history of the root folder"
+    )
+    parser.add_argument(
+        "-q", "--quiet", action="store_true",
+        help="Only show warnings and errors on the console (the log file is written as usual)"
+    )
+    parser.add_argument(
+        "--log-level", choices=LOG_LEVELS, default=LOG_LEVEL,
+        help=f"Level of the log file (default: {LOG_LEVEL}, DEBUG also logs every processed file)"
+    )
+    parser.add_argument(
+        "-w", "--watch", action="store_true",
+        help="Keep running and normalize notes as they are created or modified (uses the manifest)"
+    )
+    parser.add_argument(
+        "--poll", action="store_true",
+        help="With --watch or --serve, poll for changes instead of using inotify"
+    )
+    parser.add_argument(
+        "--serve", action="store_true",
+        help="Keep running and normalize the paths sent by the client command over a Unix socket\n"
+             "(client ROOT PATH...), with the vault index kept in memory"
+    )
+    parser.add_argument(
+        "--socket", metavar="PATH",
+        help="With --serve, the socket to listen on (default: in the root folder)"
+    )
+    parser.add_argument(
+        "--plan", metavar="PATH",
+        help="Dry run: write the planned changes as JSON to PATH without modifying any file\n"
+             "(apply it later with the apply command: apply PATH)"
+    )
+    parser.add_argument(
+        "--diff", metavar="PATH",
+        help="Dry run: write the planned changes as a unified diff to PATH (- for stdout)"
+    )
+    return parser.parse_args(argv)
+
+
+def parse_apply_arguments(argv):
+    """Parse the arguments of the apply command"""
+    parser = argparse.ArgumentParser(
+        prog=os.path.basename(sys.argv[0]) + " apply",
+        description="Apply a change plan written by --plan",
+    )
+    parser.add_argument("plan", help="plan file written by --plan")
+    parser.add_argument("--root", help="Zettelkasten's root folder (default: the root the plan was made for)")
+    parser.add_argument(
+        "-y", "--yes", action="store_true", help="automatically answer yes to all questions"
+    )
+    parser.add_argument(
+        "--force", action="store_true",
+        help="apply the plan even if files have changed since it was made"
+    )
+    parser.add_argument(
+        "-q", "--quiet", action="store_true",
+        help="Only show warnings and errors on the console"
+    )
+    parser.add_argument(
+        "--log-level", choices=LOG_LEVELS, default=LOG_LEVEL,
+        help=f"Level of the log file (default: {LOG_LEVEL})"
+    )
+    return parser.parse_args(argv)
+
+
+def parse_history_arguments(argv):
+    """Parse the arguments of the history command"""
+    parser = argparse.ArgumentParser(
+        prog=os.path.basename(sys.argv[0]) + " history",
+        description="Show the recorded runs and the stages that were slower than usual",
+    )
+    parser.add_argument("root", help="Zettelkasten's root folder")
+    parser.add_argument(
+        "-n", "--last", type=int, default=20, help="number of recent runs to show (default: 20)"
+    )
+    parser.add_argument(
+        "--check", action="store_true",
+        help="exit with status 1 if the latest run was slower than usual"
+    )
+    return parser.parse_args(argv)
 
 
 def validate_paths(args):
@@ -69,19 +221,66 @@ def validate_paths(args):
     
     root_path = args.root
     
-    # Validate target path
-    if args.target:
-        if not os.path.exists(args.target):
+    # Validate target paths
+    for target in args.target or []:
+        if not os.path.exists(target):
             print("The specified target folder or file does not seem to exist.")
             print("Abort the process")
             sys.exit(1)
-        target_path = args.target
+    if args.target and len(args.target) == 1:
+        target_path = args.target[0]
     else:
         target_path = args.root
     
     return root_path, target_path
 
 
+def read_file_list(path):
+    """Read a list of files, one per line or NUL-separated, from a file or stdin (-)"""
+    if path == "-":
+        data = sys.stdin.read()
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            data = f.read()
+    separator = "\0" if "\0" in data else "\n"
+    return [line.rstrip("\r") for line in data.split(separator) if line.strip()]
+
+
+def get_changed_files(root_path, rev):
+    """Files below the root folder that were added or changed since a git revision"""
+    command = ["git", "diff", "--name-only", "--relative", "--diff-filter=ACMR", "-z", rev, "--"]
+    try:
+        result = subprocess.run(command, cwd=root_path, capture_output=True, text=True, encoding="utf-8")
+    except OSError as e:
+        print(f"git cannot be run: {e}")
+        sys.exit(1)
+    if result.returncode != 0:
+        print(f"The files changed since {rev} cannot be listed: {result.stderr.strip()}")
+        sys.exit(1)
+    return [os.path.join(root_path, name) for name in result.stdout.split("\0") if name]
+
+
+def collect_targets(args, root_path):
+    """Collect the targets of a batch run from repeated -t, --files-from and --changed-since.
+    Returns None for a run on a single target folder or file."""
+    if not (args.files_from or args.changed_since or (args.target and len(args.target) > 1)):
+        return None
+    targets = list(args.target or [])
+    if args.files_from:
+        try:
+            targets.extend(read_file_list(args.files_from))
+        except OSError as e:
+            print(f"The file list cannot be read: {e}")
+            sys.exit(1)
+    if args.changed_since:
+        targets.extend(get_changed_files(root_path, args.changed_since))
+
+    batch, skipped = filter_targets(targets, root_path)
+    for target, reason in skipped:
+        print(f"Skipping {target}: {reason}")
+    return batch
+
+
 def confirm_execution(args, logger):
     """Confirm execution with user"""
     if args.yes:
@@ -150,35 +349,183 @@ def confirm_functions(args, logger):
     return True
 
 
-def execute_normalization(target_path, root_path, logger, execution_functions, format_type="yaml"):
-    """Execute the normalization process"""
-    # Execute Front Matter processing
-    if execution_functions["function_create_yfm"]:
-        check_and_create_yfm(get_files(target_path, "note"), format_type)
+def execute_normalization(target_path, root_path, logger, execution_functions, format_type="yaml", use_pipeline=True, jobs=1, incremental=False, targets=None, index=False):
+    """Execute the normalization process.
+    If targets is given, only those files and folders are processed, as one batch.
+    With index, the vault index in the root folder is kept up to date."""
+    if use_pipeline:
+        # Read each note once, run all stages in memory and write once
+        manifest = VaultManifest.load(root_path) if incremental else None
+        vault_index = VaultIndex.open(root_path) if index else None
+        try:
+            return run_pipeline(target_path, root_path, execution_functions, format_type, jobs, manifest, targets, vault_index)
+        finally:
+            if vault_index is not None:
+                vault_index.close()
+
+    if incremental:
+        logger.warning("--incremental is not supported with --staged, all files will be processed")
+    if index:
+        logger.warning("--index is not supported with --staged, the index is not updated")
+
+    # The scan also seeds the stat cache shared by all stages
+    with stat_cache():
+        # Scan the vault once; the scan is updated as files are renamed
+        with stats.stage("scan"):
+            scan = scan_vault(root_path)
+
+        def target_files(type):
+            if targets is not None:
+                return scan.select(targets, type)
+            return scan.files(type, target_path)
+
+        # Content UIDs hash the notes as they were before the stages below change them
+        digests = content_digests(target_files("note")) if execution_functions["function_rename_notes"] else None
+
+        # Execute Front Matter processing
+        if execution_functions["function_create_yfm"]:
+            with stats.stage("check_and_create_yfm"):
+                check_and_create_yfm(target_files("note"), format_type)
     
-    # Execute WikiLinks conversion
-    if execution_functions.get("function_convert_wikilinks", False):
-        convert_wikilinks_to_markdown(get_files(target_path, "note"), root_path)
+        # Execute WikiLinks conversion
+        if execution_functions.get("function_convert_wikilinks", False):
+            with stats.stage("convert_wikilinks_to_markdown"):
+                convert_wikilinks_to_markdown(target_files("note"), root_path)
     
-    # Execute note renaming
-    if execution_functions["function_rename_notes"]:
-        rename_notes_with_links(get_files(target_path, "note"), root_path)
+        # Execute note renaming
+        if execution_functions["function_rename_notes"]:
+            with stats.stage("rename_notes_with_links"):
+                rename_notes_with_links(target_files("note"), root_path, scan, digests)
     
-    # Execute image renaming
-    if execution_functions["function_rename_images"]:
-        rename_images_with_links(get_files(target_path, "image"), root_path)
+        # Execute image renaming
+        if execution_functions["function_rename_images"]:
+            with stats.stage("rename_images_with_links"):
+                rename_images_with_links(target_files("image"), root_path, scan)
+
+        sync_directories()
+
+
+def write_plan(target_path, root_path, logger, execution_functions, format_type="yaml", jobs=1, incremental=False, plan_path=None, diff_path=None, targets=None, index=False):
+    """Compute the changes without touching the vault and write them as a plan and/or diff.
+    With index, backlinks are found with the vault index, which is not updated."""
+    manifest = VaultManifest.load(root_path) if incremental else None
+    vault_index = VaultIndex.open(root_path) if index else None
+    try:
+        with stat_cache():
+            # The plan holds the full content of every note, so large notes are loaded too
+            result = plan_pipeline(target_path, root_path, execution_functions, format_type, jobs, manifest, targets, vault_index, stream=False)
+    finally:
+        if vault_index is not None:
+            vault_index.close()
+    if plan_path:
+        plan = build_change_plan(result, root_path, format_type)
+        save_plan(plan, plan_path)
+        summary = plan["summary"]
+        logger.info(str(summary["files_to_rename"]) + " files will be renamed")
+        logger.info(str(summary["files_to_write"]) + " files will be written")
+        logger.info("The plan was written to " + plan_path)
+    if diff_path:
+        save_diff(render_diff(result, root_path), diff_path)
+        if diff_path != "-":
+            logger.info("The diff was written to " + diff_path)
+    return result
+
+
+def record_run(root_path, run_stats, args, targets, logger):
+    """Append the run to the run history and warn about the stages that were notably slower than usual"""
+    if args.staged:
+        mode = "staged"
+    elif args.incremental:
+        mode = "incremental"
+    else:
+        mode = "pipeline"
+    record = build_run_record(run_stats, mode, max(1, args.jobs), targets is not None)
+    for regression in find_regressions(load_history(root_path), record):
+        logger.warning("Slower than usual: " + format_regression(regression))
+    append_run(root_path, record)
+
+
+def report_stats(run_stats, args, logger):
+    """Print the run statistics and write them as JSON if requested"""
+    run_stats.finish()
+    if args.stats:
+        for line in run_stats.report_lines():
+            logger.info(line)
+    if args.stats_json:
+        try:
+            run_stats.write_json(args.stats_json)
+            logger.info("Statistics were written to " + args.stats_json)
+        except OSError as e:
+            logger.error(f"Failed to write statistics to {args.stats_json}: {e}")
+
+
+def apply_main(argv):
+    """Apply a change plan written by --plan"""
+    args = parse_apply_arguments(argv)
+    try:
+        plan = load_plan(args.plan)
+    except (OSError, ValueError) as e:
+        print(f"The plan cannot be read: {e}")
+        sys.exit(1)
+    root_path = args.root or plan["root"]
+    if not os.path.isdir(root_path):
+        print("The root folder of the plan does not exist: " + root_path)
+        sys.exit(1)
+
+    logger = setup_logger(root_path, args.log_level, args.quiet)
+    logger.info("Zettelkasten ROOT PATH is: " + root_path)
+    if RenameJournal.exists(root_path):
+        logger.error("An interrupted run was found (" + JOURNAL_FILE + "). Run with --resume to finish it before applying a plan")
+        sys.exit(1)
+    summary = plan["summary"]
+    logger.info("Plan created at " + plan["created"] + ": "
+                + str(summary["files_to_rename"]) + " renames, "
+                + str(summary["files_to_write"]) + " writes")
+    if not confirm_execution(args, logger):
+        sys.exit(0)
+    if apply_plan(plan, root_path, force=args.force) is None:
+        sys.exit(1)
+    logger.info("All processing is complete!")
 
 
-def main():
+def history_main(argv):
+    """Show the run history of a root folder"""
+    args = parse_history_arguments(argv)
+    if not os.path.isdir(args.root):
+        print("The specified root folder does not exist: " + args.root)
+        sys.exit(1)
+    runs = load_history(args.root)
+    if not runs:
+        print("No runs have been recorded yet")
+        return
+    for line in report_lines(runs, max(1, args.last)):
+        print(line)
+    if args.check and find_regressions(runs[:-1], runs[-1]):
+        sys.exit(1)
+
+
+def main(argv=None):
     """Main execution function"""
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == "apply":
+        return apply_main(argv[1:])
+    if argv and argv[0] == "client":
+        return client.main(argv[1:])
+    if argv and argv[0] == "history":
+        return history_main(argv[1:])
+
     # Parse command line arguments
-    args = parse_arguments()
+    args = parse_arguments(argv)
     
     # Validate paths
     root_path, target_path = validate_paths(args)
+    targets = collect_targets(args, root_path)
     
     # Setup logger
-    logger = setup_logger(root_path)
+    logger = setup_logger(root_path, args.log_level, args.quiet)
+    # Worker processes only capture the records the handlers write
+    set_log_level(logging.getLogger().getEffectiveLevel())
     
     # Welcome message
     logger.info("=================================================")
@@ -190,13 +537,53 @@ def main():
     logger.debug("The existence of the folder has been confirmed!")
     logger.info("Set the specified folder as the root folder of Zettelkasten and process all files under it")
     logger.info("Zettelkasten ROOT PATH is: " + root_path)
-    logger.info("Normalize TARGET PATH is: " + target_path)
+    if targets is None:
+        logger.info("Normalize TARGET PATH is: " + target_path)
+    else:
+        logger.info("Normalize " + str(len(targets)) + " TARGET PATHS as one batch")
+        for target in targets:
+            logger.debug("target: " + target)
+    if not args.staged:
+        logger.info("Worker processes: " + str(max(1, args.jobs)))
+        logger.info("I/O threads: " + str(max(1, args.io_jobs)))
     
     # Get execution functions based on command line arguments
     execution_functions = get_execution_functions(args)
     
+    if args.fsync:
+        enable_fsync()
+    if args.utf8_lf:
+        keep_file_format(False)
+    set_io_jobs(args.io_jobs)
+    set_uid_strategy(args.uid_strategy)
+
+    if targets == []:
+        logger.info("There are no files to normalize")
+        return
+
+    # Finish an interrupted run before anything else
+    if args.resume:
+        if not confirm_execution(args, logger):
+            sys.exit(0)
+        resume_journal(root_path)
+        logger.info("All processing is complete!")
+        return
+
+    dry_run = bool(args.plan or args.diff)
+    if RenameJournal.exists(root_path):
+        if not dry_run:
+            logger.error("An interrupted run was found (" + JOURNAL_FILE + "). Run again with --resume to finish it")
+            sys.exit(1)
+        logger.warning("An interrupted run was found, the plan is based on the half-finished state")
+    if dry_run:
+        logger.info("Dry run: no file will be modified")
+        if args.staged:
+            logger.warning("--staged is not supported with --plan/--diff, the pipeline is used")
+    elif args.index and (args.watch or args.serve):
+        logger.warning("--index is not updated by --watch and --serve, which keep the manifest in memory instead")
+
     # Confirm execution
-    if not confirm_execution(args, logger):
+    if not dry_run and not confirm_execution(args, logger):
         sys.exit(0)
     
     # Show function status
@@ -204,11 +591,51 @@ def main():
     show_function_status(logger, execution_functions, args.format)
     
     # Confirm functions
-    if not confirm_functions(args, logger):
+    if not dry_run and not confirm_functions(args, logger):
         sys.exit(0)
     
+    # Collect statistics if requested, and for the run history
+    record_history = HISTORY_ENABLED and not args.no_history and not (dry_run or args.watch or args.serve)
+    run_stats = None
+    if args.stats or args.stats_json or record_history:
+        # The history only needs the stage timers and counters
+        run_stats = stats.RunStats(latencies=bool(args.stats or args.stats_json))
+        stats.activate(run_stats)
+    
     # Execute normalization
-    execute_normalization(target_path, root_path, logger, execution_functions, args.format)
+    try:
+        if args.serve and not dry_run:
+            try:
+                serve(root_path, execution_functions, args.format, jobs=max(1, args.jobs),
+                      socket_path=args.socket, polling=args.poll)
+            except KeyboardInterrupt:
+                logger.info("The server has been stopped")
+            except (RuntimeError, OSError) as e:
+                logger.error(f"The server cannot be started: {e}")
+                sys.exit(1)
+        elif args.watch and not dry_run:
+            try:
+                watch(root_path, execution_functions, args.format, jobs=max(1, args.jobs), polling=args.poll)
+            except KeyboardInterrupt:
+                logger.info("Watch mode has been stopped")
+        elif dry_run:
+            write_plan(
+                target_path, root_path, logger, execution_functions, args.format,
+                jobs=max(1, args.jobs), incremental=args.incremental,
+                plan_path=args.plan, diff_path=args.diff, targets=targets, index=args.index,
+            )
+        else:
+            execute_normalization(
+                target_path, root_path, logger, execution_functions, args.format,
+                use_pipeline=not args.staged, jobs=max(1, args.jobs),
+                incremental=args.incremental, targets=targets, index=args.index,
+            )
+    finally:
+        if run_stats is not None:
+            stats.deactivate()
+            report_stats(run_stats, args, logger)
+    if record_history:
+        record_run(root_path, run_stats, args, targets, logger)
     
     # Completion message
     logger.info("All processing is complete!")
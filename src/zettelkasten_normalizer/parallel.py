@@ -0,0 +1,173 @@
+"""
+Process pool helpers for Zettelkasten note normalization.
+
+Per-note work is spread across worker processes. Log records emitted in a
+worker are captured and handed back with the result, so the parent process
+can write them in a deterministic order. Workers never write the log file
+themselves, and records below the log level of the run are not captured.
+
+File I/O (reads and stats) is overlapped in a thread pool instead, so that
+on network shares the round trips of many files are waited for at once.
+"""
+
+import os
+import time
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from .config import PARALLEL_MIN_FILES, IO_JOBS, PREFETCH_DEPTH
+from .progress import Progress, track
+from . import stats
+
+# Get logger
+logger = logging.getLogger(__name__)
+
+# Log records captured in the current worker process
+_captured_records = []
+
+# Number of I/O threads of the current run
+_io_jobs = IO_JOBS
+
+# Lowest level of the records captured in worker processes
+_log_level = logging.DEBUG
+
+
+class _CapturingHandler(logging.Handler):
+    """Keep log records in memory so they can be sent back to the parent"""
+
+    def emit(self, record):
+        # Render the message now: arguments and tracebacks may not be picklable
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.msg += "\n" + logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        _captured_records.append(record)
+
+
+def get_default_jobs():
+    """Number of worker processes used by default"""
+    return os.cpu_count() or 1
+
+
+def set_io_jobs(io_jobs):
+    """Set the number of I/O threads used for the rest of the run"""
+    global _io_jobs
+    _io_jobs = max(1, io_jobs)
+
+
+def get_io_jobs():
+    """Number of I/O threads of the current run"""
+    return _io_jobs
+
+
+def set_log_level(level):
+    """Set the lowest level of the records worker processes capture for the rest of the run"""
+    global _log_level
+    _log_level = level
+
+
+def prefetch(func, items, io_jobs=None):
+    """Apply an I/O-bound func to every item in threads, yielding the results in order.
+    At most io_jobs * PREFETCH_DEPTH calls run ahead of the consumer, so the
+    first results can be processed while later files are still being read.
+    func has to handle its own errors."""
+    if io_jobs is None:
+        io_jobs = _io_jobs
+    if io_jobs <= 1:
+        for item in items:
+            yield func(item)
+        return
+    with ThreadPoolExecutor(max_workers=io_jobs) as executor:
+        window = deque()
+        for item in items:
+            window.append(executor.submit(func, item))
+            if len(window) >= io_jobs * PREFETCH_DEPTH:
+                yield window.popleft().result()
+        while window:
+            yield window.popleft().result()
+
+
+def _init_worker(level=logging.DEBUG):
+    """Route the logging of a worker process into the capturing handler.
+    Handlers inherited from the parent (e.g. the queue of the log file) are removed."""
+    root_logger = logging.getLogger()
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(_CapturingHandler())
+    root_logger.setLevel(level)
+
+
+def _call_captured(task):
+    """Run a task in a worker and return its result with the captured log records
+    and the statistics recorded while it ran"""
+    func, item, label, collect_stats = task
+    del _captured_records[:]
+    delta = None
+    if collect_stats:
+        with stats.collect_worker_task() as task_stats:
+            started = time.perf_counter()
+            result = func(item)
+            if label is not None:
+                stats.record_latency(label, time.perf_counter() - started)
+        delta = task_stats.to_delta()
+    else:
+        result = func(item)
+    records = list(_captured_records)
+    del _captured_records[:]
+    return result, records, delta
+
+
+def _call_timed(func, item, label):
+    """Run a task in the current process and record its latency"""
+    started = time.perf_counter()
+    result = func(item)
+    stats.record_latency(label, time.perf_counter() - started)
+    return result
+
+
+def map_in_pool(func, items, jobs=1, labels=None, io_bound=False, progress=None):
+    """Apply func to every item, in order, using up to `jobs` worker processes.
+    func must be a module-level function so it can be sent to the workers.
+    labels (e.g. file paths) are used to report per-item latencies, if the
+    active run collects them.
+    With progress (a stage label), the progress over the items is reported.
+    Small batches are processed in the current process, in I/O threads
+    if the work is io_bound."""
+    items = list(items)
+    if labels is None or not stats.collects_latencies():
+        labels = [None] * len(items)
+    collect_stats = stats.is_active()
+    if jobs is None:
+        jobs = get_default_jobs()
+    if jobs <= 1 or len(items) < max(PARALLEL_MIN_FILES, 2):
+        if collect_stats:
+            tasks = zip(items, labels)
+            results = prefetch(
+                lambda task: _call_timed(func, task[0], task[1]) if task[1] is not None else func(task[0]),
+                tasks, None if io_bound else 1,
+            )
+        else:
+            results = prefetch(func, items, None if io_bound else 1)
+        if progress is not None:
+            results = track(results, progress, len(items))
+        return list(results)
+
+    logger.debug(f"processing {len(items)} files with {jobs} workers...")
+    chunksize = max(1, len(items) // (jobs * 4))
+    results = []
+    reporter = Progress(progress, len(items)) if progress is not None else None
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(_log_level,)) as executor:
+        tasks = [(func, item, label, collect_stats) for item, label in zip(items, labels)]
+        for result, records, delta in executor.map(_call_captured, tasks, chunksize=chunksize):
+            # Replay worker logs in the order of the items
+            for record in records:
+                logging.getLogger(record.name).handle(record)
+            if delta is not None:
+                stats.merge_worker_delta(delta)
+            results.append(result)
+            if reporter is not None:
+                reporter.update()
+    if reporter is not None:
+        reporter.finish()
+    return results
@@ -0,0 +1,650 @@
+"""
+Unified normalization pipeline for Zettelkasten note normalization.
+
+Each note is read once into an in-memory document, all enabled stages run as
+transforms on that document, and the final result is written back once.
+Notes of at least STREAM_MIN_BYTES are only summarized when they are loaded;
+their transforms are planned from the summary and applied line by line when
+they are written (see streaming.py).
+"""
+
+import os
+import logging
+from .config import FRONT_MATTER_FORMAT
+from .utils import get_file_name, read_file_cross_platform, sync_directories, to_root_relative, encode_search_terms, file_contains_any, get_file_stat, stat_cache, get_file_format
+from .file_operations import get_files, scan_vault, check_note_type
+from .frontmatter_parser import FrontMatterParser
+from .yfm_processor import normalize_frontmatter_content
+from .link_processor import (
+    extract_link_names,
+    get_link_names_of_file,
+    find_linking_files,
+    substitute_links_in_content,
+    convert_wikilinks_in_content,
+    insert_uid_into_content,
+    plan_renames,
+    apply_journal_operation,
+    stage_writes,
+    run_journal,
+    finish_journal,
+)
+from .manifest import hash_content
+from .journal import RenameJournal
+from .parallel import map_in_pool, prefetch
+from .progress import track
+from .link_matcher import LinkMatcher
+from .uid_allocator import UidAllocator
+from .vault_index import update_vault_index
+from .streaming import is_large_note, summarize_note, plan_frontmatter, plan_uid_insertion
+from . import stats
+
+# Get logger
+logger = logging.getLogger(__name__)
+
+
+class NoteDocument:
+    """A note held in memory while the pipeline transforms it."""
+
+    def __init__(self, path, content, stat=None, file_format=None):
+        """Initialize the document with the content read from disk."""
+        self.path = path
+        self.original_content = content
+        self.content = content
+        self.new_path = None
+        self.stat = stat  # Taken when the note was read, for the Front Matter dates
+        self.file_format = file_format  # (encoding, newline) to write the note with, None for UTF-8 with LF
+
+    def is_modified(self):
+        """Whether the content differs from what was read"""
+        return self.content != self.original_content
+
+    def is_renamed(self):
+        """Whether the note will be moved to a new path"""
+        return self.new_path is not None and self.new_path != self.path
+
+    @property
+    def final_path(self):
+        """The path of the note after the pipeline has been applied"""
+        return self.new_path if self.is_renamed() else self.path
+
+    @property
+    def uid(self):
+        """The UID the note is renamed to, or None"""
+        return get_file_name(self.new_path)[1] if self.is_renamed() else None
+
+
+class LargeNote(NoteDocument):
+    """A note too large to be held in memory.
+    Its transforms are collected here and applied line by line when it is written."""
+
+    def __init__(self, path, summary=None, stat=None):
+        """Initialize the note with the summary of its first pass."""
+        super().__init__(path, None, stat)
+        self.summary = summary  # NoteSummary, None for notes only loaded to rewrite backlinks
+        self.header = None  # New Front Matter, replacing the first head_lines lines
+        self.head_lines = 0
+        self.body = "keep"  # How the body after a new header is cleaned up
+        self.insert_line = None  # Line inserted after the first one, if there is no header
+        self.convert_wikilinks = False
+        self.renames = {}  # Renamed files (old path -> new path) the note links to
+
+    def is_modified(self):
+        """Whether any transform has to be applied"""
+        return self.header is not None or self.insert_line is not None or self.convert_wikilinks or bool(self.renames)
+
+    def operation(self, root_path):
+        """The journal operation that applies the transforms"""
+        return {
+            "op": "stream",
+            "path": to_root_relative(self.final_path, root_path),
+            "header": self.header,
+            "head_lines": self.head_lines,
+            "body": self.body,
+            "insert_line": self.insert_line,
+            "convert_wikilinks": self.convert_wikilinks,
+            "renames": {
+                to_root_relative(old, root_path): to_root_relative(new, root_path)
+                for old, new in self.renames.items()
+            },
+        }
+
+
+def _read_document(item):
+    """Stat and read one file into a NoteDocument, or return None if it cannot be read.
+    With stream, large notes are only summarized into a LargeNote."""
+    file, stream = item
+    try:
+        file_stat = get_file_stat(file)
+        if stream and is_large_note(file_stat):
+            logger.debug("large note, transformed line by line: " + file)
+            return LargeNote(file, summarize_note(file), file_stat)
+        content = read_file_cross_platform(file)
+        return NoteDocument(file, content, file_stat, get_file_format(file))
+    except Exception as e:
+        logger.error(f"Error reading file {file}: {e}")
+        return None
+
+
+def load_documents(files, large_notes=None):
+    """Read every file once into a NoteDocument.
+    The reads are overlapped in I/O threads. If large_notes is given, large
+    notes are summarized into it instead of being read."""
+    documents = {}
+    items = [(file, large_notes is not None) for file in files]
+    for file, document in track(zip(files, prefetch(_read_document, items)), "Reading notes", len(items)):
+        if isinstance(document, LargeNote):
+            large_notes[file] = document
+        elif document is not None:
+            documents[file] = document
+    return documents
+
+
+def _normalize_content_task(item):
+    """Run the front matter and WikiLink transforms on the content of one note"""
+    path, content, file_stat, uid, create_yfm, convert_wikilinks, format_type = item
+    frontmatter_updated = False
+    links_in_file = 0
+    if create_yfm:
+        logger.debug("target: " + path)
+        try:
+            new_content = normalize_frontmatter_content(content, path, FrontMatterParser(format_type), file_stat, uid)
+        except Exception as e:
+            logger.error(f"Error processing front matter for {path}: {e}")
+            new_content = None
+        if new_content is not None:
+            content = new_content
+            frontmatter_updated = True
+    if convert_wikilinks:
+        content, links_in_file = convert_wikilinks_in_content(content, path)
+        if links_in_file:
+            logger.debug(f"Modified {path}: converted {links_in_file} WikiLinks")
+    return content, frontmatter_updated, links_in_file
+
+
+def _transform_large_note(note, create_yfm, convert_wikilinks, format_type):
+    """Plan the front matter and WikiLink transforms of a large note from its summary"""
+    frontmatter_updated = False
+    if create_yfm:
+        logger.debug("target: " + note.path)
+        try:
+            planned = plan_frontmatter(note.summary, note.path, FrontMatterParser(format_type), note.stat, note.uid)
+        except Exception as e:
+            logger.error(f"Error processing front matter for {note.path}: {e}")
+            planned = None
+        if planned is not None:
+            note.header, note.head_lines = planned
+            note.body = "strip"
+            frontmatter_updated = True
+    if convert_wikilinks and note.summary.wikilinks:
+        # The lines after the header are converted when the note is written
+        note.convert_wikilinks = True
+        if note.header is not None:
+            note.header = convert_wikilinks_in_content(note.header, note.path)[0]
+        logger.debug(f"Modified {note.path}: WikiLinks will be converted line by line")
+    return frontmatter_updated
+
+
+def transform_documents(documents, execution_functions, format_type, jobs=1, large_notes=None):
+    """Create or update the Front Matter and convert the WikiLinks of every document"""
+    create_yfm = execution_functions.get("function_create_yfm", False)
+    convert_wikilinks = execution_functions.get("function_convert_wikilinks", False)
+    if create_yfm:
+        logger.info("====== Start Check Front Matter ======")
+        logger.info(f"Format: {format_type}")
+        try:
+            FrontMatterParser(format_type)
+        except (ValueError, ImportError) as e:
+            logger.error(f"Failed to initialize parser: {e}")
+            create_yfm = False
+    if convert_wikilinks:
+        logger.info("====== Start Converting WikiLinks to Markdown Links ======")
+    if not (create_yfm or convert_wikilinks):
+        return 0, 0
+
+    items = [
+        (document.path, document.content, document.stat, document.uid, create_yfm, convert_wikilinks, format_type)
+        for document in documents.values()
+    ]
+    processing_file_cnt = 0
+    total_files_modified = 0
+    total_links_converted = 0
+    labels = [document.path for document in documents.values()]
+    results = map_in_pool(_normalize_content_task, items, jobs, labels, progress="Normalizing notes")
+    for document, (content, frontmatter_updated, links_in_file) in zip(documents.values(), results):
+        document.content = content
+        if frontmatter_updated:
+            processing_file_cnt += 1
+        if links_in_file:
+            total_files_modified += 1
+            total_links_converted += links_in_file
+    for note in (large_notes or {}).values():
+        if _transform_large_note(note, create_yfm, convert_wikilinks, format_type):
+            processing_file_cnt += 1
+        if note.convert_wikilinks:
+            total_files_modified += 1
+
+    if create_yfm:
+        logger.info(str(processing_file_cnt) + " files have been updated!")
+    if convert_wikilinks:
+        logger.info(f"Converted {total_links_converted} WikiLinks in {total_files_modified} files")
+    return processing_file_cnt, total_links_converted
+
+
+def _insert_uid_task(item):
+    """Write the UID into the Front Matter of one note"""
+    content, uid = item
+    return insert_uid_into_content(content, uid)
+
+
+def plan_note_renames(documents, root_path, allocator=None, large_notes=None):
+    """Allocate the UIDs of the documents to rename.
+    This runs before the Front Matter stage, so the uid it writes is the new file name.
+    The content strategy uses the summary hash of large notes."""
+    # The plan is worked out here, so workers never have to agree on names
+    notes = {**documents, **(large_notes or {})}
+    contents = {file: document.content for file, document in documents.items()}
+    digests = {file: note.summary.hash for file, note in (large_notes or {}).items()}
+    rename_map = plan_renames(list(notes), root_path, allocator, contents, digests)
+    for file, new_file_path in rename_map.items():
+        logger.debug("uid: " + get_file_name(new_file_path)[1])
+        logger.debug("rename: " + file + " -> " + new_file_path)
+        notes[file].new_path = new_file_path
+    return rename_map
+
+
+def _insert_uid_into_large_note(note):
+    """Plan the UID insertion of a large note, as insert_uid_into_content() does.
+    Returns whether the note needs it"""
+    if note.header is not None or note.uid in note.summary.head:
+        # The new Front Matter is written with the uid already
+        return False
+    header = plan_uid_insertion(note.summary, note.uid)
+    if header is not None:
+        note.header, note.head_lines, note.body = header, note.summary.head_lines, "lstrip"
+    else:
+        note.insert_line = "uid: " + note.uid
+    return True
+
+
+def transform_note_renames(documents, rename_map, jobs=1, large_notes=None):
+    """Write the UID into the Front Matter of the renamed documents that do not have it yet,
+    i.e. when the Front Matter stage is disabled or could not parse the Front Matter"""
+    logger.info("====== Start Rename Notes ======")
+    large_notes = large_notes or {}
+    files = [file for file in rename_map if file in documents and documents[file].uid not in documents[file].content]
+    items = [(documents[file].content, documents[file].uid) for file in files]
+    for file, content in zip(files, map_in_pool(_insert_uid_task, items, jobs, files)):
+        documents[file].content = content
+    large_cnt = sum(1 for file in rename_map if file in large_notes and _insert_uid_into_large_note(large_notes[file]))
+    logger.info(str(len(rename_map)) + " files will be renamed")
+    return len(files) + large_cnt
+
+
+def _scan_backlinks_task(item):
+    """Find which of the renamed names a note links to.
+    The content is returned only when it had to be read and is needed later.
+    Notes whose raw bytes contain none of the names are not decoded. With
+    stream, large notes are scanned line by line and their content is not returned.
+    The format the content was read with is returned with it."""
+    file, content, rename_names, needles, stream = item
+    loaded = content is not None
+    if not loaded:
+        try:
+            if not file_contains_any(file, needles):
+                return set(), None, None
+            if stream and is_large_note(get_file_stat(file)):
+                return summarize_note(file).links & rename_names, None, None
+            content = read_file_cross_platform(file)
+        except Exception as e:
+            logger.error(f"Error reading file {file}: {e}")
+            return set(), None, None
+    names = extract_link_names(content) & rename_names
+    if not names or loaded:
+        return names, None, None
+    return names, content, get_file_format(file)
+
+
+def _substitute_task(item):
+    """Apply the backlink substitutions to the content of one note"""
+    file, content, matcher = item
+    return substitute_links_in_content(content, matcher, file)
+
+
+def transform_backlinks(documents, rename_map, root_path, jobs=1, manifest=None, use_index=False, scan=None, vault_index=None, large_notes=None):
+    """Rewrite the links to every renamed file across the vault.
+    Notes that are not loaded yet are read once, and only kept in memory
+    if they reference one of the renamed files. With a manifest, unchanged
+    notes are only read if their cached links point to a renamed file.
+    With use_index, the candidates are taken from the backlink index of the
+    manifest instead of scanning the vault. With a VaultIndex, they are the
+    notes whose indexed links point to a renamed file and the notes changed
+    since they were indexed. A VaultScan of the root folder is reused if given.
+    If large_notes is given, large notes that link to a renamed file are added
+    to it and rewritten line by line when they are written."""
+    logger.info("====== Start Substitute Backlinks ======")
+    if not rename_map:
+        logger.info("0 linked files have been updated!")
+        return 0
+
+    matcher = LinkMatcher(rename_map)
+    rename_names = matcher.names()
+    needles = encode_search_terms(rename_names)
+
+    stream = large_notes is not None
+    large_notes = large_notes if stream else {}
+    backlink_index = {}
+    linked_names = {}  # Large note -> names it links to
+    vault_files = []
+    items = []
+    if use_index:
+        candidates = sorted(manifest.linking_files(rename_names) | set(documents) | set(large_notes))
+    elif vault_index is not None and scan is not None:
+        note_files = scan.files("note")
+        candidates = vault_index.linking_files(rename_names) | vault_index.changed_files(note_files, scan) | set(documents) | set(large_notes)
+        candidates = [file for file in note_files if file in candidates]
+    elif scan is not None:
+        candidates = scan.files("note")
+    else:
+        candidates = get_files(root_path, "note")
+    for file in candidates:
+        if file in large_notes:
+            names = large_notes[file].summary.links & rename_names
+            if names:
+                linked_names[file] = names
+                for name in names:
+                    backlink_index.setdefault(name, set()).add(file)
+            continue
+        document = documents.get(file)
+        if document is None and manifest is not None:
+            # Unchanged notes are skipped unless their cached links match
+            cached_names = manifest.cached_link_names(file, scan)
+            if cached_names is not None and not cached_names & rename_names:
+                continue
+        vault_files.append(file)
+        items.append((file, document.content if document else None, rename_names, needles, stream))
+
+    results = map_in_pool(_scan_backlinks_task, items, jobs, vault_files, io_bound=True, progress="Scanning backlinks")
+    for file, (names, content, file_format) in zip(vault_files, results):
+        if not names:
+            continue
+        if content is not None:
+            documents[file] = NoteDocument(file, content, file_format=file_format)
+        elif file not in documents:
+            # A large note that was not loaded
+            large_notes[file] = LargeNote(file)
+            linked_names[file] = names
+        for name in names:
+            backlink_index.setdefault(name, set()).add(file)
+
+    linking_files = find_linking_files(rename_map, backlink_index)
+    files = sorted(file for file in linking_files if file in documents)
+    items = [(file, documents[file].content, matcher) for file in files]
+    substitute_file_cnt = 0
+    for file, (content, link_cnt) in zip(files, map_in_pool(_substitute_task, items, jobs, files, progress="Substituting backlinks")):
+        documents[file].content = content
+        if link_cnt:
+            substitute_file_cnt += 1
+    for file in sorted(file for file in linking_files if file in large_notes):
+        # Only the renames the note links to are kept for its journal operation
+        note = large_notes[file]
+        note.renames = {
+            old: new for old, new in rename_map.items()
+            if linked_names[file].intersection(get_link_names_of_file(old))
+        }
+        if note.header is not None:
+            note.header = substitute_links_in_content(note.header, matcher, file)[0]
+        substitute_file_cnt += 1
+    logger.info(str(substitute_file_cnt) + " linked files have been updated!")
+    return substitute_file_cnt
+
+
+def _write_operation_task(item):
+    """Write one document, returning whether the file was written"""
+    operation, root_path = item
+    try:
+        return apply_journal_operation(operation, root_path)
+    except Exception as e:
+        logger.error(f"Error writing file {operation['path']}: {e}")
+        return False
+
+
+def write_documents(documents, image_rename_map=None, root_path=os.curdir, large_notes=None):
+    """Apply the renames and write every modified document exactly once.
+    If files are renamed, every step is recorded in a journal first, so an
+    interrupted run can be finished with --resume. All renames come first,
+    so that the writes can be overlapped in I/O threads. Large notes are
+    rewritten line by line by "stream" operations. When the writes are
+    journaled, their contents are staged next to the notes first, so the
+    journal only holds their hashes."""
+    logger.info("====== Start Writing Results ======")
+    large_notes = large_notes or {}
+    operations = []
+    for document in list(documents.values()) + list(large_notes.values()):
+        if document.is_renamed():
+            operations.append({
+                "op": "rename",
+                "type": "note",
+                "from": to_root_relative(document.path, root_path),
+                "to": to_root_relative(document.new_path, root_path),
+            })
+    for old_file_path, new_file_path in (image_rename_map or {}).items():
+        operations.append({
+            "op": "rename",
+            "type": "image",
+            "from": to_root_relative(old_file_path, root_path),
+            "to": to_root_relative(new_file_path, root_path),
+        })
+    for document in documents.values():
+        if document.is_modified():
+            operation = {
+                "op": "write",
+                "path": to_root_relative(document.final_path, root_path),
+                "content": document.content,
+                "sha256": hash_content(document.original_content),
+            }
+            if document.file_format is not None:
+                operation["encoding"], operation["newline"] = document.file_format
+            operations.append(operation)
+    for note in large_notes.values():
+        if note.is_modified():
+            operations.append(note.operation(root_path))
+
+    if any(operation["op"] == "rename" for operation in operations):
+        stage_writes(operations, root_path)
+        journal = RenameJournal(root_path)
+        journal.begin({"stage": "pipeline"}, operations)
+        changed_cnt, failed_cnt = run_journal(journal, root_path)
+        finish_journal(journal, failed_cnt)
+    else:
+        changed_cnt = {"rename": 0, "write": 0, "stream": 0}
+        written_results = prefetch(_write_operation_task, [(operation, root_path) for operation in operations])
+        for operation, written in track(zip(operations, written_results), "Writing notes", len(operations)):
+            if written:
+                changed_cnt[operation["op"]] += 1
+        sync_directories()
+    write_cnt = changed_cnt["write"] + changed_cnt["stream"]
+    logger.info(str(changed_cnt["rename"]) + " files have been renamed!")
+    logger.info(str(write_cnt) + " files have been written!")
+    return write_cnt, changed_cnt["rename"]
+
+
+def filter_unchanged_documents(documents, manifest, large_notes=None):
+    """Drop the documents whose content has not changed since the last run"""
+    for file in list(documents):
+        if manifest.has_same_content(file, documents[file].content):
+            # Only the mtime has changed, the cached results are still valid
+            manifest.touch(file)
+            del documents[file]
+    for file in list(large_notes or ()):
+        if manifest.has_same_hash(file, large_notes[file].summary.hash):
+            manifest.touch(file)
+            del large_notes[file]
+
+
+def update_manifest(manifest, documents, image_rename_map, notes, images, large_notes=None):
+    """Record the final state of every processed note and image.
+    Notes that were only loaded to rewrite backlinks are recorded only if
+    the manifest already knows them, since they have not been normalized.
+    Large notes that were rewritten are summarized again."""
+    notes = set(notes)
+    for document in list(documents.values()) + list((large_notes or {}).values()):
+        if document.path not in notes and manifest.get(document.path) is None:
+            continue
+        if document.is_renamed():
+            manifest.remove(document.path)
+        try:
+            if isinstance(document, LargeNote):
+                summary = summarize_note(document.final_path) if document.is_modified() else document.summary
+                manifest.record(document.final_path, summary=summary)
+            else:
+                manifest.record(document.final_path, document.content)
+        except OSError as e:
+            logger.error(f"Error recording {document.final_path} in the manifest: {e}")
+    for image in images:
+        new_image = image_rename_map.get(image, image)
+        if new_image != image:
+            manifest.remove(image)
+        try:
+            manifest.record(new_image, file_type="image")
+        except OSError as e:
+            logger.error(f"Error recording {new_image} in the manifest: {e}")
+
+
+class PipelineResult:
+    """Documents and image renames computed by the pipeline, not yet written."""
+
+    def __init__(self, documents, image_rename_map, note_files, image_files, linked_file_cnt, scan=None, large_notes=None):
+        """Keep the in-memory result of the transform stages."""
+        self.documents = documents
+        self.large_notes = large_notes or {}  # Notes transformed line by line when they are written
+        self.image_rename_map = image_rename_map
+        self.note_files = note_files
+        self.image_files = image_files
+        self.linked_file_cnt = linked_file_cnt
+        self.scan = scan  # VaultScan of the root folder before the renames, or None
+
+
+def plan_pipeline(target_path, root_path, execution_functions, format_type=None, jobs=1, manifest=None, files=None, vault_index=None, stream=True):
+    """Run all enabled stages on in-memory documents without touching the disk.
+    Per-note transforms are spread across `jobs` worker processes. If a
+    manifest is given, only files added or changed since the last run are
+    processed. If files (notes, images or folders) is given, only those are
+    processed; with a manifest, the backlinks are found with it instead of
+    scanning the vault. Otherwise they are found with the VaultIndex, if given.
+    With stream, large notes are not loaded but kept in result.large_notes;
+    without it, every note is loaded whole."""
+    if format_type is None:
+        format_type = FRONT_MATTER_FORMAT
+
+    logger.info("====== Start Normalization Pipeline ======")
+    with stats.stage("load"):
+        scan = None
+        if files is None or manifest is None or any(os.path.isdir(file) for file in files):
+            # One scan of the root folder is shared by all stages
+            scan = scan_vault(root_path)
+        if files is None:
+            note_files = scan.files("note", target_path)
+            image_files = scan.files("image", target_path)
+        elif scan is not None:
+            note_files = scan.select(files, "note")
+            image_files = scan.select(files, "image")
+        else:
+            note_files = [file for file in files if check_note_type(file, "note")]
+            image_files = [file for file in files if check_note_type(file, "image")]
+        if manifest is not None:
+            if files is None:
+                manifest.prune(note_files + image_files, target_path)
+                scan.prefetch_stats(note_files + image_files)
+            all_note_cnt = len(note_files)
+            note_files = manifest.filter_changed(note_files, scan)
+            image_files = manifest.filter_changed(image_files, scan)
+            logger.info(str(all_note_cnt - len(note_files)) + " unchanged files are skipped")
+        large_notes = {} if stream else None
+        documents = load_documents(note_files, large_notes)
+        if manifest is not None:
+            filter_unchanged_documents(documents, manifest, large_notes)
+
+        allocator = None
+        rename_map = {}
+        if execution_functions.get("function_rename_notes", False) or execution_functions.get("function_rename_images", False):
+            # The names in use are known from the scan (or the manifest), so UIDs are allocated without probing the disk.
+            # Notes get their UID before the Front Matter stage, which writes it as their uid
+            if scan is not None:
+                allocator = UidAllocator.from_scan(scan)
+            else:
+                allocator = UidAllocator.from_manifest(manifest, note_files + image_files)
+        if execution_functions.get("function_rename_notes", False):
+            rename_map.update(plan_note_renames(documents, root_path, allocator, large_notes))
+    logger.info("the target is: " + str(len(documents) + len(large_notes or ())) + " files")
+
+    with stats.stage("frontmatter_and_wikilinks"):
+        transform_documents(documents, execution_functions, format_type, jobs, large_notes)
+
+    if execution_functions.get("function_rename_notes", False):
+        with stats.stage("rename_notes"):
+            transform_note_renames(documents, rename_map, jobs, large_notes)
+
+    image_rename_map = {}
+    if execution_functions.get("function_rename_images", False):
+        with stats.stage("rename_images"):
+            logger.info("====== Start Rename Images ======")
+            image_rename_map = plan_renames(image_files, root_path, allocator)
+            logger.info(str(len(image_rename_map)) + " images will be renamed")
+            rename_map.update(image_rename_map)
+
+    with stats.stage("backlinks"):
+        use_index = files is not None and manifest is not None
+        substitute_file_cnt = transform_backlinks(documents, rename_map, root_path, jobs, manifest, use_index, scan, vault_index, large_notes)
+    return PipelineResult(documents, image_rename_map, note_files, image_files, substitute_file_cnt, scan, large_notes)
+
+
+def update_index(vault_index, result):
+    """Bring the vault index up to date with the written result of the pipeline.
+    With a scan of the vault, every file is checked and deleted files are
+    forgotten; otherwise only the processed files are. Large notes are
+    summarized again by update_vault_index()."""
+    all_notes = list(result.documents.values()) + list(result.large_notes.values())
+    renamed = {note.path: note.final_path for note in all_notes if note.is_renamed()}
+    renamed.update(result.image_rename_map)
+    contents = {document.final_path: document.content for document in result.documents.values()}
+    if result.scan is not None:
+        notes = [renamed.get(file, file) for file in result.scan.notes]
+        images = [renamed.get(file, file) for file in result.scan.images]
+        existing = notes + images
+    else:
+        notes = [note.final_path for note in all_notes]
+        images = [renamed.get(file, file) for file in result.image_files]
+        existing = None
+    files = []
+    for type, type_files in (("note", notes), ("image", images)):
+        for file in type_files:
+            try:
+                files.append((file, type, get_file_stat(file)))
+            except OSError as e:
+                logger.error(f"Error indexing {file}: {e}")
+    return update_vault_index(vault_index, files, contents, renamed, existing)
+
+
+def run_pipeline(target_path, root_path, execution_functions, format_type=None, jobs=1, manifest=None, files=None, vault_index=None, stream=True):
+    """Run all enabled stages on in-memory documents and write the result once.
+    If a manifest or a VaultIndex is given, it is updated and saved afterwards."""
+    # Every file is stat'ed at most once per run; the vault scan seeds the cache
+    with stat_cache():
+        result = plan_pipeline(target_path, root_path, execution_functions, format_type, jobs, manifest, files, vault_index, stream)
+        with stats.stage("write"):
+            write_file_cnt, rename_file_cnt = write_documents(result.documents, result.image_rename_map, root_path, result.large_notes)
+
+            if manifest is not None:
+                update_manifest(manifest, result.documents, result.image_rename_map, result.note_files, result.image_files, result.large_notes)
+                manifest.save()
+
+        if vault_index is not None:
+            with stats.stage("index"):
+                update_index(vault_index, result)
+
+    return {
+        "notes_loaded": len(result.documents) + len(result.large_notes),
+        "files_written": write_file_cnt,
+        "files_renamed": rename_file_cnt,
+        "linked_files_updated": result.linked_file_cnt,
+    }
@@ -0,0 +1,185 @@
+"""
+Change plans for Zettelkasten note normalization.
+
+A plan records every rename and every rewritten note computed by the
+pipeline without touching the vault. It can be reviewed as JSON or as a
+unified diff, and applied later as pure I/O without recomputing anything.
+Before applying, every file is checked against the hash it had when the plan
+was made, so a vault that changed in between is never overwritten.
+"""
+
+import os
+import sys
+import json
+import difflib
+import logging
+import datetime
+from .utils import to_root_relative, from_root_relative, read_file_cross_platform
+from .config import JOURNAL_FILE
+from .manifest import hash_content
+from .journal import RenameJournal
+from .link_processor import stage_writes, run_journal, finish_journal
+
+# Get logger
+logger = logging.getLogger(__name__)
+
+PLAN_VERSION = 1
+
+
+def build_change_plan(result, root_path, format_type=None):
+    """Build the plan of a PipelineResult"""
+    renames = []
+    writes = []
+    for document in result.documents.values():
+        if document.is_renamed():
+            renames.append({
+                "type": "note",
+                "from": to_root_relative(document.path, root_path),
+                "to": to_root_relative(document.new_path, root_path),
+            })
+        if document.is_modified():
+            write = {
+                "from": to_root_relative(document.path, root_path),
+                "path": to_root_relative(document.final_path, root_path),
+                "sha256": hash_content(document.original_content),
+                "content": document.content,
+            }
+            if document.file_format is not None:
+                write["encoding"], write["newline"] = document.file_format
+            writes.append(write)
+    for old_file_path, new_file_path in result.image_rename_map.items():
+        renames.append({
+            "type": "image",
+            "from": to_root_relative(old_file_path, root_path),
+            "to": to_root_relative(new_file_path, root_path),
+        })
+    return {
+        "version": PLAN_VERSION,
+        "root": os.path.abspath(root_path),
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "format": format_type,
+        "summary": {
+            "notes_loaded": len(result.documents),
+            "files_to_write": len(writes),
+            "files_to_rename": len(renames),
+            "linked_files_to_update": result.linked_file_cnt,
+        },
+        "renames": renames,
+        "writes": writes,
+    }
+
+
+def render_diff(result, root_path):
+    """Render the changes of a PipelineResult as a unified diff"""
+    chunks = []
+    for document in result.documents.values():
+        if not (document.is_modified() or document.is_renamed()):
+            continue
+        old_name = to_root_relative(document.path, root_path)
+        new_name = to_root_relative(document.final_path, root_path)
+        if document.is_renamed():
+            chunks.append(f"rename from {old_name}\nrename to {new_name}\n")
+        for line in difflib.unified_diff(
+            document.original_content.splitlines(keepends=True),
+            document.content.splitlines(keepends=True),
+            fromfile="a/" + old_name,
+            tofile="b/" + new_name,
+        ):
+            if not line.endswith("\n"):
+                line += "\n\\ No newline at end of file\n"
+            chunks.append(line)
+    for old_file_path, new_file_path in result.image_rename_map.items():
+        chunks.append(
+            f"rename from {to_root_relative(old_file_path, root_path)}\n"
+            f"rename to {to_root_relative(new_file_path, root_path)}\n"
+        )
+    return "".join(chunks)
+
+
+def save_plan(plan, path):
+    """Write a plan as compact JSON"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(plan, f, ensure_ascii=False, separators=(",", ":"))
+
+
+def save_diff(diff, path):
+    """Write a diff to a file, or to stdout if path is "-" """
+    if path == "-":
+        sys.stdout.write(diff)
+        return
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(diff)
+
+
+def load_plan(path):
+    """Read a plan written by save_plan"""
+    with open(path, "r", encoding="utf-8") as f:
+        plan = json.load(f)
+    if plan.get("version") != PLAN_VERSION:
+        raise ValueError(f"unsupported plan version: {plan.get('version')}")
+    return plan
+
+
+def check_plan(plan, root_path):
+    """Check that the vault is still in the state the plan was made for.
+    Returns a list of problems, empty if the plan can be applied"""
+    problems = []
+    for rename in plan["renames"]:
+        if not os.path.exists(from_root_relative(rename["from"], root_path)):
+            problems.append("file to rename does not exist: " + rename["from"])
+        if os.path.exists(from_root_relative(rename["to"], root_path)):
+            problems.append("rename destination already exists: " + rename["to"])
+    for write in plan["writes"]:
+        file_path = from_root_relative(write["from"], root_path)
+        if not os.path.exists(file_path):
+            problems.append("file to update does not exist: " + write["from"])
+            continue
+        try:
+            if hash_content(read_file_cross_platform(file_path)) != write["sha256"]:
+                problems.append("file has changed since the plan was made: " + write["from"])
+        except OSError as e:
+            problems.append(f"file cannot be read: {write['from']}: {e}")
+    return problems
+
+
+def apply_plan(plan, root_path=None, force=False):
+    """Apply a plan: rename the files, then write the new contents.
+    Every step is recorded in a journal first, as the pipeline does, so an
+    interrupted apply can be finished with --resume. Nothing is recomputed.
+    Returns the number of written and renamed files, or None if the vault no
+    longer matches the plan (unless force is set)."""
+    if root_path is None:
+        root_path = plan["root"]
+    logger.info("====== Start Applying Plan ======")
+    if RenameJournal.exists(root_path):
+        logger.error("An interrupted run was found (" + JOURNAL_FILE + "). Run again with --resume to finish it")
+        return None
+    problems = check_plan(plan, root_path)
+    for problem in problems:
+        logger.error(problem)
+    if problems and not force:
+        logger.error(str(len(problems)) + " conflicts were found, the plan was not applied")
+        return None
+
+    operations = [
+        {"op": "rename", "type": rename["type"], "from": rename["from"], "to": rename["to"]}
+        for rename in plan["renames"]
+    ]
+    for write in plan["writes"]:
+        operation = {"op": "write", "path": write["path"], "content": write["content"], "sha256": write["sha256"]}
+        if "encoding" in write:
+            operation["encoding"], operation["newline"] = write["encoding"], write["newline"]
+        operations.append(operation)
+    if operations:
+        # Renamed notes and their rewritten backlinks are recorded together, so --resume can finish them
+        stage_writes(operations, root_path)
+        journal = RenameJournal(root_path)
+        journal.begin({"stage": "apply"}, operations)
+        changed_cnt, failed_cnt = run_journal(journal, root_path)
+        finish_journal(journal, failed_cnt)
+        rename_file_cnt, write_file_cnt = changed_cnt["rename"], changed_cnt["write"]
+    else:
+        rename_file_cnt, write_file_cnt = 0, 0
+    logger.info(str(rename_file_cnt) + " files have been renamed!")
+    logger.info(str(write_file_cnt) + " files have been written!")
+    return write_file_cnt, rename_file_cnt
@@ -0,0 +1,81 @@
+"""
+Progress reporting for Zettelkasten note normalization.
+
+Long stages report how many files are done, the throughput and the time
+left at most once every PROGRESS_INTERVAL seconds, instead of logging a
+line per file, and a summary line once they finish. Messages go through
+the logger of this module, so --quiet hides them like any other INFO line.
+"""
+
+import time
+import logging
+from .config import PROGRESS_INTERVAL
+
+# Get logger
+logger = logging.getLogger(__name__)
+
+
+def format_duration(seconds):
+    """Format a duration as m:ss (or h:mm:ss)"""
+    seconds = int(round(seconds))
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+class Progress:
+    """Rate-limited progress of a stage over a known number of files (or other units)."""
+
+    def __init__(self, label, total, interval=None, unit="files"):
+        """Start measuring the progress of label over total units."""
+        self.label = label
+        self.total = total
+        self.unit = unit
+        self.interval = PROGRESS_INTERVAL if interval is None else interval
+        self.done = 0
+        self.started = time.monotonic()
+        self.reported = self.started
+
+    def rate(self, now):
+        """Units per second since the start"""
+        elapsed = now - self.started
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def message(self, now):
+        """Progress line with the share done, the throughput and the estimated time left"""
+        rate = self.rate(now)
+        percent = self.done * 100 // self.total if self.total else 100
+        eta = format_duration((self.total - self.done) / rate) if rate else "?"
+        return f"{self.label}: {self.done}/{self.total} {self.unit} ({percent}%), {rate:.1f} {self.unit}/s, ETA {eta}"
+
+    def update(self, count=1):
+        """Count units as done, logging the progress if the interval has passed"""
+        self.done += count
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        now = time.monotonic()
+        if now - self.reported >= self.interval and self.done < self.total:
+            self.reported = now
+            logger.info(self.message(now))
+
+    def finish(self):
+        """Log how many units were done and how fast"""
+        if not self.total:
+            return
+        now = time.monotonic()
+        logger.info(
+            f"{self.label}: {self.done}/{self.total} {self.unit} in {format_duration(now - self.started)}"
+            f" ({self.rate(now):.1f} {self.unit}/s)"
+        )
+
+
+def track(items, label, total=None):
+    """Yield the items, reporting the progress of label over them.
+    total defaults to the length of items."""
+    progress = Progress(label, len(items) if total is None else total)
+    for item in items:
+        yield item
+        progress.update()
+    progress.finish()
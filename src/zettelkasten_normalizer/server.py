@@ -0,0 +1,196 @@
+"""
+Resident normalization server for Zettelkasten note normalization.
+
+A long-lived process keeps the manifest, which doubles as the link and UID
+index of the vault, in memory and listens on a Unix domain socket in the
+root folder. Clients (see client.py) send the paths to normalize and get the
+result back without paying for interpreter startup, imports, logger setup
+or a scan of the vault.
+
+Notes changed behind the server's back are tracked with a watcher: their
+cached links can no longer be trusted, so they are marked dirty in the
+manifest and checked whenever a rename needs its backlinks.
+
+Requests are JSON objects with a "command":
+    normalize  normalize the "paths" (files or folders, relative to "cwd")
+    ping       check that the server is running
+    stop       shut the server down
+"""
+
+import os
+import time
+import select
+import socket
+import logging
+from .config import WATCH_POLL_INTERVAL, SERVER_TIMEOUT
+from .utils import normalize_path
+from .file_operations import scan_vault, filter_targets, check_note_type
+from .pipeline import run_pipeline
+from .manifest import VaultManifest
+from .watcher import create_watcher, is_watched_file, normalize_changed_files
+from .client import get_socket_path, read_message, write_message
+
+# Get logger
+logger = logging.getLogger(__name__)
+
+
+def bind_socket(socket_path):
+    """Listen on a Unix domain socket, replacing one left behind by a killed server"""
+    if os.path.exists(socket_path):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+            try:
+                probe.connect(socket_path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.remove(socket_path)
+            else:
+                raise RuntimeError("a server is already running on " + socket_path)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        listener.bind(socket_path)
+        os.chmod(socket_path, 0o600)
+        listener.listen()
+    except OSError:
+        listener.close()
+        raise
+    return listener
+
+
+class NormalizationServer:
+    """Normalizes the paths sent by clients, with the vault index kept in memory."""
+
+    def __init__(self, root_path, execution_functions, format_type=None, jobs=1,
+                 socket_path=None, polling=False, watcher=None):
+        """Load the manifest and start watching the vault."""
+        self.root_path = normalize_path(root_path)
+        self.execution_functions = execution_functions
+        self.format_type = format_type
+        self.jobs = jobs
+        self.socket_path = socket_path or get_socket_path(self.root_path)
+        self.manifest = VaultManifest.load(self.root_path)
+        self.watcher = watcher if watcher is not None else create_watcher(self.root_path, polling)
+        self.listener = None
+        self.running = False
+
+    def start(self):
+        """Listen on the socket, then bring the vault and its index up to date.
+        Clients that connect meanwhile wait until the vault is ready."""
+        self.listener = bind_socket(self.socket_path)
+        run_pipeline(self.root_path, self.root_path, self.execution_functions,
+                     self.format_type, self.jobs, self.manifest)
+        self.refresh()
+        self.running = True
+        logger.info("Listening on " + self.socket_path)
+
+    def refresh(self):
+        """Mark the notes that were changed behind the server's back as dirty.
+        The files written by the server itself match the manifest and are ignored."""
+        changed = self.watcher.poll(0)
+        if getattr(self.watcher, "overflowed", False):
+            logger.warning("Too many events, rescanning the vault")
+            self.watcher.overflowed = False
+            changed = scan_vault(self.root_path).notes
+        for path in changed:
+            if not check_note_type(path, "note"):
+                continue
+            if os.path.isfile(path):
+                if is_watched_file(path) and not self.manifest.is_unchanged(path):
+                    self.manifest.mark_dirty(path)
+            elif self.manifest.get(path) is not None:
+                self.manifest.remove(path)
+
+    def _to_vault_path(self, path):
+        """Spell a path the way the scan and the manifest do"""
+        return os.path.join(self.root_path, os.path.relpath(os.path.abspath(path), self.root_path))
+
+    def normalize(self, request):
+        """Normalize the files and folders of a request"""
+        started = time.perf_counter()
+        cwd = request.get("cwd") or self.root_path
+        targets = [os.path.join(cwd, path) for path in request.get("paths", [])]
+        targets, skipped = filter_targets(targets, self.root_path)
+        files = []
+        for target in map(self._to_vault_path, targets):
+            if os.path.isdir(target):
+                scan = scan_vault(target)
+                files.extend(scan.notes + scan.images)
+            else:
+                files.append(target)
+
+        self.refresh()
+        result = normalize_changed_files(files, self.root_path, self.execution_functions,
+                                         self.format_type, self.jobs, self.manifest)
+        if result is None:
+            result = {"notes_loaded": 0, "files_written": 0, "files_renamed": 0, "linked_files_updated": 0}
+        logger.info(f"{len(files)} requested files have been processed")
+        return dict(result, ok=True, skipped=skipped, seconds=time.perf_counter() - started)
+
+    def handle(self, request):
+        """Answer one request"""
+        command = request.get("command", "normalize")
+        if command == "ping":
+            return {"ok": True, "root": self.root_path}
+        if command == "stop":
+            logger.info("Stop requested by a client")
+            self.running = False
+            return {"ok": True}
+        if command != "normalize":
+            return {"ok": False, "error": "unknown command: " + str(command)}
+        try:
+            return self.normalize(request)
+        except Exception as e:
+            logger.error(f"Error processing request: {e}")
+            return {"ok": False, "error": str(e)}
+
+    def serve_forever(self, max_requests=None):
+        """Answer requests until stopped, or until max_requests have been answered.
+        Returns the number of answered requests."""
+        request_cnt = 0
+        while self.running and (max_requests is None or request_cnt < max_requests):
+            readable, _, _ = select.select([self.listener], [], [], WATCH_POLL_INTERVAL)
+            if not readable:
+                # Keep the event queue of the watcher short
+                self.refresh()
+                continue
+            connection, _ = self.listener.accept()
+            with connection:
+                connection.settimeout(SERVER_TIMEOUT)
+                try:
+                    request = read_message(connection)
+                except (OSError, ValueError) as e:
+                    logger.error(f"Invalid request: {e}")
+                    continue
+                if request is None:
+                    continue
+                response = self.handle(request)
+                try:
+                    write_message(connection, response)
+                except OSError as e:
+                    logger.warning(f"The client went away before the response was sent: {e}")
+                request_cnt += 1
+        return request_cnt
+
+    def close(self):
+        """Stop listening and remove the socket"""
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+            try:
+                os.remove(self.socket_path)
+            except FileNotFoundError:
+                pass
+        self.watcher.close()
+
+
+def serve(root_path, execution_functions, format_type=None, jobs=1, socket_path=None,
+          polling=False, max_requests=None):
+    """Run the normalization server until a client stops it or it is interrupted"""
+    if not hasattr(socket, "AF_UNIX"):
+        logger.error("Unix domain sockets are not supported on this platform, --serve is not available")
+        return 0
+    logger.info("====== Start Normalization Server ======")
+    server = NormalizationServer(root_path, execution_functions, format_type, jobs, socket_path, polling)
+    try:
+        server.start()
+        return server.serve_forever(max_requests)
+    finally:
+        server.close()
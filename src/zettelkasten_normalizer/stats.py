@@ -0,0 +1,274 @@
+"""
+Run statistics for Zettelkasten note normalization.
+
+Records wall time, CPU time, file and byte counters, rewritten links and
+per-file latencies for every stage of a run. Recording is a no-op unless a
+RunStats collector has been activated, so the hooks cost nothing by default.
+Per-file latencies are only timed by collectors that report them (--stats);
+the run history needs the stage timers and counters alone.
+"""
+
+import json
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+
+# Get logger
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the per-file latency histogram buckets
+LATENCY_BUCKETS = [0.001, 0.01, 0.1, 1.0]
+SLOWEST_FILES = 10
+
+COUNTERS = ["files_scanned", "files_read", "files_written", "files_renamed", "writes_skipped", "bytes_read", "bytes_written", "links_rewritten"]
+
+# Collector of the current run (or of the current task in a worker process)
+_active = None
+
+# Counters are also recorded from I/O threads
+_lock = threading.Lock()
+
+
+class StageStats:
+    """Counters and timings of one stage."""
+
+    def __init__(self, name):
+        """Initialize empty counters for the stage."""
+        self.name = name
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.latencies = []  # (seconds, file)
+
+    def merge(self, delta):
+        """Add the counters and latencies collected elsewhere (e.g. in a worker)"""
+        for key, value in delta["counters"].items():
+            self.counters[key] += value
+        self.latencies.extend(tuple(latency) for latency in delta["latencies"])
+
+    def to_delta(self):
+        """Counters and latencies in a picklable form"""
+        return {"counters": dict(self.counters), "latencies": list(self.latencies)}
+
+    def histogram(self):
+        """Number of files per latency bucket"""
+        buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        for seconds, file in self.latencies:
+            buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        return buckets
+
+    def slowest(self, count=SLOWEST_FILES):
+        """The slowest files of the stage"""
+        return sorted(self.latencies, key=lambda latency: latency[0], reverse=True)[:count]
+
+    def to_dict(self):
+        """Summary of the stage for the JSON report"""
+        labels = _bucket_labels()
+        return {
+            "name": self.name,
+            "wall_seconds": self.wall_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            **self.counters,
+            "latency_histogram": dict(zip(labels, self.histogram())),
+            "slowest_files": [{"file": file, "seconds": seconds} for seconds, file in self.slowest()],
+        }
+
+
+def _bucket_labels():
+    """Labels of the latency histogram buckets"""
+    labels = ["<" + _format_seconds(bound) for bound in LATENCY_BUCKETS]
+    labels.append(">=" + _format_seconds(LATENCY_BUCKETS[-1]))
+    return labels
+
+
+def _format_seconds(seconds):
+    """Format a duration for the report"""
+    if seconds < 1:
+        return f"{seconds * 1000:.3g}ms"
+    return f"{seconds:.3g}s"
+
+
+class RunStats:
+    """Statistics of a whole normalization run."""
+
+    def __init__(self, latencies=True):
+        """Initialize an empty run. Without latencies, files are not timed one by one."""
+        self.latencies = latencies
+        self.stages = {}
+        self.current = None
+        self.started = time.perf_counter()
+        self.wall_seconds = 0.0
+
+    def get_stage(self, name):
+        """Return the stats of a stage, creating it if needed"""
+        if name not in self.stages:
+            self.stages[name] = StageStats(name)
+        return self.stages[name]
+
+    @contextmanager
+    def stage(self, name):
+        """Time a stage and attribute the counters recorded meanwhile to it"""
+        previous = self.current
+        self.current = self.get_stage(name)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield self.current
+        finally:
+            self.current.wall_seconds += time.perf_counter() - wall_start
+            self.current.cpu_seconds += time.process_time() - cpu_start
+            self.current = previous
+
+    def finish(self):
+        """Stop the run clock"""
+        self.wall_seconds = time.perf_counter() - self.started
+
+    def totals(self):
+        """Counters summed over all stages"""
+        totals = dict.fromkeys(COUNTERS, 0)
+        for stage_stats in self.stages.values():
+            for key, value in stage_stats.counters.items():
+                totals[key] += value
+        return totals
+
+    def to_dict(self):
+        """Machine-readable report"""
+        return {
+            "wall_seconds": self.wall_seconds,
+            "totals": self.totals(),
+            "stages": [stage_stats.to_dict() for stage_stats in self.stages.values()],
+        }
+
+    def write_json(self, path):
+        """Write the report as JSON"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+
+    def report_lines(self):
+        """Human-readable report"""
+        lines = ["====== Run Statistics ======"]
+        header = f"{'stage':28s}{'wall':>9s}{'cpu':>9s}{'scanned':>9s}{'read':>8s}{'written':>9s}{'skipped':>9s}{'KB read':>10s}{'KB writ.':>10s}{'links':>8s}"
+        lines.append(header)
+        for stage_stats in self.stages.values():
+            counters = stage_stats.counters
+            lines.append(
+                f"{stage_stats.name:28s}"
+                f"{stage_stats.wall_seconds:8.2f}s{stage_stats.cpu_seconds:8.2f}s"
+                f"{counters['files_scanned']:9d}{counters['files_read']:8d}{counters['files_written']:9d}{counters['writes_skipped']:9d}"
+                f"{counters['bytes_read'] / 1024:10.1f}{counters['bytes_written'] / 1024:10.1f}"
+                f"{counters['links_rewritten']:8d}"
+            )
+        lines.append(f"Total wall time: {self.wall_seconds:.2f}s")
+
+        latencies = [latency for stage_stats in self.stages.values() for latency in stage_stats.latencies]
+        if latencies:
+            lines.append("Per-file latency:")
+            histogram = StageStats("all")
+            histogram.latencies = latencies
+            for label, count in zip(_bucket_labels(), histogram.histogram()):
+                lines.append(f"  {label:>8s}: {count}")
+            lines.append("Slowest files:")
+            for seconds, file in histogram.slowest():
+                lines.append(f"  {_format_seconds(seconds):>10s}  {file}")
+        return lines
+
+
+def activate(run_stats):
+    """Make run_stats the collector of the current process"""
+    global _active
+    _active = run_stats
+
+
+def deactivate():
+    """Stop collecting statistics"""
+    global _active
+    _active = None
+
+
+def get_active():
+    """Return the active collector, or None"""
+    return _active
+
+
+@contextmanager
+def stage(name):
+    """Time a stage of the active run (no-op without a collector)"""
+    if _active is None or not isinstance(_active, RunStats):
+        yield None
+        return
+    with _active.stage(name) as stage_stats:
+        yield stage_stats
+
+
+def _current_stage():
+    """The stage counters are recorded into, or None"""
+    if _active is None:
+        return None
+    if isinstance(_active, StageStats):
+        return _active
+    return _active.current
+
+
+def record(counter, value=1):
+    """Increase a counter of the current stage"""
+    current = _current_stage()
+    if current is not None:
+        with _lock:
+            current.counters[counter] += value
+
+
+def record_read(nbytes):
+    """Record a file read"""
+    current = _current_stage()
+    if current is not None:
+        with _lock:
+            current.counters["files_read"] += 1
+            current.counters["bytes_read"] += nbytes
+
+
+def record_write(nbytes):
+    """Record a file write"""
+    current = _current_stage()
+    if current is not None:
+        with _lock:
+            current.counters["files_written"] += 1
+            current.counters["bytes_written"] += nbytes
+
+
+def record_latency(file, seconds):
+    """Record how long the processing of one file took"""
+    current = _current_stage()
+    if current is not None:
+        current.latencies.append((seconds, file))
+
+
+def is_active():
+    """Whether statistics are being collected"""
+    return _current_stage() is not None
+
+
+def collects_latencies():
+    """Whether the active run times every file"""
+    return isinstance(_active, RunStats) and _active.latencies
+
+
+@contextmanager
+def collect_worker_task():
+    """Collect the counters of one task in a worker process.
+    Yields a StageStats whose to_delta() is sent back to the parent."""
+    global _active
+    previous = _active
+    _active = StageStats("worker")
+    try:
+        yield _active
+    finally:
+        _active = previous
+
+
+def merge_worker_delta(delta):
+    """Merge the counters of a worker task into the current stage"""
+    current = _current_stage()
+    if current is not None:
+        current.merge(delta)
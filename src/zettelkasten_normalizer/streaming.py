@@ -0,0 +1,273 @@
+"""
+Streaming transforms for very large notes.
+
+Notes of at least STREAM_MIN_BYTES are never loaded as a whole. A first pass
+reads them line by line through an incremental decoder and keeps only what
+the plan needs: the Front Matter lines, the hashtags, the link names and the
+content hash. The new Front Matter is then worked out in memory, and the note
+is rewritten line by line into a temporary file that replaces it, so memory
+use is bounded by the longest line instead of the size of the note.
+
+Links are matched within one line, so a link broken across two lines is left
+as it is.
+"""
+
+import hashlib
+import logging
+from .config import STREAM_MIN_BYTES, FRONT_MATTER_MAX_BYTES
+from .utils import iter_file_lines, write_lines_atomic, sniff_file_format, is_file_format_kept, FALLBACK_ENCODING
+from .frontmatter_parser import FrontMatterParser
+from .yfm_processor import (
+    HASHTAG_PATTERN,
+    HASHTAG_LINE_PATTERN,
+    format_tag_line,
+    update_frontmatter_metadata,
+    create_frontmatter_metadata,
+)
+from .link_matcher import iter_link_names
+from .manifest import extract_note_metadata
+
+# Get logger
+logger = logging.getLogger(__name__)
+
+
+def is_large_note(file_stat):
+    """Whether a note is large enough to be transformed line by line"""
+    return file_stat.st_size >= STREAM_MIN_BYTES
+
+
+def _closes_head(line):
+    """Whether a line can close a Front Matter block"""
+    stripped = line.strip()
+    return stripped in ("---", "+++") or "}" in line
+
+
+class NoteSummary:
+    """What the first pass over a large note found."""
+
+    def __init__(self, encoding):
+        """Initialize an empty summary for a note decoded with encoding."""
+        self.encoding = encoding
+        self.format = None  # Front Matter format of the first line
+        self.head = ""  # Front Matter lines, including the closing one
+        self.head_lines = 0  # Number of Front Matter lines, 0 if it is not closed
+        self.frontmatter = None  # Parsed Front Matter metadata
+        self.line_count = 0
+        self.hashtags = []
+        self.links = set()
+        self.wikilinks = False
+        self.hash = None  # Same as manifest.hash_content() of the whole content
+
+    def has_body(self):
+        """Whether there is anything after the Front Matter"""
+        return self.line_count > self.head_lines
+
+    def tag_line(self):
+        """Tag line of the YFM, as create_tag_line_from_lines() makes it from the content"""
+        return format_tag_line(self.hashtags)
+
+    def metadata(self):
+        """Metadata cached for the note, as manifest.extract_note_metadata() returns it"""
+        metadata = extract_note_metadata(self.head)
+        metadata["links"] = sorted(self.links)
+        return metadata
+
+
+def _summarize_note(file_path, encoding):
+    """Scan a note line by line, decoding it with encoding"""
+    summary = NoteSummary(encoding)
+    parser = FrontMatterParser()
+    digest = hashlib.sha256()
+    head = None  # Lines of a Front Matter block that is still open
+    head_size = 0
+    for line in iter_file_lines(file_path, encoding):
+        digest.update(line.encode('utf-8'))
+        summary.line_count += 1
+        if summary.line_count == 1:
+            summary.format = parser.detect_format(line)
+            if summary.format:
+                head = []
+        if head is not None:
+            head.append(line)
+            head_size += len(line)
+            if _closes_head(line) and parser.frontmatter_length("".join(head)) is not None:
+                summary.head_lines = len(head)
+                summary.head = "".join(head)
+                head = None
+            elif head_size >= FRONT_MATTER_MAX_BYTES:
+                logger.debug(f"Front Matter is not closed within {FRONT_MATTER_MAX_BYTES} bytes: {file_path}")
+                summary.head = "".join(head)
+                head = None
+        if "#" in line:
+            summary.hashtags.extend(tag[1] for tag in HASHTAG_PATTERN.findall(line))
+        if "[" in line:
+            summary.links.update(iter_link_names(line))
+            if "[[" in line:
+                summary.wikilinks = True
+    if head is not None:
+        # The note ends in its Front Matter, which may be closed by its last line
+        summary.head = "".join(head)
+        if parser.locate_frontmatter(summary.head) is not None:
+            summary.head_lines = len(head)
+    if summary.head_lines:
+        summary.frontmatter = parser.parse_frontmatter_span(summary.head)[0]
+    summary.hash = digest.hexdigest()
+    return summary
+
+
+def summarize_note(file_path):
+    """First pass over a large note: return its NoteSummary.
+    The encoding is chosen as read_file_cross_platform does."""
+    encoding = sniff_file_format(file_path)[0]
+    try:
+        return _summarize_note(file_path, encoding)
+    except UnicodeDecodeError:
+        return _summarize_note(file_path, FALLBACK_ENCODING)
+
+
+def plan_frontmatter(summary, file_path, parser, file_stat=None, uid=None):
+    """Return the new Front Matter of a large note and the number of lines it replaces,
+    or None if it is up to date (as normalize_frontmatter_content() decides)"""
+    if summary.format:
+        if summary.frontmatter is None:
+            logger.debug("Failed to parse front matter, skipping")
+            return None
+        metadata = dict(summary.frontmatter)
+        if not update_frontmatter_metadata(metadata, file_path, summary.tag_line(), file_stat, uid):
+            return None
+        return parser.format_frontmatter(metadata), summary.head_lines
+    logger.debug("insert Front Matter...")
+    metadata = create_frontmatter_metadata(file_path, summary.tag_line(), file_stat, uid)
+    return parser.format_frontmatter(metadata), 0
+
+
+def plan_uid_insertion(summary, uid):
+    """Return the new Front Matter of a large note with uid set in it, or None
+    if the Front Matter cannot be parsed (as insert_uid_into_content() does)"""
+    if summary.frontmatter is None:
+        return None
+    metadata = dict(summary.frontmatter)
+    metadata["uid"] = uid
+    header = FrontMatterParser(summary.format).format_frontmatter(metadata)
+    if summary.format == "json" or summary.has_body():
+        header += "\n"
+    return header
+
+
+def _strip_body_lines(lines):
+    """Drop hashtag lines and leading and trailing line breaks of the body,
+    as splice_frontmatter() does. The body is preceded by a line break"""
+    started = False
+    blank_cnt = 0  # Empty lines held back until a non-empty line follows
+    for line in lines:
+        text = line.rstrip('\n')
+        if not started and not text:
+            continue
+        started = True
+        if HASHTAG_LINE_PATTERN.match(text):
+            continue
+        if not text:
+            blank_cnt += 1
+            continue
+        yield "\n" * blank_cnt + text + "\n"
+        blank_cnt = 0
+
+
+def _lstrip_body_lines(lines):
+    """Drop the leading line breaks of the body, as serialize_frontmatter() does"""
+    started = False
+    for line in lines:
+        if not started and line == "\n":
+            continue
+        started = True
+        yield line
+
+
+def _transformed_lines(lines, header, head_lines, body, line_transforms, insert_line, state):
+    """Yield the lines of the rewritten note"""
+    if header is not None:
+        state["changed"] = True
+        for _ in range(head_lines):
+            if next(lines, None) is None:
+                break
+        yield header
+        if body == "strip":
+            body_lines = _strip_body_lines(lines)
+            first = next(body_lines, None)
+            if first is None:
+                return
+            lines = _chain("\n" + first, body_lines)
+        elif body == "lstrip":
+            lines = _lstrip_body_lines(lines)
+    elif insert_line is not None:
+        first = next(lines, None)
+        if first is None:
+            # An empty note becomes an empty first line and the inserted one
+            state["changed"] = True
+            lines = iter(["\n" + insert_line])
+        else:
+            second = next(lines, None)
+            rest = lines if second is None else _chain(second, lines)
+            if second is not None and second.rstrip("\n") == insert_line:
+                # Inserted by an earlier, interrupted run
+                lines = _chain(first, rest)
+            else:
+                state["changed"] = True
+                if first.endswith("\n"):
+                    lines = _chain(first + insert_line + "\n", rest)
+                else:
+                    lines = _chain(first + "\n" + insert_line, rest)
+    for line in lines:
+        for transform in line_transforms:
+            line, changed_cnt = transform(line)
+            if changed_cnt:
+                state["changed"] = True
+        yield line
+
+
+def _chain(first, rest):
+    """Yield first, then the items of rest"""
+    yield first
+    yield from rest
+
+
+def _starts_with(file_path, text, encoding):
+    """Whether a file starts with text, whatever its line endings"""
+    try:
+        with open(file_path, 'r', encoding=encoding) as f:
+            return f.read(len(text)) == text
+    except UnicodeDecodeError:
+        return False
+
+
+def stream_transform_file(file_path, header=None, head_lines=0, body="keep", line_transforms=(), insert_line=None):
+    """Rewrite a large note line by line into a temporary file that replaces it.
+    The first head_lines lines are replaced by header, if it is given, and the
+    rest of the note is kept ("keep"), stripped of its leading line breaks
+    ("lstrip") or of its hashtag lines and leading and trailing line breaks
+    ("strip"). Without a header, insert_line is inserted after the first line,
+    unless it is the second line already. Every line transform (line ->
+    (line, count)) is applied to the remaining lines.
+    The note is only replaced if something has changed; returns whether it was.
+    A header that the note already starts with (e.g. written by an interrupted
+    run) is not inserted again. The note keeps its encoding and line endings
+    unless is_file_format_kept() is False."""
+    encoding, newline = sniff_file_format(file_path)
+    output = None if is_file_format_kept() else ('utf-8', '\n')
+    while True:
+        if header is not None and _starts_with(file_path, header, encoding):
+            header = None
+        state = {"changed": False}
+        lines = _transformed_lines(
+            iter_file_lines(file_path, encoding), header, head_lines, body, line_transforms, insert_line, state)
+        try:
+            return write_lines_atomic(file_path, lines, lambda: state["changed"], *(output or (encoding, newline)))
+        except UnicodeDecodeError:
+            if encoding == FALLBACK_ENCODING:
+                raise
+            encoding = FALLBACK_ENCODING
+        except UnicodeEncodeError:
+            if output is not None:
+                raise
+            logger.warning(f"Text cannot be encoded as {encoding}, writing UTF-8 instead: {file_path}")
+            output = ('utf-8', newline)
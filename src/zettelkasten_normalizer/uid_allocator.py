@@ -0,0 +1,182 @@
+"""
+UID allocation for Zettelkasten note normalization.
+
+The names of the files in the vault are collected once, from the vault scan
+or the manifest, and UIDs are handed out against that set, so renaming a
+batch of notes needs no filesystem probes. UIDs that have been handed out
+are reserved, so a batch never gets the same UID twice.
+
+Three strategies are available:
+- uuid4: 32 random hexadecimal digits (the default)
+- timestamp: the creation date as yyyymmddhhmmss, counted up by one second
+  while it is taken
+- content: the first 32 hexadecimal digits of the SHA-256 of the content,
+  so the same note always gets the same UID
+
+Notes are hashed in one canonical form, the decoded text with LF line
+endings as read_file_cross_platform() returns it (manifest.hash_content()),
+whether they are loaded, streamed or renamed by the staged run. Images are
+hashed as bytes.
+"""
+
+import os
+import re
+import uuid
+import hashlib
+import itertools
+import logging
+from .config import UID_STRATEGY
+from .utils import get_file_name, get_creation_date, format_uid_from_date, path_exists, iter_file_lines, sniff_file_format, FALLBACK_ENCODING
+from .file_operations import build_filepath_by_uid, check_note_type
+from .manifest import hash_content
+from . import stats
+
+# Get logger
+logger = logging.getLogger(__name__)
+
+UID_STRATEGIES = ("uuid4", "timestamp", "content")
+
+HEX_UID_PATTERN = re.compile(r"^[a-f0-9]{32}$")
+TIMESTAMP_UID_PATTERN = re.compile(r"^[0-9]{14}$")
+
+# UID strategy of the current run
+_uid_strategy = UID_STRATEGY
+
+
+def set_uid_strategy(strategy):
+    """Set the UID strategy used for the rest of the run"""
+    global _uid_strategy
+    if strategy not in UID_STRATEGIES:
+        raise ValueError(f"Unsupported UID strategy: {strategy}")
+    _uid_strategy = strategy
+
+
+def get_uid_strategy():
+    """UID strategy of the current run"""
+    return _uid_strategy
+
+
+def is_uid(name, strategy=None):
+    """Whether a file name (without extension) is already a UID.
+    Hexadecimal UIDs are accepted with every strategy, so switching to
+    timestamps does not rename the notes again."""
+    if HEX_UID_PATTERN.match(name):
+        return True
+    return (strategy or _uid_strategy) == "timestamp" and TIMESTAMP_UID_PATTERN.match(name) is not None
+
+
+def _hash_file(file):
+    """SHA-256 of the bytes of a file, read in blocks so large notes are never loaded whole"""
+    digest = hashlib.sha256()
+    size = 0
+    with open(file, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+            size += len(block)
+    stats.record_read(size)
+    return digest.hexdigest()
+
+
+def _hash_note_lines(file, encoding):
+    """SHA-256 of the lines of a note decoded with encoding"""
+    digest = hashlib.sha256()
+    for line in iter_file_lines(file, encoding):
+        digest.update(line.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def hash_note_file(file):
+    """SHA-256 of the text of a note, the same as hash_content() of the content
+    read_file_cross_platform() returns, computed line by line"""
+    encoding = sniff_file_format(file)[0]
+    try:
+        return _hash_note_lines(file, encoding)
+    except UnicodeDecodeError:
+        return _hash_note_lines(file, FALLBACK_ENCODING)
+
+
+def hash_file_content(file):
+    """Digest the content strategy uses for a file that is not in memory"""
+    if check_note_type(file, "note"):
+        return hash_note_file(file)
+    return _hash_file(file)
+
+
+def content_digests(files):
+    """Digests of the files without a UID, for the content strategy only.
+    The staged run takes them before its first stage rewrites the notes."""
+    if _uid_strategy != "content":
+        return None
+    return {file: hash_file_content(file) for file in files if not is_uid(get_file_name(file)[1])}
+
+
+class UidAllocator:
+    """Hands out UIDs that are not used by any file of the vault."""
+
+    def __init__(self, used=(), strategy=None, probe=False):
+        """Initialize with the names (without extension) already in use.
+        With probe, candidates are also checked on disk, for files the names
+        may not cover."""
+        self.strategy = strategy or _uid_strategy
+        if self.strategy not in UID_STRATEGIES:
+            raise ValueError(f"Unsupported UID strategy: {self.strategy}")
+        self.used = set(used)
+        self.probe = probe
+
+    @classmethod
+    def from_scan(cls, scan, strategy=None):
+        """Allocator for the names of the notes and images of a VaultScan"""
+        return cls((get_file_name(file)[1] for file in scan.notes + scan.images), strategy)
+
+    @classmethod
+    def from_manifest(cls, manifest, files=(), strategy=None):
+        """Allocator for the names recorded in the manifest and the given files.
+        Files the manifest does not know yet may exist, so candidates are probed
+        (through the stat cache of the run)."""
+        names = [os.path.splitext(os.path.basename(key))[0] for key in manifest.entries]
+        names.extend(get_file_name(file)[1] for file in files)
+        return cls(names, strategy, probe=True)
+
+    def is_uid(self, name):
+        """Whether a file name (without extension) is already a UID"""
+        return is_uid(name, self.strategy)
+
+    def _candidates(self, file, content, digest=None):
+        """UIDs to try for a file, in order"""
+        if self.strategy == "uuid4":
+            while True:
+                yield uuid.uuid4().hex
+        elif self.strategy == "timestamp":
+            unix_time = int(get_creation_date(file))
+            while True:
+                yield format_uid_from_date(unix_time)
+                unix_time += 1
+        else:
+            if digest is None:
+                digest = hash_file_content(file) if content is None else hash_content(content)
+            yield digest[:32]
+            # Notes with the same content get the next hash in a deterministic chain
+            for count in itertools.count(1):
+                yield hashlib.sha256((digest + "\0" + str(count)).encode()).hexdigest()[:32]
+
+    def allocate(self, file, content=None, path=None, ext=None, digest=None):
+        """Return a new UID for a file and reserve it.
+        The content strategy uses digest (see hash_file_content()), or else
+        the hash of content; the file is read if neither is given."""
+        for uid in self._candidates(file, content, digest):
+            if uid in self.used:
+                continue
+            if self.probe and path_exists(build_filepath_by_uid(uid, path, ext)):
+                continue
+            self.used.add(uid)
+            return uid
+
+    def new_filepath(self, file, root_path, content=None, digest=None):
+        """Return the path of a file renamed to a new UID.
+        Markdown notes are moved to the root folder, other files keep their folder."""
+        ext = get_file_name(file)[2]
+        if ext == ".md":
+            path = root_path
+        else:
+            path = os.path.dirname(file)
+        return build_filepath_by_uid(self.allocate(file, content, path, ext, digest), path, ext)
@@ -3,17 +3,78 @@ Utility functions for Zettelkasten note normalization.
 """
 
 import os
+import re
+import errno
 import datetime
 import platform
 import unicodedata
 import logging
 import sys
+import stat
+import codecs
+import mmap
+import tempfile
+import hashlib
+import queue
+import atexit
+from contextlib import contextmanager
 from logging import Formatter
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
+from .config import ATOMIC_WRITES, FSYNC_WRITES, KEEP_FILE_FORMAT, PREFILTER_MMAP_BYTES
+from .config import LOG_FILE, LOG_LEVEL, LOG_MAX_BYTES, LOG_BACKUP_COUNT
+from . import stats
 
+# The umask is needed to give new files the usual permissions (mkstemp uses 0600)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
 
-def setup_logger(log_dir):
-    """setup logger"""
+# fsync settings of the current run and the folders whose entries still need syncing
+_fsync_enabled = FSYNC_WRITES
+_pending_sync_dirs = set()
+
+# Whether files are written back in the format they were read with, and the
+# (encoding, newline) of the files that were not read as UTF-8 with LF
+_keep_file_format = KEEP_FILE_FORMAT
+_file_formats = {}
+
+# Encoding of files that are not valid UTF-8; every byte sequence decodes, so they round-trip exactly
+FALLBACK_ENCODING = 'latin-1'
+
+# Background writer of the log file and the root handlers installed by setup_logger
+_log_listener = None
+_log_handlers = []
+
+# The platform does not change during a run
+IS_WINDOWS = platform.system() == "Windows"
+
+# Stat cache of the current run (None outside of stat_cache())
+_stat_cache = None
+# Marks a cached entry that has to be stat'ed again
+_STALE = object()
+
+
+# Levels that can be chosen for the log file
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+
+
+def parse_log_level(level):
+    """Return the logging level of a name such as "DEBUG" (or of a level number)"""
+    if isinstance(level, int):
+        return level
+    value = logging.getLevelName(str(level).upper())
+    if not isinstance(value, int):
+        raise ValueError(f"Unknown log level: {level}")
+    return value
+
+
+def setup_logger(log_dir, level=None, quiet=False):
+    """setup logger.
+    The log file is written by a QueueListener in a background thread, so
+    the stages only put records on a queue. level is the level of the log
+    file (default: LOG_LEVEL); with quiet, the console only shows warnings
+    and errors. The console is written directly, so messages appear before
+    a question is asked."""
+    global _log_listener, _log_handlers
     if os.path.isdir(log_dir):
         # Normalize path for cross-platform compatibility
         log_dir = normalize_path(log_dir)
@@ -22,33 +83,60 @@ def setup_logger(log_dir):
         print("Abort the process")
         print("You can see how to use it with the -h option")
         sys.exit()
+    file_level = parse_log_level(LOG_LEVEL if level is None else level)
+    console_level = logging.WARNING if quiet else logging.INFO
     log_file_format = "%(asctime)s [%(levelname)s] %(message)s"
     log_console_format = "%(message)s"
     # main logger
     logger = logging.getLogger(__name__)
     # console handler
     console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.INFO)
+    console_handler.setLevel(console_level)
     console_handler.setFormatter(Formatter(log_console_format))
-    # logger.addHandler(console_handler)
     
     # Create log file path with proper separator
-    log_file_path = os.path.join(log_dir, "normalization_zettel.log")
+    log_file_path = os.path.join(log_dir, LOG_FILE)
     file_handler = RotatingFileHandler(
-        log_file_path, maxBytes=1000000, backupCount=3
+        log_file_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
     )
-    file_handler.setLevel(logging.DEBUG)
+    file_handler.setLevel(file_level)
     file_handler.setFormatter(Formatter(log_file_format))
 
-    # common config
-    logging.basicConfig(
-        level=logging.DEBUG,
-        format="%(asctime)s [%(levelname)s] %(message)s",
-        handlers=[console_handler, file_handler],
-    )
+    # Replace the handlers of an earlier setup
+    stop_logger()
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.setLevel(file_level)
+    _log_listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+    _log_listener.start()
+    _log_handlers = [console_handler, queue_handler]
+    root_logger = logging.getLogger()
+    for handler in _log_handlers:
+        root_logger.addHandler(handler)
+    # Records no handler would write are not even created
+    root_logger.setLevel(min(console_level, file_level))
     return logger
 
 
+def stop_logger():
+    """Remove the handlers of setup_logger, writing the queued log records first"""
+    global _log_listener, _log_handlers
+    root_logger = logging.getLogger()
+    for handler in _log_handlers:
+        root_logger.removeHandler(handler)
+    _log_handlers = []
+    if _log_listener is None:
+        return
+    listener, _log_listener = _log_listener, None
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+# Queued records are written before the interpreter exits
+atexit.register(stop_logger)
+
+
 def get_file_name(file_path):
     """Retrieves a file name from the specified path. The format of the return value is as below:
     ('filename.ext', 'filename', '.ext')"""
@@ -78,23 +166,108 @@ def format_uid_from_date(unix_time):
     return date_value.strftime("%Y%m%d%H%M%S")
 
 
-def get_creation_date(file):
+class StatCache:
+    """Stat results of one run, keyed by absolute path.
+    Entries are DirEntry objects from the vault scan, stat results, or None
+    for files known not to exist. A folder whose listing has been seeded
+    answers for its missing files without a syscall."""
+
+    def __init__(self):
+        """Initialize an empty cache."""
+        self.entries = {}
+        self.listed_dirs = set()
+
+    def seed_directory(self, dir_name, entries):
+        """Add the DirEntry objects of a complete folder listing"""
+        for entry in entries:
+            self.entries.setdefault(os.path.abspath(entry.path), entry)
+        self.listed_dirs.add(os.path.abspath(dir_name))
+
+    def stat(self, path):
+        """Return the stat result of a file, calling os.stat at most once"""
+        key = os.path.abspath(path)
+        entry = self.entries.get(key, _STALE)
+        if entry is _STALE and key not in self.entries and os.path.dirname(key) in self.listed_dirs:
+            entry = None
+        if entry is None:
+            raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+        if isinstance(entry, os.DirEntry):
+            # DirEntry caches its stat result after the first call
+            return entry.stat()
+        if entry is _STALE:
+            try:
+                entry = os.stat(path)
+            except FileNotFoundError:
+                self.entries[key] = None
+                raise
+            self.entries[key] = entry
+        return entry
+
+    def invalidate(self, path):
+        """Forget the stat result of a file that has been written, renamed or created"""
+        self.entries[os.path.abspath(path)] = _STALE
+
+
+@contextmanager
+def stat_cache():
+    """Cache stat results until the end of the block.
+    A nested block shares the cache of the outer one."""
+    global _stat_cache
+    if _stat_cache is not None:
+        yield _stat_cache
+        return
+    _stat_cache = StatCache()
+    try:
+        yield _stat_cache
+    finally:
+        _stat_cache = None
+
+
+def get_stat_cache():
+    """Return the active stat cache, or None"""
+    return _stat_cache
+
+
+def get_file_stat(file_path):
+    """stat a file, through the stat cache of the run if there is one"""
+    if _stat_cache is None:
+        return os.stat(file_path)
+    return _stat_cache.stat(file_path)
+
+
+def path_exists(path):
+    """os.path.exists answered from the stat cache when possible"""
+    try:
+        get_file_stat(path)
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+def invalidate_stat(path):
+    """Make the next get_file_stat of a changed file call os.stat again"""
+    if _stat_cache is not None:
+        _stat_cache.invalidate(path)
+
+
+def get_creation_date(file, file_stat=None):
     """Try to get the date that a file was created, falling back to when it was
-    last modified if that isn't possible."""
-    if platform.system() == "Windows":
-        return os.path.getctime(file)
-    else:
-        stat = os.stat(file)
-        try:
-            return stat.st_birthtime
-        except AttributeError:
-            # On Linux, the file creation date is not available, so use the modification date
-            return stat.st_mtime
+    last modified if that isn't possible. A stat result read earlier can be given."""
+    stat = file_stat if file_stat is not None else get_file_stat(file)
+    if IS_WINDOWS:
+        return stat.st_ctime
+    try:
+        return stat.st_birthtime
+    except AttributeError:
+        # On Linux, the file creation date is not available, so use the modification date
+        return stat.st_mtime
 
 
-def get_modification_date(unix_time):
+def get_modification_date(unix_time, file_stat=None):
     """try to get the date that a file was changed"""
-    return os.path.getmtime(unix_time)
+    if file_stat is not None:
+        return file_stat.st_mtime
+    return get_file_stat(unix_time).st_mtime
 
 
 def query_yes_no(question, default="yes"):
@@ -124,35 +297,393 @@ def query_yes_no(question, default="yes"):
 
 def normalize_line_endings(content):
     """Normalize line endings to Unix style (LF) regardless of platform"""
+    if '\r' not in content:
+        # Nothing to replace, so the content is not copied
+        return content
     # Replace Windows CRLF and old Mac CR with Unix LF
     content = content.replace('\r\n', '\n')  # Windows CRLF -> LF
     content = content.replace('\r', '\n')    # Old Mac CR -> LF
     return content
 
 
+def detect_newline(text):
+    """Return the first line break of the text (CRLF, CR or LF), or LF if there is none"""
+    cr = text.find('\r')
+    lf = text.find('\n')
+    if cr == -1 or (lf != -1 and lf < cr):
+        return '\n'
+    return '\r\n' if text.startswith('\r\n', cr) else '\r'
+
+
+def detect_encoding(data, encoding='utf-8'):
+    """Return the encoding to decode the start of a file with: UTF-8 with a
+    byte order mark, or else encoding. Whether the rest decodes is up to the caller"""
+    if encoding == 'utf-8' and data.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    return encoding
+
+
+def decode_bytes(data, encoding='utf-8'):
+    """Decode the bytes of a file, falling back to FALLBACK_ENCODING if they are not valid.
+    Returns the text and the encoding that was used"""
+    encoding = detect_encoding(data, encoding)
+    try:
+        return data.decode(encoding), encoding
+    except UnicodeDecodeError:
+        return data.decode(FALLBACK_ENCODING), FALLBACK_ENCODING
+
+
+def keep_file_format(enabled=True):
+    """Write files back in the encoding and line endings they were read with,
+    or always as UTF-8 with LF"""
+    global _keep_file_format
+    _keep_file_format = enabled
+    _file_formats.clear()
+
+
+def is_file_format_kept():
+    """Whether files are written back in the format they were read with"""
+    return _keep_file_format
+
+
+def remember_file_format(file_path, encoding, newline):
+    """Remember the format a file was read or written with"""
+    key = os.path.abspath(file_path)
+    if _keep_file_format and (encoding, newline) != ('utf-8', '\n'):
+        _file_formats[key] = (encoding, newline)
+    else:
+        _file_formats.pop(key, None)
+
+
+def get_file_format(file_path):
+    """Return the (encoding, newline) a file was read with, or None for UTF-8
+    with LF (and when formats are not kept)"""
+    return _file_formats.get(os.path.abspath(file_path))
+
+
+def move_file_format(old_file_path, new_file_path):
+    """Carry the format of a renamed file over to its new path"""
+    file_format = _file_formats.pop(os.path.abspath(old_file_path), None)
+    if file_format is not None:
+        _file_formats[os.path.abspath(new_file_path)] = file_format
+
+
 def read_file_cross_platform(file_path, encoding='utf-8'):
-    """Read file with cross-platform line ending normalization"""
+    """Read file with cross-platform line ending normalization.
+    The file is read once as bytes; if they are not valid in encoding, the
+    same bytes are decoded with FALLBACK_ENCODING. The encoding and line
+    endings are remembered, so write_file_cross_platform can keep them"""
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    stats.record_read(len(data))
+    content, encoding = decode_bytes(data, encoding)
+    remember_file_format(file_path, encoding, detect_newline(content))
+    # Normalize line endings
+    return normalize_line_endings(content)
+
+
+def sniff_file_format(file_path, size=64 * 1024):
+    """Return the encoding with which to start decoding a file (UTF-8 with
+    or without byte order mark) and its line break, from its first bytes"""
+    with open(file_path, 'rb') as f:
+        data = f.read(size)
+    return detect_encoding(data), detect_newline(data.decode(FALLBACK_ENCODING))
+
+
+def encode_content(content, encoding='utf-8', newline='\n'):
+    """Encode normalized text with the given encoding and line break.
+    Text that the encoding cannot hold is written as UTF-8"""
+    if newline != '\n':
+        content = content.replace('\n', newline)
+    try:
+        return content.encode(encoding), encoding
+    except UnicodeEncodeError:
+        logging.getLogger(__name__).warning(f"Text cannot be encoded as {encoding}, writing UTF-8 instead")
+        return content.encode('utf-8'), 'utf-8'
+
+
+def iter_file_lines(file_path, encoding='utf-8'):
+    """Yield the lines of a file with line ending normalization, without reading it as a whole.
+    Every line ends with a line break, except a last line that has none in the file.
+    Decoding errors are raised, so the caller can start again with another encoding"""
+    # The text layer decodes incrementally, and with newline='' it also splits
+    # at CR and CRLF without splitting a CRLF across two reads
+    with open(file_path, 'r', encoding=encoding, newline='') as f:
+        for line in f:
+            if line[-1] == '\r':
+                line = line[:-1] + '\n'
+            elif line.endswith('\r\n'):
+                line = line[:-2] + '\n'
+            yield line
+        stats.record_read(os.fstat(f.fileno()).st_size)
+
+
+def _trie_pattern(node):
+    """Regular expression matching the byte strings of a trie node"""
+    if node is None:
+        # A shorter needle ends here, so the longer ones need not be matched
+        return b''
+    branches = [re.escape(bytes([byte])) + _trie_pattern(child) for byte, child in sorted(node.items())]
+    if len(branches) == 1:
+        return branches[0]
+    return b'(?:' + b'|'.join(branches) + b')'
+
+
+def encode_search_terms(terms):
+    """Compile text to search for in raw file contents into one pattern.
+    Every form a term can take in a note is included: UTF-8 in NFC and NFD,
+    and Latin-1 for the notes that read_file_cross_platform falls back for.
+    The needles are merged into a trie, so a search tries the prefixes they
+    share only once instead of every needle at every position."""
+    needles = set()
+    for term in terms:
+        for form in ("NFC", "NFD"):
+            needles.add(unicodedata.normalize(form, term).encode('utf-8'))
+        try:
+            needles.add(term.encode('latin-1'))
+        except UnicodeEncodeError:
+            pass
+    needles.discard(b'')
+    if not needles:
+        return re.compile(b'(?!)')
+    trie = {}
+    for needle in sorted(needles, key=len):
+        node = trie
+        for byte in needle[:-1]:
+            child = node.setdefault(byte, {})
+            if child is None:
+                break
+            node = child
+        else:
+            node[needle[-1]] = None
+    return re.compile(_trie_pattern(trie))
+
+
+def file_contains_any(file_path, needles):
+    """Whether the raw bytes of a file contain any of the needles
+    (compiled by encode_search_terms). Nothing is decoded; large files are
+    memory-mapped instead of read"""
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return False
+        stats.record_read(size)
+        if size < PREFILTER_MMAP_BYTES:
+            return needles.search(f.read()) is not None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return needles.search(data) is not None
+
+
+def has_same_bytes(file_path, data):
+    """Whether the file already contains exactly these bytes"""
+    try:
+        if get_file_stat(file_path).st_size != len(data):
+            return False
+        with open(file_path, 'rb') as f:
+            return f.read() == data
+    except OSError:
+        return False
+
+
+def enable_fsync(enabled=True):
+    """Make the following writes durable: files are fsynced before they are
+    renamed into place and their folders are fsynced by sync_directories()"""
+    global _fsync_enabled
+    _fsync_enabled = enabled
+
+
+def _copy_file_metadata(file_stat, file_path, temp_path):
+    """Give the temporary file the owner and extended attributes (including
+    ACLs) of the file it replaces, as far as the platform and permissions allow"""
+    if hasattr(os, "geteuid") and (file_stat.st_uid, file_stat.st_gid) != (os.geteuid(), os.getegid()):
+        try:
+            os.chown(temp_path, file_stat.st_uid, file_stat.st_gid)
+        except OSError:
+            pass
+    if hasattr(os, "listxattr"):
+        try:
+            names = os.listxattr(file_path)
+        except OSError:
+            return
+        for name in names:
+            try:
+                os.setxattr(temp_path, name, os.getxattr(file_path, name))
+            except OSError:
+                pass
+
+
+def _write_atomic(file_path, write):
+    """Write to a temporary file next to the target with write(f) and rename it into place,
+    so the target is never left half-written. If write returns False, the
+    temporary file is removed instead. A symbolic link is kept and the file
+    it points to is replaced. Returns whether the target was replaced"""
+    if os.path.islink(file_path):
+        file_path = os.path.realpath(file_path)
+    dir_name = os.path.dirname(file_path) or "."
+    try:
+        file_stat = get_file_stat(file_path)
+        mode = stat.S_IMODE(file_stat.st_mode)
+    except OSError:
+        file_stat = None
+        mode = 0o666 & ~_UMASK
+    # The temporary file is hidden, so it is never picked up as a note
+    fd, temp_path = tempfile.mkstemp(dir=dir_name, prefix="." + os.path.basename(file_path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            keep = write(f)
+            if keep is not False and _fsync_enabled:
+                f.flush()
+                os.fsync(f.fileno())
+        if keep is False:
+            os.remove(temp_path)
+            return False
+        os.chmod(temp_path, mode)
+        if file_stat is not None:
+            _copy_file_metadata(file_stat, file_path, temp_path)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    schedule_directory_sync(file_path)
+    return True
+
+
+def write_file_atomic(file_path, data):
+    """Write bytes to a temporary file next to the target and rename it into place,
+    so the target is never left half-written"""
+    _write_atomic(file_path, lambda f: f.write(data))
+
+
+def write_lines_atomic(file_path, lines, changed, encoding='utf-8', newline='\n'):
+    """Write text lines (e.g. of a note that is transformed while it is read)
+    to a temporary file next to the target and rename it into place.
+    The lines end with LF, which is replaced by newline. The target may be
+    the file the lines are read from, so a temporary file is used even
+    without ATOMIC_WRITES. changed() is called once all lines are written;
+    if it returns False, the target is left as it is. Encoding errors are
+    raised, so the caller can start again with another encoding.
+    Returns whether the file was written"""
+    nbytes = 0
+    # Only the first line carries the byte order mark
+    encoder = codecs.getincrementalencoder(encoding)()
+
+    def write(f):
+        nonlocal nbytes
+        for line in lines:
+            if newline != '\n':
+                line = line.replace('\n', newline)
+            data = encoder.encode(line)
+            f.write(data)
+            nbytes += len(data)
+        return bool(changed())
+
+    try:
+        written = _write_atomic(file_path, write)
+    finally:
+        invalidate_stat(file_path)
+    if written:
+        stats.record_write(nbytes)
+    else:
+        stats.record("writes_skipped")
+    return written
+
+
+def is_fsync_enabled():
+    """Whether writes are made durable with fsync"""
+    return _fsync_enabled
+
+
+def schedule_directory_sync(file_path):
+    """Remember the folder of a renamed or created file for sync_directories()"""
+    if _fsync_enabled:
+        _pending_sync_dirs.add(os.path.dirname(file_path) or ".")
+
+
+def sync_directories():
+    """fsync every folder written to since the last call, once per folder"""
+    dir_names = sorted(_pending_sync_dirs)
+    _pending_sync_dirs.clear()
+    if not hasattr(os, "O_DIRECTORY"):
+        # Folders cannot be opened on Windows; os.replace is enough there
+        return 0
+    for dir_name in dir_names:
+        try:
+            fd = os.open(dir_name, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            logging.getLogger(__name__).warning(f"Failed to sync folder {dir_name}: {e}")
+    return len(dir_names)
+
+
+def read_file_head(file_path, size, encoding='utf-8'):
+    """Read at most size bytes from the start of a file, with line ending normalization.
+    Returns the text and whether the whole file has been read"""
+    with open(file_path, 'rb') as f:
+        data = f.read(size)
+        complete = len(data) < size or not f.read(1)
+    stats.record_read(len(data))
     try:
-        with open(file_path, 'r', encoding=encoding, newline='') as f:
-            content = f.read()
-        # Normalize line endings
-        return normalize_line_endings(content)
+        # An incomplete character at the cut is left out
+        content = codecs.getincrementaldecoder(detect_encoding(data, encoding))().decode(data, final=complete)
     except UnicodeDecodeError:
-        # Fallback to different encoding if UTF-8 fails
-        with open(file_path, 'r', encoding='latin-1', newline='') as f:
-            content = f.read()
-        return normalize_line_endings(content)
+        content = data.decode(FALLBACK_ENCODING)
+    return normalize_line_endings(content), complete
 
 
-def write_file_cross_platform(file_path, content, encoding='utf-8'):
-    """Write file with cross-platform line ending handling"""
+def _is_unchanged(file_path, content, data, encoding, newline, original, original_hash):
+    """Whether writing data would leave the file as it is.
+    The new content is compared with the content the file was read with, or
+    its SHA-256, so the file is only read again when neither is known, or when
+    the content is the same but the format it was read with is not known."""
+    if original is not None:
+        same_text = content == normalize_line_endings(original)
+    elif original_hash is not None:
+        same_text = hashlib.sha256(content.encode('utf-8')).hexdigest() == original_hash
+    else:
+        return has_same_bytes(file_path, data)
+    if not same_text:
+        return False
+    if _keep_file_format and (get_file_format(file_path) or ('utf-8', '\n')) == (encoding, newline):
+        return True
+    return has_same_bytes(file_path, data)
+
+
+def write_file_cross_platform(file_path, content, encoding=None, newline=None, original=None, original_hash=None):
+    """Write file with cross-platform line ending handling.
+    Without an encoding and newline, the file is written in the format it
+    was read with (UTF-8 with LF for files that were not read).
+    Nothing is written if the file already has this content; pass the content
+    it was read with (original) or its SHA-256 (original_hash, as
+    manifest.hash_content()) so it does not have to be read again.
+    Returns whether the file was written."""
     # Ensure content uses Unix line endings
     content = normalize_line_endings(content)
-    
-    # On Windows, let Python handle the conversion to CRLF automatically
-    # On Unix systems, keep LF as is
-    with open(file_path, 'w', encoding=encoding, newline='\n') as f:
-        f.write(content)
+    if encoding is None and newline is None:
+        encoding, newline = get_file_format(file_path) or ('utf-8', '\n')
+
+    # Write the encoded bytes as is, so the line endings are the same on every platform
+    data, encoding = encode_content(content, encoding or 'utf-8', newline or '\n')
+    unchanged = _is_unchanged(file_path, content, data, encoding, newline or '\n', original, original_hash)
+    remember_file_format(file_path, encoding, newline or '\n')
+    if unchanged:
+        stats.record("writes_skipped")
+        return False
+    try:
+        if ATOMIC_WRITES:
+            write_file_atomic(file_path, data)
+        else:
+            with open(file_path, 'wb') as f:
+                f.write(data)
+    finally:
+        invalidate_stat(file_path)
+    stats.record_write(len(data))
+    return True
 
 
 def get_platform_path_separator():
@@ -162,4 +693,14 @@ def get_platform_path_separator():
 
 def normalize_path(path):
     """Normalize path separators for the current platform"""
-    return os.path.normpath(path)
\ No newline at end of file
+    return os.path.normpath(path)
+
+
+def to_root_relative(path, root_path):
+    """Path relative to the root folder with "/" separators, as stored in plans and journals"""
+    return os.path.relpath(path, root_path).replace(os.sep, "/")
+
+
+def from_root_relative(path, root_path):
+    """Path of a file stored with to_root_relative()"""
+    return os.path.join(root_path, *path.split("/"))
\ No newline at end of file
@@ -0,0 +1,363 @@
+"""
+Persistent SQLite index of a vault for Zettelkasten note normalization.
+
+The index is stored in the root folder and holds every note and image with
+its UID, title, aliases and tags, and the links between the notes. Each
+link is stored with its target name and the path of the file it resolves
+to. Runs with --index keep it up to date, and backlinks are found with an
+indexed query instead of scanning the vault. Other tools can query it
+without parsing Markdown.
+
+Paths are relative to the root folder, with "/" separators.
+"""
+
+import os
+import sqlite3
+import logging
+from .config import INDEX_FILE
+from .utils import to_root_relative, from_root_relative, get_file_name, read_file_cross_platform, get_file_stat
+from .manifest import extract_note_metadata, hash_content
+from .parallel import prefetch
+from .streaming import NoteSummary, is_large_note, summarize_note
+
+# Get logger
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    path TEXT PRIMARY KEY,
+    file_name TEXT NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    uid TEXT,
+    title TEXT,
+    format TEXT,
+    size INTEGER,
+    mtime REAL,
+    hash TEXT
+);
+CREATE INDEX IF NOT EXISTS notes_file_name ON notes (file_name);
+CREATE INDEX IF NOT EXISTS notes_name ON notes (name);
+CREATE INDEX IF NOT EXISTS notes_uid ON notes (uid);
+CREATE INDEX IF NOT EXISTS notes_title ON notes (title);
+CREATE TABLE IF NOT EXISTS aliases (
+    path TEXT NOT NULL,
+    alias TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS aliases_path ON aliases (path);
+CREATE INDEX IF NOT EXISTS aliases_alias ON aliases (alias);
+CREATE TABLE IF NOT EXISTS tags (
+    path TEXT NOT NULL,
+    tag TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tags_path ON tags (path);
+CREATE INDEX IF NOT EXISTS tags_tag ON tags (tag);
+CREATE TABLE IF NOT EXISTS links (
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    resolved TEXT
+);
+CREATE INDEX IF NOT EXISTS links_source ON links (source);
+CREATE INDEX IF NOT EXISTS links_target ON links (target);
+CREATE INDEX IF NOT EXISTS links_resolved ON links (resolved);
+"""
+
+# Sources and target names whose links have to be resolved again, filled before every update
+CHANGES_SCHEMA = """
+CREATE TEMP TABLE IF NOT EXISTS changed_sources (path TEXT PRIMARY KEY);
+CREATE TEMP TABLE IF NOT EXISTS changed_names (name TEXT PRIMARY KEY);
+"""
+
+# A link name resolves to the file with that name and extension, or else to the note with that name.
+# Only the links of changed notes and the links to names of added or removed files can change.
+RESOLVE_LINKS = """
+UPDATE links SET resolved = COALESCE(
+    (SELECT path FROM notes WHERE notes.file_name = links.target ORDER BY path LIMIT 1),
+    (SELECT path FROM notes WHERE notes.name = links.target AND notes.type = 'note' ORDER BY path LIMIT 1)
+)
+WHERE source IN (SELECT path FROM changed_sources) OR target IN (SELECT name FROM changed_names)
+"""
+
+
+def split_list_value(value):
+    """Return the items of a front matter list, which may be a list or a "[a, b]" string"""
+    if not value:
+        return []
+    if isinstance(value, (list, tuple)):
+        items = value
+    else:
+        value = str(value).strip()
+        if value.startswith("[") and value.endswith("]"):
+            items = value[1:-1].split(",")
+        else:
+            items = [value]
+    items = (str(item).strip().strip("\"'").strip() for item in items)
+    return list(dict.fromkeys(item for item in items if item))
+
+
+def _text(value):
+    """Front matter value as stored in a text column"""
+    return None if value is None else str(value)
+
+
+class VaultIndex:
+    """SQLite index of the notes, images and links of a vault, stored in the root folder."""
+
+    def __init__(self, root_path, path=None):
+        """Open (or create) the index of the root folder."""
+        self.root_path = root_path
+        self.path = path or os.path.join(root_path, INDEX_FILE)
+        self.connection = sqlite3.connect(self.path)
+        self.recorded = None  # path -> (size, mtime), loaded on demand
+        self.changed_sources = set()  # Notes recorded since the links were last resolved
+        self.changed_names = set()  # Names of the files added or removed since then
+        self._create_schema()
+
+    @classmethod
+    def open(cls, root_path):
+        """Open the index of the root folder"""
+        index = cls(root_path)
+        logger.info("Index loaded: " + str(index.count()) + " files")
+        return index
+
+    def _create_schema(self):
+        """Create the tables, rebuilding them if the index has another version"""
+        version = self.connection.execute("PRAGMA user_version").fetchone()[0]
+        if version not in (0, INDEX_VERSION):
+            logger.info("Index version has changed, the index will be rebuilt")
+            for table in ("notes", "aliases", "tags", "links"):
+                self.connection.execute("DROP TABLE IF EXISTS " + table)
+        self.connection.executescript(SCHEMA)
+        self.connection.execute(f"PRAGMA user_version = {INDEX_VERSION}")
+        self.connection.executescript(CHANGES_SCHEMA)
+        self.connection.commit()
+
+    def count(self):
+        """Number of indexed files"""
+        return self.connection.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+
+    def _key(self, path):
+        """Index entries are keyed by the path relative to the root"""
+        return to_root_relative(path, self.root_path)
+
+    def _paths(self, rows):
+        """Paths of the files of the first column of rows"""
+        return [from_root_relative(row[0], self.root_path) for row in rows]
+
+    def _load_recorded(self):
+        """Load the size and mtime of every indexed file"""
+        if self.recorded is None:
+            self.recorded = {
+                path: (size, mtime)
+                for path, size, mtime in self.connection.execute("SELECT path, size, mtime FROM notes")
+            }
+        return self.recorded
+
+    def is_unchanged(self, path, stat):
+        """Whether size and mtime of the file match its entry"""
+        return self._load_recorded().get(self._key(path)) == (stat.st_size, stat.st_mtime)
+
+    def changed_files(self, files, scan):
+        """Return the files that were added or changed since they were indexed.
+        The stat results of the VaultScan are used."""
+        changed = set()
+        for file in files:
+            try:
+                if self.is_unchanged(file, scan.stat(file)):
+                    continue
+            except OSError:
+                pass
+            changed.add(file)
+        return changed
+
+    def _name_changed(self, key):
+        """Resolve the links to the names of a file again, since it was added or removed"""
+        self.changed_names.update(get_file_name(key)[:2])
+
+    def _delete(self, key):
+        """Remove the rows of a file from every table"""
+        self.connection.execute("DELETE FROM notes WHERE path = ?", (key,))
+        self.connection.execute("DELETE FROM aliases WHERE path = ?", (key,))
+        self.connection.execute("DELETE FROM tags WHERE path = ?", (key,))
+        self.connection.execute("DELETE FROM links WHERE source = ?", (key,))
+        self._load_recorded().pop(key, None)
+
+    def record(self, path, stat, content=None, file_type="note", summary=None):
+        """Record the current state of a file.
+        Notes need their content, or the NoteSummary of a large note;
+        images are indexed by name only."""
+        key = self._key(path)
+        if key not in self._load_recorded():
+            self._name_changed(key)
+        self._delete(key)
+        self.changed_sources.add(key)
+        if summary is not None:
+            metadata = summary.metadata()
+            content_hash = summary.hash
+        elif content is not None:
+            metadata = extract_note_metadata(content)
+            content_hash = hash_content(content)
+        else:
+            metadata = {}
+            content_hash = None
+        file_names = get_file_name(path)
+        self.connection.execute(
+            "INSERT INTO notes (path, file_name, name, type, uid, title, format, size, mtime, hash) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                key, file_names[0], file_names[1], file_type,
+                _text(metadata.get("uid")), _text(metadata.get("title")), metadata.get("format"),
+                stat.st_size, stat.st_mtime, content_hash,
+            ),
+        )
+        self.connection.executemany(
+            "INSERT INTO aliases (path, alias) VALUES (?, ?)",
+            [(key, alias) for alias in split_list_value(metadata.get("aliases"))],
+        )
+        self.connection.executemany(
+            "INSERT INTO tags (path, tag) VALUES (?, ?)",
+            [(key, tag) for tag in split_list_value(metadata.get("tags"))],
+        )
+        self.connection.executemany(
+            "INSERT INTO links (source, target) VALUES (?, ?)",
+            [(key, name) for name in metadata.get("links", [])],
+        )
+        self._load_recorded()[key] = (stat.st_size, stat.st_mtime)
+
+    def remove(self, path):
+        """Forget a file (e.g. after it has been renamed)"""
+        key = self._key(path)
+        if key in self._load_recorded():
+            self._name_changed(key)
+        self._delete(key)
+
+    def prune(self, existing_files):
+        """Forget the files that no longer exist"""
+        existing = {self._key(file) for file in existing_files}
+        for key in list(self._load_recorded()):
+            if key not in existing:
+                self._name_changed(key)
+                self._delete(key)
+
+    def resolve_links(self):
+        """Resolve the target names of the links that may have changed since
+        the last call to the paths of the indexed files"""
+        self.connection.execute("DELETE FROM changed_sources")
+        self.connection.execute("DELETE FROM changed_names")
+        self.connection.executemany("INSERT INTO changed_sources (path) VALUES (?)", ((key,) for key in self.changed_sources))
+        self.connection.executemany("INSERT INTO changed_names (name) VALUES (?)", ((name,) for name in self.changed_names))
+        self.connection.execute(RESOLVE_LINKS)
+        self.changed_sources.clear()
+        self.changed_names.clear()
+
+    def commit(self):
+        """Write the changes to the index file"""
+        self.connection.commit()
+
+    def close(self):
+        """Close the index"""
+        self.connection.close()
+
+    def linking_files(self, names):
+        """Return the paths of the indexed notes that link to any of the names"""
+        names = list(names)
+        paths = set()
+        # Stay below the limit of SQLite on the number of query parameters
+        for start in range(0, len(names), 500):
+            chunk = names[start:start + 500]
+            rows = self.connection.execute(
+                "SELECT DISTINCT source FROM links WHERE target IN (" + ", ".join("?" * len(chunk)) + ")",
+                chunk,
+            )
+            paths.update(self._paths(rows))
+        return paths
+
+    def find(self, file_name=None, uid=None, title=None, alias=None):
+        """Return the paths of the files with the given file name (with or
+        without extension), uid, title or alias"""
+        if file_name is not None:
+            rows = self.connection.execute(
+                "SELECT path FROM notes WHERE file_name = ? UNION SELECT path FROM notes WHERE name = ?",
+                (file_name, file_name),
+            )
+        elif uid is not None:
+            rows = self.connection.execute("SELECT path FROM notes WHERE uid = ?", (uid,))
+        elif title is not None:
+            rows = self.connection.execute("SELECT path FROM notes WHERE title = ?", (title,))
+        elif alias is not None:
+            rows = self.connection.execute("SELECT DISTINCT path FROM aliases WHERE alias = ?", (alias,))
+        else:
+            raise ValueError("a file name, uid, title or alias is required")
+        return sorted(self._paths(rows))
+
+    def tagged(self, tag):
+        """Return the paths of the notes with a tag"""
+        rows = self.connection.execute("SELECT DISTINCT path FROM tags WHERE tag = ?", (tag,))
+        return sorted(self._paths(rows))
+
+    def tags(self, path):
+        """Return the tags of a note"""
+        rows = self.connection.execute("SELECT tag FROM tags WHERE path = ? ORDER BY rowid", (self._key(path),))
+        return [row[0] for row in rows]
+
+    def links(self, path):
+        """Return the paths of the files a note links to"""
+        rows = self.connection.execute(
+            "SELECT DISTINCT resolved FROM links WHERE source = ? AND resolved IS NOT NULL", (self._key(path),)
+        )
+        return sorted(self._paths(rows))
+
+    def backlinks(self, path):
+        """Return the paths of the notes linking to a file"""
+        rows = self.connection.execute("SELECT DISTINCT source FROM links WHERE resolved = ?", (self._key(path),))
+        return sorted(self._paths(rows))
+
+
+def _read_note_task(item):
+    """Return the content of a note to index: the content already in memory,
+    or the note read from disk (None if it cannot be read). Large notes are
+    summarized line by line instead. Images have no content."""
+    file, type, contents = item
+    if type != "note":
+        return None
+    if file in contents:
+        return contents[file]
+    try:
+        if is_large_note(get_file_stat(file)):
+            return summarize_note(file)
+        return read_file_cross_platform(file)
+    except Exception as e:
+        logger.error(f"Error reading file {file} for the index: {e}")
+        return None
+
+
+def update_vault_index(index, files, contents, removed=(), existing=None):
+    """Bring the index up to date with (file, type, stat) items.
+    contents maps the notes already in memory to their content; the other
+    notes are only read if they changed since they were indexed. removed
+    files are forgotten, and with existing (all files of the vault), every
+    other file is."""
+    logger.info("====== Start Updating Index ======")
+    if existing is not None:
+        index.prune(existing)
+    for file in removed:
+        index.remove(file)
+    pending = [(file, type, stat) for file, type, stat in files if not index.is_unchanged(file, stat)]
+    # Notes are recorded as they are read, so only the prefetch window is in memory
+    read_contents = prefetch(_read_note_task, [(file, type, contents) for file, type, stat in pending])
+    for (file, type, stat), content in zip(pending, read_contents):
+        if type == "note":
+            if content is None:
+                continue
+            if isinstance(content, NoteSummary):
+                index.record(file, stat, summary=content)
+            else:
+                index.record(file, stat, content)
+        else:
+            index.record(file, stat, file_type="image")
+    index.resolve_links()
+    index.commit()
+    logger.info(str(len(pending)) + " files have been indexed")
+    return len(pending)
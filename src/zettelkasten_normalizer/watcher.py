@@ -0,0 +1,239 @@
+"""
+Watch mode for Zettelkasten note normalization.
+
+The vault is normalized once, then filesystem events are collected (inotify
+on Linux, polling elsewhere) and only the notes and images that were created
+or modified are normalized. Events are debounced so that rapid editor saves
+coalesce into one run. The manifest stays in memory between runs and serves
+as the link and UID index, so renames update backlinks without rescanning
+the vault.
+"""
+
+import os
+import sys
+import time
+import errno
+import select
+import struct
+import logging
+import ctypes
+import ctypes.util
+from .config import EXCLUDE_DIR, EXCLUDE_FILE, WATCH_DEBOUNCE_SECONDS, WATCH_POLL_INTERVAL
+from .utils import normalize_path, stat_cache
+from .file_operations import scan_vault, check_note_type
+from .pipeline import run_pipeline
+from .manifest import VaultManifest
+
+# Get logger
+logger = logging.getLogger(__name__)
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def is_watched_dir(name):
+    """Whether files in a folder of this name are normalized"""
+    return name not in EXCLUDE_DIR and not name.startswith(".")
+
+
+def is_watched_file(path):
+    """Whether a file is a note or an image that is normalized"""
+    name = os.path.basename(path)
+    if name in EXCLUDE_FILE or name.startswith("."):
+        return False
+    return check_note_type(path, "note") or check_note_type(path, "image")
+
+
+class PollingWatcher:
+    """Detects changes by comparing size and mtime of the files at an interval."""
+
+    def __init__(self, root_path, interval=WATCH_POLL_INTERVAL):
+        """Take the first snapshot of the vault."""
+        self.root_path = root_path
+        self.interval = interval
+        self.snapshot = self._scan()
+        self.next_scan = time.monotonic() + interval
+
+    def _scan(self):
+        """Size and mtime of every note and image"""
+        snapshot = {}
+        scan = scan_vault(self.root_path)
+        for file in scan.notes + scan.images:
+            try:
+                stat = scan.stat(file)
+            except OSError:
+                continue
+            snapshot[file] = (stat.st_size, stat.st_mtime)
+        return snapshot
+
+    def poll(self, timeout):
+        """Return the paths that changed, waiting at most timeout seconds"""
+        wait = self.next_scan - time.monotonic()
+        if wait > 0:
+            time.sleep(min(wait, timeout))
+            if wait > timeout:
+                return set()
+        self.next_scan = time.monotonic() + self.interval
+        snapshot = self._scan()
+        changed = {file for file, state in snapshot.items() if self.snapshot.get(file) != state}
+        changed.update(file for file in self.snapshot if file not in snapshot)
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        """Nothing to release"""
+
+
+class InotifyWatcher:
+    """Receives change events from the Linux kernel through inotify."""
+
+    def __init__(self, root_path):
+        """Watch every folder of the vault."""
+        self.root_path = root_path
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}  # watch descriptor -> folder
+        self.overflowed = False
+        self._add_tree(root_path)
+
+    def _add_watch(self, path):
+        """Watch one folder"""
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                logger.warning("inotify watch limit reached, " + path + " is not watched"
+                               " (raise fs.inotify.max_user_watches)")
+            else:
+                logger.warning(f"Cannot watch {path}: {os.strerror(err)}")
+            return
+        self.watches[wd] = path
+
+    def _add_tree(self, path):
+        """Watch a folder and all its subfolders.
+        Returns the files already in them, which may have been missed."""
+        files = set()
+        for pathname, dirnames, filenames in os.walk(path, topdown=True):
+            dirnames[:] = [d for d in dirnames if is_watched_dir(d)]
+            self._add_watch(pathname)
+            files.update(os.path.join(pathname, f) for f in filenames)
+        return files
+
+    def poll(self, timeout):
+        """Return the paths that changed, waiting at most timeout seconds"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        data = os.read(self.fd, 64 * 1024)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, the caller has to rescan
+                self.overflowed = True
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            folder = self.watches.get(wd)
+            if folder is None or not name:
+                continue
+            path = os.path.join(folder, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and is_watched_dir(name):
+                    changed.update(self._add_tree(path))
+                continue
+            changed.add(path)
+        return changed
+
+    def close(self):
+        """Release the inotify descriptor"""
+        os.close(self.fd)
+
+
+def create_watcher(root_path, polling=False):
+    """Create an inotify watcher on Linux, or a polling watcher otherwise"""
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(root_path)
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify is not available ({e}), falling back to polling")
+    logger.info(f"Polling for changes every {WATCH_POLL_INTERVAL} seconds")
+    return PollingWatcher(root_path)
+
+
+def normalize_changed_files(paths, root_path, execution_functions, format_type, jobs, manifest):
+    """Normalize the notes and images that were created or modified.
+    Files written by the previous run match the manifest and are skipped."""
+    # The stat results of the change check are reused by the run
+    with stat_cache():
+        files = []
+        removed_cnt = 0
+        for path in sorted(paths):
+            if os.path.isfile(path):
+                if is_watched_file(path):
+                    files.append(path)
+            elif manifest.get(path) is not None:
+                manifest.remove(path)
+                removed_cnt += 1
+        files = manifest.filter_changed(files)
+        if not files:
+            if removed_cnt:
+                manifest.save()
+            return None
+        logger.info(str(len(files)) + " changed files have been detected")
+        return run_pipeline(root_path, root_path, execution_functions, format_type, jobs, manifest, files)
+
+
+def watch(root_path, execution_functions, format_type=None, jobs=1, polling=False,
+          debounce=WATCH_DEBOUNCE_SECONDS, watcher=None, max_batches=None):
+    """Normalize the vault, then keep normalizing the files that change.
+    Runs until interrupted, or until max_batches batches have been processed."""
+    root_path = normalize_path(root_path)
+    logger.info("====== Start Watch Mode ======")
+    manifest = VaultManifest.load(root_path)
+    if watcher is None:
+        watcher = create_watcher(root_path, polling)
+    run_pipeline(root_path, root_path, execution_functions, format_type, jobs, manifest)
+    logger.info("Watching " + root_path + " for changes (Ctrl+C to stop)")
+
+    batch_cnt = 0
+    pending = set()
+    last_event = 0.0
+    try:
+        while max_batches is None or batch_cnt < max_batches:
+            changed = watcher.poll(debounce if pending else WATCH_POLL_INTERVAL)
+            if getattr(watcher, "overflowed", False):
+                logger.warning("Too many events, rescanning the vault")
+                watcher.overflowed = False
+                run_pipeline(root_path, root_path, execution_functions, format_type, jobs, manifest)
+                pending.clear()
+                continue
+            if changed:
+                pending.update(changed)
+                last_event = time.monotonic()
+            elif pending and time.monotonic() - last_event >= debounce:
+                normalize_changed_files(pending, root_path, execution_functions, format_type, jobs, manifest)
+                pending = set()
+                batch_cnt += 1
+    finally:
+        watcher.close()
+    return batch_cnt
@@ -4,61 +4,217 @@ Supports YAML, TOML, and JSON formats.
 """
 
 import re
+import hashlib
 import logging
-from .config import YFM, INBOX_DIR, FRONT_MATTER_FORMAT
-from .utils import get_file_name, get_dir_name, format_date, get_creation_date, get_modification_date, read_file_cross_platform, write_file_cross_platform
+from .config import YFM, INBOX_DIR, FRONT_MATTER_FORMAT, FRONT_MATTER_HEAD_BYTES, FRONT_MATTER_MAX_BYTES
+from .utils import get_file_name, get_dir_name, format_date, get_creation_date, get_modification_date, read_file_cross_platform, read_file_head, write_file_cross_platform
 from .frontmatter_parser import FrontMatterParser, get_frontmatter_delimiters
+from .uid_allocator import is_uid
+from .progress import track
 
 # Get logger
 logger = logging.getLogger(__name__)
 
 
+# Hashtags and hashtag lines, matched in the whole content instead of line by line
+HASHTAG_PATTERN = re.compile(r"(\s|^)\#([^\s|^\#]+)", re.MULTILINE)
+HASHTAG_LINE_PATTERN = re.compile(r"^\#[^\#|^\s].+", re.MULTILINE)
+
+
 def create_tag_line_from_lines(lines):
-    """create tag line for YFM from hashtags"""
+    """create tag line for YFM from hashtags (lines or the whole content)"""
     logger.debug("checking tags...")
-    tag_line = ""
-    for line in lines:
-        for tag in re.findall("(\s|^)\#([^\s|^\#]+)", line):
-            if tag_line == "":
-                tag_line += str(tag[1])
-            else:
-                tag_line += ", " + str(tag[1])
-    tag_line = "[" + tag_line + "]"
-    return tag_line
+    if not isinstance(lines, str):
+        lines = '\n'.join(lines)
+    return format_tag_line(tag[1] for tag in HASHTAG_PATTERN.findall(lines))
 
 
-def writing_lines_without_hashtags(target, lines):
-    """writing lines without hashtags"""
+def format_tag_line(tags):
+    """Format hashtag names as the tag line of the YFM"""
+    return "[" + ", ".join(tags) + "]"
+
+
+def strip_hashtag_lines(lines):
+    """Return the content of the lines without hashtag lines"""
     # Convert string to lines if necessary
     if isinstance(lines, str):
         lines = lines.split('\n')
     
-    logger.debug("writing file...")
     content_lines = []
-    frontmatter_end_found = False
-    
-    for i, line in enumerate(lines):
-        # Check if this is the closing frontmatter delimiter
-        if not frontmatter_end_found and line.strip() in ['---', '+++', '}']:
-            # Check if the next line would be the empty line after frontmatter
-            if i + 1 < len(lines) and i > 0:
-                frontmatter_end_found = True
-        
-        # Delete the hashtag line (but preserve the line after frontmatter)
-        if not re.match("^\#[^\#|^\s].+", line):
+    for line in lines:
+        # Delete the hashtag line
+        if not HASHTAG_LINE_PATTERN.match(line):
             content_lines.append(line)
     
     # Join lines and ensure proper line endings
     content = '\n'.join(content_lines)
     
     # Remove excessive trailing newlines but keep at least one
-    content = content.rstrip('\n') + '\n'
-    
+    return content.rstrip('\n') + '\n'
+
+
+def writing_lines_without_hashtags(target, lines):
+    """writing lines without hashtags"""
+    logger.debug("writing file...")
     # Use cross-platform write function
-    write_file_cross_platform(target, content)
+    write_file_cross_platform(target, strip_hashtag_lines(lines))
     logger.debug("done!")
 
 
+def strip_hashtag_lines_from_body(content, body_start=0):
+    """Return the body of the content from body_start on without hashtag lines.
+    Leading line breaks are dropped and the body ends with one line break"""
+    body = content[body_start:].lstrip('\n')
+    if HASHTAG_LINE_PATTERN.search(body) is None:
+        # Nothing to remove, so the body is not split into lines
+        return body.rstrip('\n') + '\n'
+    return strip_hashtag_lines(body)
+
+
+def splice_frontmatter(metadata, content, body_start, parser):
+    """Put the serialized Front Matter in front of the body of the content,
+    removing the hashtag lines of the body, without splitting the whole note
+    into lines again"""
+    frontmatter = parser.format_frontmatter(metadata)
+    body = strip_hashtag_lines_from_body(content, body_start)
+    if body == '\n':
+        return frontmatter
+    return frontmatter + '\n' + body
+
+
+def default_uid(file_path):
+    """uid of a note that is not renamed: its file name if that is a UID,
+    otherwise a hash of its path"""
+    file_title = get_file_name(file_path)[1]
+    if is_uid(file_title):
+        return file_title
+    return hashlib.md5(file_path.encode()).hexdigest()
+
+
+def update_frontmatter_content(content, file_path, parser, file_stat=None, uid=None):
+    """Fill in missing Front Matter fields of a note that already has one.
+    uid is the UID the note is renamed to, written over any previous uid.
+    Returns the updated content, or None if there is nothing to update"""
+    # Parse existing front matter
+    metadata, body_start = parser.parse_frontmatter_span(content)
+    if metadata is None:
+        logger.debug("Failed to parse front matter, skipping")
+        return None
+    
+    if not update_frontmatter_metadata(metadata, file_path, create_tag_line_from_lines(content), file_stat, uid):
+        return None
+    
+    # Regenerate content with updated metadata
+    return splice_frontmatter(metadata, content, body_start, parser)
+
+
+def update_frontmatter_metadata(metadata, file_path, tag_line, file_stat=None, uid=None):
+    """Fill in missing fields of parsed Front Matter metadata, in place.
+    tag_line is used if the note has no tags yet.
+    Returns whether the metadata has been updated"""
+    # Check for missing fields and update
+    update_flg = False
+    
+    # Generate uid if not present, or use the UID of the new file name
+    if uid is not None:
+        if metadata.get("uid") != uid:
+            metadata["uid"] = uid
+            update_flg = True
+    elif "uid" not in metadata:
+        metadata["uid"] = default_uid(file_path)
+        update_flg = True
+    
+    required_fields = {
+        "title": get_file_name(file_path)[1],
+        "aliases": "[]",
+        "date": format_date(get_creation_date(file_path, file_stat)),
+        "update": format_date(get_modification_date(file_path, file_stat)),
+        "tags": tag_line,
+        "draft": "true" if get_dir_name(file_path)[1] in INBOX_DIR else "false"
+    }
+    
+    # Add missing fields
+    for key, default_value in required_fields.items():
+        if key not in metadata:
+            metadata[key] = default_value
+            update_flg = True
+            logger.debug(f"Added missing field: {key}")
+    
+    # Always update the 'update' field
+    if "update" in metadata:
+        old_update = metadata["update"]
+        new_update = format_date(get_modification_date(file_path, file_stat))
+        if old_update != new_update:
+            metadata["update"] = new_update
+            update_flg = True
+            logger.debug(f"Updated 'update' field: {old_update} -> {new_update}")
+    
+    return update_flg
+
+
+def create_frontmatter_content(content, file_path, parser, file_stat=None, uid=None):
+    """Return the content with newly created Front Matter.
+    uid is the UID the note is renamed to, if any"""
+    tag_line = create_tag_line_from_lines(content)
+    
+    logger.debug("insert Front Matter...")
+    
+    metadata = create_frontmatter_metadata(file_path, tag_line, file_stat, uid)
+    
+    # Serialize front matter with content
+    return splice_frontmatter(metadata, content, 0, parser)
+
+
+def create_frontmatter_metadata(file_path, tag_line, file_stat=None, uid=None):
+    """Return the metadata of new Front Matter for a note"""
+    return {
+        "uid": uid if uid is not None else default_uid(file_path),
+        "title": get_file_name(file_path)[1],
+        "aliases": "[]",
+        "date": format_date(get_creation_date(file_path, file_stat)),
+        "update": format_date(get_modification_date(file_path, file_stat)),
+        "tags": tag_line,
+        "draft": "true" if get_dir_name(file_path)[1] in INBOX_DIR else "false"
+    }
+
+
+def read_frontmatter_head(file_path):
+    """Read the start of a note, extended until its Front Matter is closed.
+    The body of the note is not read unless the Front Matter runs to its end.
+    Returns the text read, or None if the Front Matter is not closed"""
+    parser = FrontMatterParser()
+    size = FRONT_MATTER_HEAD_BYTES
+    while True:
+        head, complete = read_file_head(file_path, size)
+        if complete or not parser.detect_format(head):
+            return head
+        if parser.frontmatter_length(head) is not None:
+            return head
+        if size >= FRONT_MATTER_MAX_BYTES:
+            logger.debug(f"Front Matter is not closed within {FRONT_MATTER_MAX_BYTES} bytes: {file_path}")
+            return None
+        size = min(size * 4, FRONT_MATTER_MAX_BYTES)
+
+
+def frontmatter_needs_update(metadata, file_path):
+    """Whether update_frontmatter_content would change this Front Matter.
+    Only the metadata is needed, so the note body does not have to be read"""
+    for key in ("uid", "title", "aliases", "date", "update", "tags", "draft"):
+        if key not in metadata:
+            return True
+    return metadata["update"] != format_date(get_modification_date(file_path))
+
+
+def normalize_frontmatter_content(content, file_path, parser, file_stat=None, uid=None):
+    """Create or update the Front Matter of the content.
+    The dates are taken from file_stat if the file has already been stat'ed,
+    and uid is the UID the note will be renamed to, if any.
+    Returns the normalized content, or None if nothing has changed"""
+    if parser.detect_format(content):
+        return update_frontmatter_content(content, file_path, parser, file_stat, uid)
+    return create_frontmatter_content(content, file_path, parser, file_stat, uid)
+
+
 def check_and_create_yfm(files, format_type=None):
     """If there is no Front Matter, create one."""
     if format_type is None:
@@ -79,16 +235,16 @@ def check_and_create_yfm(files, format_type=None):
     create_yfm_files = []  # if note doesn't have front matter
     
     # check and classify files by exists front matter
-    for i, file in enumerate(files):
+    for file in track(files, "Checking Front Matter"):
         logger.debug("Checking Front Matter...")
         logger.debug("target: " + file)
         
         try:
-            # Use cross-platform file reading
-            content = read_file_cross_platform(file)
+            # Only the first line is needed to classify the note
+            head = read_file_head(file, FRONT_MATTER_HEAD_BYTES)[0]
                 
             # Detect front matter format
-            detected_format = parser.detect_format(content)
+            detected_format = parser.detect_format(head)
             if detected_format:
                 update_yfm_files.append(file)
                 logger.debug(f"Have already Front Matter ({detected_format})")
@@ -99,8 +255,6 @@ def check_and_create_yfm(files, format_type=None):
         except Exception as e:
             logger.error(f"Error reading file {file}: {e}")
             continue
-            
-        logger.info("check done! [" + str(i + 1) + "/" + str(len(files)) + "]")
     
     # Update existing front matter files
     _update_existing_yfm(update_yfm_files, parser)
@@ -115,91 +269,24 @@ def _update_existing_yfm(update_yfm_files, parser):
     logger.info("the target is: " + str(len(update_yfm_files)) + " files")
     processing_file_cnt = 0  # Counting the number of files processed
     
-    for j, update_yfm_file in enumerate(update_yfm_files):
+    for j, update_yfm_file in enumerate(track(update_yfm_files, "Updating Front Matter")):
         logger.debug("Updating Front Matter...")
-        logger.info("target: " + update_yfm_file)
+        logger.debug("target: " + update_yfm_file)
         
         try:
-            # Use cross-platform file reading
-            content = read_file_cross_platform(update_yfm_file)
-            
-            # Parse existing front matter
-            metadata, body_content = parser.parse_frontmatter(content)
-            if metadata is None:
-                logger.debug("Failed to parse front matter, skipping")
+            # Check the Front Matter first, so up-to-date notes are never read in full
+            head = read_frontmatter_head(update_yfm_file)
+            metadata = parser.parse_frontmatter_span(head)[0] if head is not None else None
+            if metadata is not None and not frontmatter_needs_update(metadata, update_yfm_file):
+                logger.debug("There is no Front Matter to update")
                 continue
             
-            # Check for missing fields and update
-            update_flg = False
-            
-            # Generate uid if not present
-            import hashlib
-            if "uid" not in metadata:
-                file_hash = hashlib.md5(update_yfm_file.encode()).hexdigest()
-                metadata["uid"] = file_hash
-                update_flg = True
-            
-            required_fields = {
-                "title": get_file_name(update_yfm_file)[1],
-                "aliases": "[]",
-                "date": format_date(get_creation_date(update_yfm_file)),
-                "update": format_date(get_modification_date(update_yfm_file)),
-                "tags": create_tag_line_from_lines(content.split('\n')),
-                "draft": "true" if get_dir_name(update_yfm_file)[1] in INBOX_DIR else "false"
-            }
-            
-            # Add missing fields
-            for key, default_value in required_fields.items():
-                if key not in metadata:
-                    metadata[key] = default_value
-                    update_flg = True
-                    logger.debug(f"Added missing field: {key}")
-            
-            # Always update the 'update' field
-            if "update" in metadata:
-                old_update = metadata["update"]
-                new_update = format_date(get_modification_date(update_yfm_file))
-                if old_update != new_update:
-                    metadata["update"] = new_update
-                    update_flg = True
-                    logger.debug(f"Updated 'update' field: {old_update} -> {new_update}")
+            # Use cross-platform file reading
+            content = read_file_cross_platform(update_yfm_file)
             
-            if update_flg:
-                # Regenerate content with updated metadata
-                updated_content = parser.serialize_frontmatter(metadata, body_content)
-                
-                # Remove hashtag lines from body while preserving frontmatter format
-                lines = updated_content.split('\n')
-                
-                # Find where frontmatter ends
-                frontmatter_end_idx = -1
-                for i, line in enumerate(lines):
-                    if i > 0 and line.strip() == '---':  # Found closing delimiter
-                        frontmatter_end_idx = i
-                        break
-                
-                # Process only the content after frontmatter for hashtag removal
-                if frontmatter_end_idx > 0:
-                    frontmatter_lines = lines[:frontmatter_end_idx + 2]  # Include the blank line
-                    content_lines = lines[frontmatter_end_idx + 2:]
-                    
-                    # Remove hashtag lines from content only
-                    filtered_content = []
-                    for line in content_lines:
-                        if not re.match("^\#[^\#|^\s].+", line):
-                            filtered_content.append(line)
-                    
-                    # Combine frontmatter with filtered content
-                    final_lines = frontmatter_lines + filtered_content
-                    final_content = '\n'.join(final_lines)
-                    
-                    # Write the final content
-                    final_content = final_content.rstrip('\n') + '\n'
-                    write_file_cross_platform(update_yfm_file, final_content)
-                else:
-                    # Fallback to original behavior if no frontmatter found
-                    writing_lines_without_hashtags(update_yfm_file, lines)
-                
+            final_content = update_frontmatter_content(content, update_yfm_file, parser)
+            if final_content is not None:
+                write_file_cross_platform(update_yfm_file, final_content, original=content)
                 processing_file_cnt += 1
                 logger.debug("Updated Front Matter!")
             else:
@@ -222,73 +309,16 @@ def _create_new_yfm(create_yfm_files, parser):
     logger.info("the target is: " + str(len(create_yfm_files)) + " files")
     processing_file_cnt = 0  # Counting the number of files processed
     
-    for i, create_yfm_file in enumerate(create_yfm_files):
+    for i, create_yfm_file in enumerate(track(create_yfm_files, "Adding Front Matter")):
         logger.debug("Creating Front Matter...")
-        logger.info("target: " + create_yfm_file)
+        logger.debug("target: " + create_yfm_file)
         
         try:
             # Use cross-platform file reading
             content = read_file_cross_platform(create_yfm_file)
             
-            lines = content.split('\n')
-            tag_line = create_tag_line_from_lines(lines)
-            
-            logger.debug("insert Front Matter...")
-            
-            # Create metadata dictionary with uid first
-            # Generate a uid from the filename (will be updated if file is renamed)
-            from .utils import format_uid_from_date
-            from .file_operations import get_file_name
-            import hashlib
-            
-            # Generate a unique uid based on file path
-            file_hash = hashlib.md5(create_yfm_file.encode()).hexdigest()
-            
-            metadata = {
-                "uid": file_hash,
-                "title": get_file_name(create_yfm_file)[1],
-                "aliases": "[]",
-                "date": format_date(get_creation_date(create_yfm_file)),
-                "update": format_date(get_modification_date(create_yfm_file)),
-                "tags": tag_line,
-                "draft": "true" if get_dir_name(create_yfm_file)[1] in INBOX_DIR else "false"
-            }
-            
-            # Serialize front matter with content
-            updated_content = parser.serialize_frontmatter(metadata, content)
-            
-            # Remove hashtag lines from body while preserving frontmatter format
-            lines = updated_content.split('\n')
-            
-            # Find where frontmatter ends
-            frontmatter_end_idx = -1
-            for i, line in enumerate(lines):
-                if i > 0 and line.strip() == '---':  # Found closing delimiter
-                    frontmatter_end_idx = i
-                    break
-            
-            # Process only the content after frontmatter for hashtag removal
-            if frontmatter_end_idx > 0:
-                frontmatter_lines = lines[:frontmatter_end_idx + 2]  # Include the blank line
-                content_lines = lines[frontmatter_end_idx + 2:]
-                
-                # Remove hashtag lines from content only
-                filtered_content = []
-                for line in content_lines:
-                    if not re.match("^\#[^\#|^\s].+", line):
-                        filtered_content.append(line)
-                
-                # Combine frontmatter with filtered content
-                final_lines = frontmatter_lines + filtered_content
-                final_content = '\n'.join(final_lines)
-            else:
-                # Fallback to original behavior if no frontmatter found
-                writing_lines_without_hashtags(create_yfm_file, lines)
-                continue
-            
-            # Write the final content
-            final_content = final_content.rstrip('\n') + '\n'
-            write_file_cross_platform(create_yfm_file, final_content)
+            final_content = create_frontmatter_content(content, create_yfm_file, parser)
+            write_file_cross_platform(create_yfm_file, final_content, original=content)
             
             processing_file_cnt += 1  # Counting the number of files processed
             logger.debug(f"Created {parser.format_type.upper()} Front Matter")
@@ -301,4 +331,4 @@ def _create_new_yfm(create_yfm_files, parser):
             "processing done! [" + str(i + 1) + "/" + str(len(create_yfm_files)) + "]"
         )
     
-    logger.info(str(processing_file_cnt) + " files have been updated!")
\ No newline at end of file
+    logger.info(str(processing_file_cnt) + " files have been updated!")
@@ -5,13 +5,15 @@ import os
 import sys
 import datetime
 import re
+import unicodedata
+import json
 from unittest.mock import patch, MagicMock
 from io import StringIO
 
 # Import the modules to test
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-from zettelkasten_normalizer import utils, file_operations, yfm_processor, link_processor, config, frontmatter_parser
+from zettelkasten_normalizer import utils, file_operations, yfm_processor, link_processor, config, frontmatter_parser, pipeline, parallel, manifest, link_matcher, stats, plan, watcher, journal, server, client, uid_allocator, vault_index, streaming, progress, history
 
 
 class TestUtilityFunctions(unittest.TestCase):
@@ -111,6 +113,157 @@ class TestUtilityFunctions(unittest.TestCase):
         self.assertTrue(result.startswith("[") and result.endswith("]"))
 
 
+class TestFileWrites(unittest.TestCase):
+    """書き込み回避とアトミック書き込みのテスト"""
+
+    def setUp(self):
+        """テスト用の一時ディレクトリを作成"""
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        self.addCleanup(utils.enable_fsync, config.FSYNC_WRITES)
+        self.path = os.path.join(self.test_dir, "note.md")
+        with open(self.path, 'wb') as f:
+            f.write(b"# Note\r\n")
+        os.chmod(self.path, 0o640)
+
+    def test_identical_content_is_not_written(self):
+        """内容が同じ場合は書き込まないことのテスト"""
+        self.assertTrue(utils.write_file_cross_platform(self.path, "# Note\n"))
+        inode = os.stat(self.path).st_ino
+        self.assertFalse(utils.write_file_cross_platform(self.path, "# Note\r\n"))
+        self.assertEqual(os.stat(self.path).st_ino, inode)
+
+    def test_write_is_compared_with_what_was_read(self):
+        """読み込んだ内容（またはそのハッシュ）と比較し、ファイルを読み直さないことのテスト"""
+        content = utils.read_file_cross_platform(self.path)
+        with patch.object(utils, 'has_same_bytes', side_effect=AssertionError("read again")):
+            self.assertFalse(utils.write_file_cross_platform(self.path, "# Note\n", original=content))
+            self.assertFalse(utils.write_file_cross_platform(self.path, "# Note\n", original_hash=manifest.hash_content(content)))
+            self.assertTrue(utils.write_file_cross_platform(self.path, "# Changed\n", original=content))
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), b"# Changed\r\n")
+
+        # 読み込んだときの形式と違う形式で書く場合は、ディスク上の内容と比較する
+        self.assertTrue(utils.write_file_cross_platform(self.path, "# Changed\n", "utf-8", "\n", original="# Changed\n"))
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), b"# Changed\n")
+
+    def test_atomic_write(self):
+        """一時ファイル経由で置き換え、権限が保たれることのテスト"""
+        utils.write_file_cross_platform(self.path, "# Changed\n")
+        
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), b"# Changed\n")
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o640)
+        self.assertEqual(os.listdir(self.test_dir), ["note.md"])
+
+    def test_failed_write_keeps_original(self):
+        """書き込みに失敗しても元のファイルが残ることのテスト"""
+        with patch.object(utils.os, 'replace', side_effect=OSError("disk full")):
+            with self.assertRaises(OSError):
+                utils.write_file_cross_platform(self.path, "# Changed\n")
+        
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), b"# Note\r\n")
+        self.assertEqual(os.listdir(self.test_dir), ["note.md"])
+
+    @unittest.skipUnless(hasattr(os, "symlink"), "symlinks are not supported")
+    def test_symlinked_note_is_written_through(self):
+        """シンボリックリンクのノートはリンクを保ったままリンク先が更新されることのテスト"""
+        os.makedirs(os.path.join(self.test_dir, "real"))
+        os.makedirs(os.path.join(self.test_dir, "s"))
+        target = os.path.join(self.test_dir, "real", "n.md")
+        with open(target, 'w') as f:
+            f.write("old\n")
+        link = os.path.join(self.test_dir, "s", "n.md")
+        os.symlink(os.path.join("..", "real", "n.md"), link)
+        
+        self.assertTrue(utils.write_file_cross_platform(link, "new\n"))
+        self.assertTrue(os.path.islink(link))
+        with open(target) as f:
+            self.assertEqual(f.read(), "new\n")
+        self.assertEqual(os.listdir(os.path.join(self.test_dir, "s")), ["n.md"])
+        self.assertEqual(os.listdir(os.path.join(self.test_dir, "real")), ["n.md"])
+
+    def test_directory_sync_is_batched(self):
+        """フォルダのfsyncがフォルダごとに1回だけ行われることのテスト"""
+        utils.enable_fsync()
+        for i in range(3):
+            utils.write_file_cross_platform(os.path.join(self.test_dir, f"{i}.md"), str(i))
+        expected = 1 if hasattr(os, "O_DIRECTORY") else 0
+        self.assertEqual(utils.sync_directories(), expected)
+
+
+class TestFileFormat(unittest.TestCase):
+    """文字コードと改行コードの検出と保持のテスト"""
+
+    FILES = {
+        "crlf.md": b"# Note\r\n\r\nText\r\n",
+        "cr.md": b"# Note\rText\r",
+        "latin.md": "# Caf\xe9\nText\n".encode('latin-1'),
+        "bom.md": b"\xef\xbb\xbf---\ntitle: bom\n---\nText\n",
+    }
+
+    def setUp(self):
+        """テスト用の一時ディレクトリを作成"""
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        self.addCleanup(utils.keep_file_format, config.KEEP_FILE_FORMAT)
+        for name, data in self.FILES.items():
+            with open(os.path.join(self.test_dir, name), 'wb') as f:
+                f.write(data)
+
+    def _read_bytes(self, name):
+        with open(os.path.join(self.test_dir, name), 'rb') as f:
+            return f.read()
+
+    def test_round_trip_is_byte_exact(self):
+        """読み込んだ内容をそのまま書き戻してもファイルが変わらないことのテスト"""
+        for name, data in self.FILES.items():
+            path = os.path.join(self.test_dir, name)
+            content = utils.read_file_cross_platform(path)
+            self.assertNotIn("\r", content)
+            self.assertFalse(content.startswith("\ufeff"))
+            self.assertFalse(utils.write_file_cross_platform(path, content), name)
+            self.assertEqual(self._read_bytes(name), data)
+
+    def test_changed_content_keeps_format(self):
+        """変更した内容が元の文字コードと改行コードで書き込まれることのテスト"""
+        for name in self.FILES:
+            path = os.path.join(self.test_dir, name)
+            content = utils.read_file_cross_platform(path)
+            self.assertTrue(utils.write_file_cross_platform(path, content + "More\n"))
+        self.assertEqual(self._read_bytes("crlf.md"), b"# Note\r\n\r\nText\r\nMore\r\n")
+        self.assertEqual(self._read_bytes("cr.md"), b"# Note\rText\rMore\r")
+        self.assertEqual(self._read_bytes("latin.md"), "# Caf\xe9\nText\nMore\n".encode('latin-1'))
+        self.assertEqual(self._read_bytes("bom.md"), b"\xef\xbb\xbf---\ntitle: bom\n---\nText\nMore\n")
+
+        # Latin-1で表せない文字はUTF-8で書き込む
+        path = os.path.join(self.test_dir, "latin.md")
+        utils.read_file_cross_platform(path)
+        utils.write_file_cross_platform(path, "ノート\n")
+        self.assertEqual(self._read_bytes("latin.md"), "ノート\n".encode('utf-8'))
+
+    def test_fallback_reads_once(self):
+        """UTF-8でないファイルも一度だけ読み込むことのテスト"""
+        run_stats = stats.RunStats()
+        stats.activate(run_stats)
+        self.addCleanup(stats.deactivate)
+        with run_stats.stage("read"):
+            content = utils.read_file_cross_platform(os.path.join(self.test_dir, "latin.md"))
+        self.assertEqual(content, "# Caf\xe9\nText\n")
+        self.assertEqual(run_stats.totals()["files_read"], 1)
+
+    def test_utf8_lf_output(self):
+        """保持を無効にするとUTF-8とLFで書き込むことのテスト"""
+        utils.keep_file_format(False)
+        path = os.path.join(self.test_dir, "crlf.md")
+        content = utils.read_file_cross_platform(path)
+        self.assertTrue(utils.write_file_cross_platform(path, content))
+        self.assertEqual(self._read_bytes("crlf.md"), b"# Note\n\nText\n")
+        self.assertEqual(utils.sync_directories(), 0)
+
+
 class TestFileOperations(unittest.TestCase):
     """ファイル操作のテスト"""
 
@@ -187,6 +340,40 @@ class TestFileOperations(unittest.TestCase):
         self.assertEqual(len(result), 1)
         self.assertTrue(any("normal.md" in f for f in result))
 
+    def test_scan_vault_matches_walk_order(self):
+        """1回の走査でos.walkと同じ順序でノートと画像が分類されることのテスト"""
+        for rel_path in ["b.md", "a.png", os.path.join("sub", "c.md"), os.path.join("sub", "deep", "d.txt"),
+                         os.path.join("z", "e.md"), os.path.join(".git", "f.md"), os.path.join("tmp", "g.md"), "tags"]:
+            path = os.path.join(self.test_dir, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write("x")
+        walked = []
+        for pathname, dirnames, filenames in os.walk(self.test_dir):
+            dirnames[:] = [d for d in dirnames if d not in config.EXCLUDE_DIR and d[0] != "."]
+            walked.extend(os.path.join(pathname, f) for f in filenames if f.endswith(".md") or f.endswith(".txt"))
+        
+        scan = file_operations.scan_vault(self.test_dir)
+        self.assertEqual(scan.files("note"), walked)
+        self.assertEqual(scan.files("image"), [os.path.join(self.test_dir, "a.png")])
+        self.assertEqual(scan.files("note", os.path.join(self.test_dir, "sub")), walked[1:3])
+        self.assertEqual(scan.stat(walked[0]).st_size, 1)
+
+    def test_scan_vault_rename(self):
+        """リネーム後に走査結果がその場で更新されることのテスト"""
+        old_path = os.path.join(self.test_dir, "old.md")
+        new_path = os.path.join(self.test_dir, "new.md")
+        with open(old_path, 'w') as f:
+            f.write("old")
+        scan = file_operations.scan_vault(self.test_dir)
+        os.rename(old_path, new_path)
+        with open(new_path, 'a') as f:
+            f.write("er")
+        scan.rename(old_path, new_path)
+        
+        self.assertEqual(scan.files("note"), [new_path])
+        self.assertEqual(scan.stat(new_path).st_size, 5)
+
     def test_get_new_filepath_with_uid(self):
         """UID付きファイルパス生成のテスト"""
         test_file = os.path.join(self.test_dir, "test.md")
@@ -311,6 +498,46 @@ Content here.""")
         # インラインハッシュタグは残ることを確認
         self.assertIn("This is content with #tag1", content)
 
+    def test_large_note_is_classified_with_bounded_read(self):
+        """大きなノートもフロントマター判定では先頭だけを読むことのテスト"""
+        test_file = os.path.join(self.test_dir, "large.md")
+        with open(test_file, 'w') as f:
+            f.write("---\ntitle: large\n---\n" + "body line\n" * 400000)
+        read_sizes = []
+        original_read_file_head = utils.read_file_head
+
+        def recording_read_file_head(file_path, size, encoding='utf-8'):
+            read_sizes.append(size)
+            return original_read_file_head(file_path, size, encoding)
+
+        with patch.object(yfm_processor, 'logger', MagicMock(), create=True), \
+                patch.object(yfm_processor, 'read_file_head', side_effect=recording_read_file_head):
+            head = yfm_processor.read_frontmatter_head(test_file)
+        self.assertTrue(head.startswith("---\ntitle: large\n---\n"))
+        self.assertEqual(read_sizes, [config.FRONT_MATTER_HEAD_BYTES])
+
+    def test_up_to_date_note_is_not_read_in_full(self):
+        """更新不要なノートは本文を読まずにスキップされることのテスト"""
+        test_file = os.path.join(self.test_dir, "20210101000000.md")
+        mtime = datetime.datetime(2021, 1, 2, 3, 4, 5).timestamp()
+        with open(test_file, 'w') as f:
+            f.write("---\nuid: 20210101000000\ntitle: note\naliases: []\n"
+                    "date: 2021-01-01 00:00:00\nupdate: 2021-01-02 03:04:05\n"
+                    "tags: []\ndraft: false\n---\n\n# Note\n")
+        os.utime(test_file, (mtime, mtime))
+
+        with patch.object(yfm_processor, 'logger', MagicMock(), create=True), \
+                patch.object(yfm_processor, 'read_file_cross_platform') as mock_read:
+            yfm_processor.check_and_create_yfm([test_file])
+        mock_read.assert_not_called()
+
+        # 更新日時が変わったノートは更新される
+        os.utime(test_file, (mtime + 3600, mtime + 3600))
+        with patch.object(yfm_processor, 'logger', MagicMock(), create=True):
+            yfm_processor.check_and_create_yfm([test_file])
+        with open(test_file, 'r') as f:
+            self.assertIn("update: 2021-01-02 04:04:05", f.read())
+
 
 class TestLinkSubstitution(unittest.TestCase):
     """リンク置換機能のテスト"""
@@ -367,6 +594,1599 @@ And markdown links [source](source.md).
         self.assertTrue(result)  # 置換が行われたことを確認
 
 
+class TestLinkMatcher(unittest.TestCase):
+    """複数名リンクマッチャーのテスト"""
+
+    def setUp(self):
+        self.matcher = link_matcher.LinkMatcher({
+            "/vault/source.md": "/vault/11111111111111111111111111111111.md",
+            "/vault/Inbox/draft.md": "/vault/22222222222222222222222222222222.md",
+            "/vault/img/photo.png": "/vault/img/33333333333333333333333333333333.png",
+        })
+
+    def test_multiple_matches_on_one_line(self):
+        """1行に複数のリンクがある場合に全て置換されることのテスト"""
+        content = "[[source]] and [[draft | the draft]] and ![[photo.png]] and [[other]]\n"
+        result, count = self.matcher.substitute(content)
+        self.assertEqual(count, 3)
+        self.assertEqual(
+            result,
+            "[source](11111111111111111111111111111111.md) and "
+            "[the draft](22222222222222222222222222222222.md) and "
+            "![photo.png](33333333333333333333333333333333.png) and [[other]]\n",
+        )
+
+    def test_markdown_links(self):
+        """Markdownリンクの置換のテスト"""
+        content = "[S](source.md) [D](Inbox/draft.md) [W](https://example.com/source.md) [X](xsource.md)"
+        result, count = self.matcher.substitute(content)
+        self.assertEqual(count, 2)
+        self.assertIn("[S](11111111111111111111111111111111.md)", result)
+        self.assertIn("[D](22222222222222222222222222222222.md)", result)
+        self.assertIn("[W](https://example.com/source.md)", result)
+        self.assertIn("[X](xsource.md)", result)
+
+    def test_long_line_is_linear(self):
+        """長い行でもバックトラックしないことのテスト"""
+        import time
+        content = "[" + "a" * 200000 + "](" + "b" * 200000
+        start = time.perf_counter()
+        result, count = self.matcher.substitute(content)
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertEqual(count, 0)
+        self.assertEqual(result, content)
+
+    def test_iter_link_names(self):
+        """リンク名の抽出のテスト"""
+        names = set(link_matcher.iter_link_names("[[a | x]] [[b.md]] [c](dir/c.md) [d](http://d.md)"))
+        self.assertEqual(names, {"a", "b.md", "c.md"})
+
+
+class TestLinkPrefilter(unittest.TestCase):
+    """バイト列によるリンクの事前フィルタのテスト"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+
+    def _write(self, name, data):
+        file_path = os.path.join(self.test_dir, name)
+        with open(file_path, 'wb') as f:
+            f.write(data)
+        return file_path
+
+    def test_file_contains_any(self):
+        """小さなファイルとmmapされる大きなファイルの両方で検索できることのテスト"""
+        needles = utils.encode_search_terms(["カフェ", "[["])
+        small = self._write("small.md", "see [カフェ](カフェ.md)\n".encode('utf-8'))
+        nfd = self._write("nfd.md", unicodedata.normalize("NFD", "カフェ").encode('utf-8'))
+        large = self._write("large.md", b"x" * (config.PREFILTER_MMAP_BYTES * 2) + b"[[link]]")
+        plain = self._write("plain.md", b"no links here\n" * 10000)
+        empty = self._write("empty.md", b"")
+        self.assertTrue(utils.file_contains_any(small, needles))
+        self.assertTrue(utils.file_contains_any(nfd, needles))
+        self.assertTrue(utils.file_contains_any(large, needles))
+        self.assertFalse(utils.file_contains_any(plain, needles))
+        self.assertFalse(utils.file_contains_any(empty, needles))
+
+    def test_search_terms_match_like_substrings(self):
+        """多数の検索語をまとめたパターンが個別の部分文字列検索と同じ結果になることのテスト"""
+        terms = [f"img_{i}.png" for i in range(300)] + ["img_1", "note", "notebook", "é"]
+        needles = utils.encode_search_terms(terms)
+        for text in ("see img_42.png", "img_1", "img_", "a notebook", "not", "café", "café", "plain"):
+            data = text.encode('utf-8')
+            expected = any(term.encode('utf-8') in data or unicodedata.normalize("NFD", term).encode('utf-8') in data
+                           for term in terms)
+            self.assertEqual(needles.search(data) is not None, expected, text)
+        self.assertTrue(needles.search("café".encode('latin-1')))
+        self.assertIsNone(utils.encode_search_terms([]).search(b"anything"))
+
+    def test_notes_without_wikilinks_are_not_decoded(self):
+        """WikiLinkを含まないノートはデコードされないことのテスト"""
+        with_link = self._write("a.md", b"see [[b]]\n")
+        without_link = self._write("b.md", b"plain [text](b.md)\n")
+        with patch.object(link_processor, 'logger', MagicMock(), create=True), \
+                patch.object(link_processor, 'read_file_cross_platform',
+                             side_effect=utils.read_file_cross_platform) as mock_read:
+            link_processor.convert_wikilinks_to_markdown([with_link, without_link], self.test_dir)
+        mock_read.assert_called_once_with(with_link)
+        with open(with_link, 'r') as f:
+            self.assertEqual(f.read(), "see [b](b.md)\n")
+
+    def test_backlink_candidates_are_prefiltered(self):
+        """リネーム対象の名前を含むノートだけが索引付けされることのテスト"""
+        source = self._write("source.md", b"source\n")
+        linking = self._write("linking.md", b"[[source]]\n")
+        unrelated = self._write("unrelated.md", b"[[other]]\n")
+        target = os.path.join(self.test_dir, "11111111111111111111111111111111.md")
+        with patch.object(link_processor, 'logger', MagicMock(), create=True), \
+                patch.object(link_processor, 'get_files', return_value=[linking, unrelated]), \
+                patch.object(link_processor, 'read_file_cross_platform',
+                             side_effect=utils.read_file_cross_platform) as mock_read:
+            linking_files = link_processor.find_files_linking_to({source: target}, self.test_dir)
+        self.assertEqual(linking_files, [linking])
+        mock_read.assert_called_once_with(linking)
+
+
+class TestBatchRename(unittest.TestCase):
+    """一括リネームとバックリンク置換のテスト"""
+
+    def setUp(self):
+        """テスト用の一時ディレクトリを作成"""
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        patcher = patch.object(link_processor, 'logger', MagicMock(), create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _write(self, name, content):
+        path = os.path.join(self.test_dir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_build_backlink_index(self):
+        """逆引きインデックス構築のテスト"""
+        note_a = self._write("a.md", "See [[b]] and [c](sub/c.md) and [web](https://c.md)")
+        note_b = self._write("b.md", "See [[a | alias]]")
+        
+        index = link_processor.build_backlink_index([note_a, note_b])
+        
+        self.assertEqual(index["b"], {note_a})
+        self.assertEqual(index["c.md"], {note_a})
+        self.assertEqual(index["a"], {note_b})
+        self.assertNotIn("https://c.md", index)
+
+    def test_rename_notes_rewrites_each_note_once(self):
+        """リネーム対象が複数でも各ノートが一度だけ書き換えられることのテスト"""
+        note_a = self._write("a.md", "---\ntitle: a\n---\n\nLink to [[b]]\n")
+        note_b = self._write("b.md", "---\ntitle: b\n---\n\nLink to [a](a.md)\n")
+        hub = self._write("hub.txt", "[[a]] [[b]]\n[A](a.md)\n")
+        
+        written = []
+        original_write = link_processor.write_file_cross_platform
+        
+        def counting_write(path, content, **kwargs):
+            written.append(path)
+            original_write(path, content, **kwargs)
+        
+        with patch.object(link_processor, 'write_file_cross_platform', side_effect=counting_write):
+            link_processor.rename_notes_with_links([note_a, note_b], self.test_dir)
+        
+        self.assertFalse(os.path.exists(note_a))
+        self.assertFalse(os.path.exists(note_b))
+        uid_files = sorted(f for f in os.listdir(self.test_dir) if file_operations.check_note_has_uid(f))
+        self.assertEqual(len(uid_files), 2)
+        
+        # hub.txt は2つのリネームの影響を受けるが、書き込みは1回だけ
+        self.assertEqual(written.count(hub), 1)
+        with open(hub, 'r') as f:
+            content = f.read()
+        self.assertNotIn("[[a]]", content)
+        self.assertNotIn("(a.md)", content)
+        for uid_file in uid_files:
+            self.assertIn(uid_file, content)
+
+    def test_substitute_links_in_batch_without_renames(self):
+        """リネームがない場合は何もしないことのテスト"""
+        self._write("a.md", "[[b]]")
+        self.assertEqual(link_processor.substitute_links_in_batch({}, self.test_dir), 0)
+
+
+class TestPipeline(unittest.TestCase):
+    """単一パイプラインのテスト"""
+
+    VAULT = {
+        "a.md": "# A\n#tagA\nLink to [[b]] and ![[img.png]]\n",
+        "b.md": "---\ntitle: b\n---\n\nBack to [A](a.md)\n",
+        os.path.join("Inbox", "c.md"): "Draft linking [[a | alias]]\n",
+        "img.png": "png",
+        "0123456789abcdef0123456789abcdef.md": "Already named, see [[c]]\n",
+    }
+
+    FUNCTIONS = {
+        "function_create_yfm": True,
+        "function_rename_notes": True,
+        "function_rename_images": True,
+        "function_convert_wikilinks": True,
+    }
+
+    def setUp(self):
+        """テスト用の一時ディレクトリを作成"""
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        for module in (yfm_processor, link_processor, pipeline):
+            patcher = patch.object(module, 'logger', MagicMock(), create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _create_vault(self):
+        for name in os.listdir(self.test_dir):
+            path = os.path.join(self.test_dir, name)
+            shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+        for rel_path, content in self.VAULT.items():
+            path = os.path.join(self.test_dir, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(content)
+            os.utime(path, (1609459200, 1609459200))
+
+    def _snapshot(self):
+        snapshot = {}
+        for pathname, dirnames, filenames in os.walk(self.test_dir):
+            for filename in filenames:
+                path = os.path.join(pathname, filename)
+                with open(path, 'r') as f:
+                    snapshot[os.path.relpath(path, self.test_dir)] = f.read()
+        return snapshot
+
+    def _uuid_sequence(self):
+        import uuid
+        return patch.object(
+            file_operations.uuid, 'uuid4',
+            side_effect=[uuid.UUID(int=i + 1) for i in range(10)],
+        )
+
+    def test_pipeline_matches_staged_execution(self):
+        """パイプラインの結果が段階的実行の結果と一致することのテスト"""
+        self._create_vault()
+        with self._uuid_sequence():
+            yfm_processor.check_and_create_yfm(file_operations.get_files(self.test_dir, "note"), "yaml")
+            link_processor.convert_wikilinks_to_markdown(file_operations.get_files(self.test_dir, "note"), self.test_dir)
+            link_processor.rename_notes_with_links(file_operations.get_files(self.test_dir, "note"), self.test_dir)
+            link_processor.rename_images_with_links(file_operations.get_files(self.test_dir, "image"), self.test_dir)
+        staged = self._snapshot()
+        
+        self._create_vault()
+        with self._uuid_sequence():
+            pipeline.run_pipeline(self.test_dir, self.test_dir, self.FUNCTIONS, "yaml")
+        piped = self._snapshot()
+        
+        self.assertEqual(staged, piped)
+
+    def test_vault_is_scanned_once(self):
+        """段階的実行でもパイプラインでもボールトの走査が1回であることのテスト"""
+        from zettelkasten_normalizer import normalization_zettel
+        for use_pipeline in (False, True):
+            self._create_vault()
+            with patch.object(os, 'scandir', wraps=os.scandir) as scandir:
+                normalization_zettel.execute_normalization(
+                    self.test_dir, self.test_dir, MagicMock(), self.FUNCTIONS, "yaml", use_pipeline=use_pipeline)
+            # ルートとInboxの2フォルダ
+            self.assertEqual(scandir.call_count, 2)
+
+    def test_pipeline_reads_and_writes_each_note_once(self):
+        """各ノートの読み込みと書き込みが一度だけであることのテスト"""
+        self._create_vault()
+        reads = []
+        writes = []
+        original_read = pipeline.read_file_cross_platform
+        original_write = link_processor.write_file_cross_platform
+        
+        def counting_read(path):
+            reads.append(path)
+            return original_read(path)
+        
+        def counting_write(path, content):
+            writes.append(path)
+            return original_write(path, content)
+        
+        # 書き込みはジャーナル経由で link_processor が行う
+        with patch.object(pipeline, 'read_file_cross_platform', side_effect=counting_read), \
+                patch.object(link_processor, 'write_file_cross_platform', side_effect=counting_write):
+            result = pipeline.run_pipeline(self.test_dir, self.test_dir, self.FUNCTIONS, "yaml")
+        
+        self.assertEqual(len(reads), len(set(reads)))
+        self.assertEqual(len(writes), len(set(writes)))
+        self.assertEqual(len(writes), result["files_written"])
+        self.assertEqual(result["files_renamed"], 4)
+
+    def test_pipeline_respects_disabled_functions(self):
+        """無効化された機能が実行されないことのテスト"""
+        self._create_vault()
+        functions = dict(self.FUNCTIONS, function_rename_notes=False, function_rename_images=False)
+        
+        pipeline.run_pipeline(self.test_dir, self.test_dir, functions, "yaml")
+        
+        snapshot = self._snapshot()
+        self.assertEqual(set(snapshot), set(self.VAULT))
+        self.assertIn("[b](b.md)", snapshot["a.md"])
+        self.assertTrue(snapshot["a.md"].startswith("---\n"))
+
+
+def _parallel_log_task(item):
+    """並列実行テスト用のタスク（ワーカーでログを出力する）"""
+    import logging
+    logging.getLogger("zettelkasten_normalizer.parallel_test").info("item %s", item)
+    return item * 2
+
+
+class TestParallelExecution(unittest.TestCase):
+    """並列実行のテスト"""
+
+    def setUp(self):
+        """テスト用の一時ディレクトリを作成"""
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        for module in (yfm_processor, link_processor, pipeline, parallel):
+            patcher = patch.object(module, 'logger', MagicMock(), create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = patch.object(parallel, 'PARALLEL_MIN_FILES', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_map_in_pool_keeps_order_and_replays_logs(self):
+        """結果の順序とワーカーのログが保たれることのテスト"""
+        import logging
+        records = []
+        
+        class ListHandler(logging.Handler):
+            def emit(self, record):
+                records.append(record.getMessage())
+        
+        test_logger = logging.getLogger("zettelkasten_normalizer.parallel_test")
+        handler = ListHandler()
+        test_logger.addHandler(handler)
+        self.addCleanup(test_logger.removeHandler, handler)
+        
+        results = parallel.map_in_pool(_parallel_log_task, range(20), jobs=3)
+        
+        self.assertEqual(results, [i * 2 for i in range(20)])
+        self.assertEqual(records, ["item %d" % i for i in range(20)])
+
+    def test_map_in_pool_serial(self):
+        """jobs=1 の場合は現在のプロセスで実行されることのテスト"""
+        with patch.object(parallel, 'ProcessPoolExecutor') as mock_executor:
+            results = parallel.map_in_pool(_parallel_log_task, [1, 2], jobs=1)
+        self.assertEqual(results, [2, 4])
+        mock_executor.assert_not_called()
+
+    def test_prefetch_overlaps_calls_in_order(self):
+        """I/Oスレッドで呼び出しが重なり、結果の順序が保たれることのテスト"""
+        import threading
+        import time
+        lock = threading.Lock()
+        active = [0, 0]  # 実行中の数, 最大値
+
+        def slow_double(item):
+            with lock:
+                active[0] += 1
+                active[1] = max(active[1], active[0])
+            time.sleep(0.01)
+            with lock:
+                active[0] -= 1
+            return item * 2
+
+        results = list(parallel.prefetch(slow_double, range(20), io_jobs=4))
+        self.assertEqual(results, [i * 2 for i in range(20)])
+        self.assertGreater(active[1], 1)
+        self.assertLessEqual(active[1], 4)
+
+    def test_split_journal_steps(self):
+        """同じファイルに触れる操作が同じステップに入らないことのテスト"""
+        operations = [
+            {"op": "rename", "from": "a.md", "to": "1.md"},
+            {"op": "rename", "from": "b.md", "to": "2.md"},
+            {"op": "write", "path": "1.md", "content": ""},
+            {"op": "write", "path": "2.md", "content": ""},
+            {"op": "substitute", "path": "2.md"},
+        ]
+        steps = link_processor.split_journal_steps(list(enumerate(operations)))
+        self.assertEqual([[index for index, operation in step] for step in steps], [[0, 1], [2, 3], [4]])
+
+    def test_io_threads_match_serial_io(self):
+        """I/Oスレッドを使っても結果が変わらないことのテスト"""
+        helper = TestPipeline()
+        helper.test_dir = self.test_dir
+        self.addCleanup(parallel.set_io_jobs, parallel.get_io_jobs())
+        snapshots = []
+        for io_jobs in (1, 8):
+            parallel.set_io_jobs(io_jobs)
+            helper._create_vault()
+            with helper._uuid_sequence():
+                pipeline.run_pipeline(self.test_dir, self.test_dir, TestPipeline.FUNCTIONS, "yaml")
+            snapshots.append(helper._snapshot())
+        self.assertEqual(snapshots[0], snapshots[1])
+
+    def test_parallel_pipeline_matches_serial(self):
+        """並列パイプラインの結果が直列実行と一致することのテスト"""
+        helper = TestPipeline()
+        helper.test_dir = self.test_dir
+        
+        helper._create_vault()
+        with helper._uuid_sequence():
+            pipeline.run_pipeline(self.test_dir, self.test_dir, TestPipeline.FUNCTIONS, "yaml", jobs=1)
+        serial = helper._snapshot()
+        
+        helper._create_vault()
+        with helper._uuid_sequence():
+            pipeline.run_pipeline(self.test_dir, self.test_dir, TestPipeline.FUNCTIONS, "yaml", jobs=2)
+        parallel_result = helper._snapshot()
+        
+        self.assertEqual(serial, parallel_result)
+
+
+class TestStatCache(unittest.TestCase):
+    """実行単位のstatキャッシュのテスト"""
+
+    def setUp(self):
+        """テスト用の一時ディレクトリを作成"""
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        for module in (yfm_processor, link_processor, pipeline):
+            patcher = patch.object(module, 'logger', MagicMock(), create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.vault = TestPipeline(methodName='setUp')
+        self.vault.test_dir = self.test_dir
+        self.vault._create_vault()
+
+    def _count_stats(self):
+        counts = {}
+        original_stat = os.stat
+
+        def counting_stat(path, *args, **kwargs):
+            key = os.path.relpath(path, self.test_dir)
+            counts[key] = counts.get(key, 0) + 1
+            return original_stat(path, *args, **kwargs)
+        return counts, patch.object(os, 'stat', side_effect=counting_stat)
+
+    def test_pipeline_stats_each_file_once(self):
+        """パイプライン実行中に元のファイルが高々1回しかstatされないことのテスト"""
+        counts, stat_patch = self._count_stats()
+        with self.vault._uuid_sequence(), stat_patch:
+            pipeline.run_pipeline(self.test_dir, self.test_dir, TestPipeline.FUNCTIONS, "yaml")
+        for name in TestPipeline.VAULT:
+            self.assertLessEqual(counts.get(name, 0), 1, name)
+        self.assertIsNone(utils.get_stat_cache())
+
+    def test_writes_and_renames_invalidate(self):
+        """書き込みとリネームでキャッシュが無効化され、走査済みフォルダの存在確認にstatが不要なことのテスト"""
+        a = os.path.join(self.test_dir, "a.md")
+        missing = os.path.join(self.test_dir, "missing.md")
+        with utils.stat_cache():
+            file_operations.scan_vault(self.test_dir)
+            size = utils.get_file_stat(a).st_size
+            counts, stat_patch = self._count_stats()
+            with stat_patch:
+                self.assertFalse(utils.path_exists(missing))
+                self.assertEqual(utils.get_file_stat(a).st_size, size)
+            self.assertEqual(counts, {})
+
+            utils.write_file_cross_platform(a, "longer content\n" * 10)
+            self.assertEqual(utils.get_file_stat(a).st_size, len("longer content\n" * 10))
+            link_processor.apply_journal_operation({"op": "rename", "type": "note", "from": "a.md", "to": "missing.md"}, self.test_dir)
+            self.assertTrue(utils.path_exists(missing))
+            self.assertFalse(utils.path_exists(a))
+
+
+class TestUidAllocator(unittest.TestCase):
+    """UID割り当てのテスト"""
+
+    def setUp(self):
+        """テスト用の一時ディレクトリを作成"""
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        for module in (yfm_processor, link_processor, pipeline):
+            patcher = patch.object(module, 'logger', MagicMock(), create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.vault = TestPipeline(methodName='setUp')
+        self.vault.test_dir = self.test_dir
+        self.vault._create_vault()
+
+    def test_strategies(self):
+        """各方式で使用中のUIDを避けて重複なく割り当てることのテスト"""
+        import uuid
+        a = os.path.join(self.test_dir, "a.md")
+        b = os.path.join(self.test_dir, "b.md")
+        taken = uuid.UUID(int=1).hex
+        allocator = uid_allocator.UidAllocator([taken], "uuid4")
+        with patch.object(uid_allocator.uuid, 'uuid4', side_effect=[uuid.UUID(int=i + 1) for i in range(3)]), \
+                patch.object(uid_allocator, 'path_exists', side_effect=AssertionError("probed")):
+            self.assertEqual(allocator.new_filepath(a, self.test_dir), self.test_dir + "/" + uuid.UUID(int=2).hex + ".md")
+            self.assertEqual(allocator.allocate(b), uuid.UUID(int=3).hex)
+
+        # a.md と b.md は同じ日時（作成日時がなければ更新日時）で、その秒は使用中
+        allocator = uid_allocator.UidAllocator([utils.format_uid_from_date(1609459200)], "timestamp")
+        uids = [allocator.allocate(a), allocator.allocate(b)]
+        self.assertEqual(uids, [utils.format_uid_from_date(1609459201), utils.format_uid_from_date(1609459202)])
+        self.assertTrue(allocator.is_uid(uids[0]))
+        self.assertFalse(uid_allocator.is_uid(uids[0], "uuid4"))
+
+        allocator = uid_allocator.UidAllocator(strategy="content")
+        first = allocator.allocate(a, "same")
+        second = allocator.allocate(b, "same")
+        self.assertNotEqual(first, second)
+        self.assertEqual(uid_allocator.UidAllocator(strategy="content").allocate(a, "same"), first)
+        self.assertTrue(allocator.is_uid(first) and allocator.is_uid(second))
+        with self.assertRaises(ValueError):
+            uid_allocator.UidAllocator(strategy="unknown")
+
+    def test_frontmatter_uid_is_file_name(self):
+        """Front Matterのuidが新しいファイル名と一致し、リネーム段階で書き直さないことのテスト"""
+        with self.vault._uuid_sequence(), \
+                patch.object(pipeline, 'insert_uid_into_content', side_effect=AssertionError("rewritten")), \
+                patch.object(uid_allocator, 'path_exists', side_effect=AssertionError("probed")):
+            pipeline.run_pipeline(self.test_dir, self.test_dir, TestPipeline.FUNCTIONS, "yaml")
+        parser = frontmatter_parser.FrontMatterParser()
+        notes = [name for name in os.listdir(self.test_dir) if name.endswith(".md")]
+        self.assertEqual(len(notes), 4)
+        for name in notes:
+            with open(os.path.join(self.test_dir, name)) as f:
+                metadata = parser.parse_frontmatter(f.read())[0]
+            # 既にUID名のノートも含めて、uidはファイル名と同じ
+            self.assertEqual(metadata["uid"], os.path.splitext(name)[0])
+
+    def test_content_uid_is_the_same_on_every_path(self):
+        """CRLFやlatin-1のノートでも、ストリーミングや段階的実行で同じ内容UIDになることのテスト"""
+        from zettelkasten_normalizer import normalization_zettel
+        notes = {"crlf.md": b"# Title\r\nSee [[latin]]\r\n", "latin.md": b"caf\xe9 note\n"}
+        expected = set()
+        for name, data in notes.items():
+            path = os.path.join(self.test_dir, name)
+            with open(path, 'wb') as f:
+                f.write(data)
+            expected.add(manifest.hash_content(utils.read_file_cross_platform(path))[:32] + ".md")
+            self.assertEqual(uid_allocator.hash_note_file(path), manifest.hash_content(utils.read_file_cross_platform(path)))
+
+        def run(use_pipeline, stream_min_bytes=10 ** 9):
+            root = tempfile.mkdtemp()
+            self.addCleanup(shutil.rmtree, root)
+            for name, data in notes.items():
+                with open(os.path.join(root, name), 'wb') as f:
+                    f.write(data)
+            with patch.object(uid_allocator, '_uid_strategy', 'content'), \
+                    patch.object(streaming, 'STREAM_MIN_BYTES', stream_min_bytes):
+                normalization_zettel.execute_normalization(
+                    root, root, MagicMock(), TestPipeline.FUNCTIONS, "yaml", use_pipeline=use_pipeline)
+            return {name for name in os.listdir(root) if name.endswith(".md")}
+
+        self.assertEqual(run(True), expected)
+        self.assertEqual(run(True, 0), expected)
+        self.assertEqual(run(False), expected)
+
+
+class TestIncrementalManifest(unittest.TestCase):
+    """マニフェストによる差分処理のテスト"""
+
+    FUNCTIONS = {
+        "function_create_yfm": True,
+        "function_rename_notes": False,
+        "function_rename_images": False,
+        "function_convert_wikilinks": True,
+    }
+
+    def setUp(self):
+        """テスト用の一時ディレクトリを作成"""
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        for module in (yfm_processor, link_processor, pipeline, manifest):
+            patcher = patch.object(module, 'logger', MagicMock(), create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _write(self, name, content, mtime=1609459200):
+        path = os.path.join(self.test_dir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        os.utime(path, (mtime, mtime))
+        return path
+
+    def _run(self, functions=None):
+        vault_manifest = manifest.VaultManifest.load(self.test_dir)
+        return pipeline.run_pipeline(
+            self.test_dir, self.test_dir, functions or self.FUNCTIONS, "yaml", manifest=vault_manifest
+        )
+
+    def test_second_run_skips_unchanged_files(self):
+        """2回目の実行で変更のないファイルがスキップされることのテスト"""
+        self._write("a.md", "# A\nSee [[b]]\n")
+        self._write("b.md", "# B\n")
+        
+        first = self._run()
+        self.assertEqual(first["files_written"], 2)
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir, config.MANIFEST_FILE)))
+        
+        second = self._run()
+        self.assertEqual(second["notes_loaded"], 0)
+        self.assertEqual(second["files_written"], 0)
+        
+        # 変更されたファイルだけが処理される
+        b_path = os.path.join(self.test_dir, "b.md")
+        with open(b_path, 'a') as f:
+            f.write("more\n")
+        third = self._run()
+        self.assertEqual(third["notes_loaded"], 1)
+
+    def test_manifest_records_metadata(self):
+        """マニフェストにメタデータが記録されることのテスト"""
+        self._write("a.md", "# A\n#topic\nSee [[b]]\n")
+        self._run()
+        
+        vault_manifest = manifest.VaultManifest.load(self.test_dir)
+        entry = vault_manifest.get(os.path.join(self.test_dir, "a.md"))
+        self.assertEqual(entry["type"], "note")
+        self.assertEqual(entry["metadata"]["format"], "yaml")
+        self.assertEqual(entry["metadata"]["tags"], "[topic]")
+        self.assertIn("b.md", entry["metadata"]["links"])
+        self.assertTrue(vault_manifest.is_unchanged(os.path.join(self.test_dir, "a.md")))
+
+    def test_unchanged_note_backlinks_are_updated(self):
+        """変更のないノートでもリネームされたノートへのリンクが更新されることのテスト"""
+        linking = self._write("linking.md", "See [b](b.md)\n")
+        self._write("other.md", "Nothing here\n")
+        self._run()
+        
+        self._write("b.md", "# B\n")
+        functions = dict(self.FUNCTIONS, function_rename_notes=True)
+        with patch.object(pipeline, 'read_file_cross_platform', wraps=pipeline.read_file_cross_platform) as mock_read:
+            self._run(functions)
+        
+        read_files = [call.args[0] for call in mock_read.call_args_list]
+        self.assertNotIn(os.path.join(self.test_dir, "other.md"), read_files)
+        with open(linking, 'r') as f:
+            content = f.read()
+        self.assertNotIn("(b.md)", content)
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, "b.md")))
+
+
+class TestVaultIndex(unittest.TestCase):
+    """SQLiteによるVaultインデックスのテスト"""
+
+    FUNCTIONS = {
+        "function_create_yfm": True,
+        "function_rename_notes": True,
+        "function_rename_images": False,
+        "function_convert_wikilinks": False,
+    }
+
+    def setUp(self):
+        """テスト用の一時ディレクトリを作成"""
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        for module in (yfm_processor, link_processor, pipeline, vault_index):
+            patcher = patch.object(module, 'logger', MagicMock(), create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _write(self, name, content):
+        path = os.path.join(self.test_dir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def _run(self, files=None):
+        index = vault_index.VaultIndex.open(self.test_dir)
+        self.addCleanup(index.close)
+        pipeline.run_pipeline(self.test_dir, self.test_dir, self.FUNCTIONS, "yaml", files=files, vault_index=index)
+        return index
+
+    def test_index_records_notes_and_links(self):
+        """ノート、タグ、エイリアス、解決済みリンクが索引されることのテスト"""
+        self._write("alpha.md", "---\ntitle: Alpha\naliases: [A1, \"first\"]\ntags: [x]\n---\nSee [[beta]]\n")
+        os.mkdir(os.path.join(self.test_dir, "sub"))
+        self._write(os.path.join("sub", "beta.md"), "#topic\nBack to [[alpha]]\n")
+        index = self._run()
+
+        alpha = index.find(title="Alpha")
+        self.assertEqual(len(alpha), 1)
+        self.assertEqual(index.find(alias="first"), alpha)
+        self.assertEqual(index.find(alias="A1"), alpha)
+        uid = os.path.splitext(os.path.basename(alpha[0]))[0]
+        self.assertEqual(index.find(uid=uid), alpha)
+        self.assertEqual(index.find(file_name=uid + ".md"), alpha)
+        beta = index.find(title="beta")
+        self.assertEqual(index.tagged("topic"), beta)
+        self.assertEqual(index.tags(alpha[0]), ["x"])
+        self.assertEqual(index.links(alpha[0]), beta)
+        self.assertEqual(index.backlinks(alpha[0]), beta)
+        self.assertEqual(vault_index.split_list_value("[a, 'b', a]"), ["a", "b"])
+
+        # 変更のないファイルは索引し直さない
+        with patch.object(index, 'record', side_effect=AssertionError("indexed")):
+            pipeline.run_pipeline(self.test_dir, self.test_dir, self.FUNCTIONS, "yaml", vault_index=index)
+        os.remove(alpha[0])
+        pipeline.run_pipeline(self.test_dir, self.test_dir, self.FUNCTIONS, "yaml", vault_index=index)
+        self.assertEqual(index.find(title="Alpha"), [])
+        self.assertEqual(index.count(), 1)
+
+    def test_backlinks_from_index(self):
+        """リネーム時にリンク元のノートだけを読み込むことのテスト"""
+        self._write("linking.md", "See [[delta]]\n")
+        self._write("other.md", "Nothing here\n")
+        self._run()
+
+        delta = self._write("delta.md", "# Delta\n")
+        with patch.object(pipeline, 'file_contains_any', wraps=pipeline.file_contains_any) as mock_search:
+            index = self._run(files=[delta])
+
+        # リンクしていないother.mdは開かれもしない
+        linking = index.find(title="linking")[0]
+        searched_files = {call.args[0] for call in mock_search.call_args_list}
+        self.assertEqual(searched_files, {linking})
+        with open(linking) as f:
+            self.assertNotIn("[[delta]]", f.read())
+        self.assertEqual(index.backlinks(index.find(title="delta")[0]), index.find(title="linking"))
+
+    def test_only_changed_links_are_resolved(self):
+        """変更されたノートのリンクと、追加・削除されたファイル名へのリンクだけを解決し直すことのテスト"""
+        index = vault_index.VaultIndex(self.test_dir)
+        self.addCleanup(index.close)
+
+        def record(name, content):
+            path = self._write(name, content)
+            index.record(path, os.stat(path), content)
+            return path
+        alpha = record("alpha.md", "See [[gamma]]\n")
+        beta = record("beta.md", "Back to [[alpha]]\n")
+        index.resolve_links()
+        self.assertEqual((index.links(alpha), index.links(beta)), ([], [alpha]))
+
+        # 変更のないbeta.mdのリンクは解決し直さない
+        index.connection.execute("UPDATE links SET resolved = 'stale.md' WHERE source = 'beta.md'")
+        gamma = record("gamma.md", "# Gamma\n")
+        index.resolve_links()
+        self.assertEqual(index.links(alpha), [gamma])
+        self.assertEqual(index.links(beta), [os.path.join(self.test_dir, "stale.md")])
+
+        # 削除されたalpha.mdへのリンクは解決し直す
+        os.remove(alpha)
+        index.remove(alpha)
+        index.resolve_links()
+        self.assertEqual(index.links(beta), [])
+
+    def test_notes_are_indexed_as_they_are_read(self):
+        """読み込んだノートを順に索引し、全ノートをメモリに溜めないことのテスト"""
+        for name in ("a.md", "b.md", "c.md"):
+            self._write(name, "# " + name + "\n")
+        events = []
+        original_read = vault_index._read_note_task
+        index = vault_index.VaultIndex(self.test_dir)
+        self.addCleanup(index.close)
+        original_record = index.record
+
+        def read(item):
+            events.append("read")
+            return original_read(item)
+
+        def record(*args, **kwargs):
+            events.append("record")
+            return original_record(*args, **kwargs)
+        files = [(path, "note", os.stat(path)) for path in sorted(file_operations.get_files(self.test_dir, "note"))]
+        with patch.object(parallel, '_io_jobs', 1), patch.object(vault_index, '_read_note_task', side_effect=read), \
+                patch.object(index, 'record', side_effect=record):
+            self.assertEqual(vault_index.update_vault_index(index, files, {}), 3)
+        self.assertEqual(events, ["read", "record"] * 3)
+
+
+class TestStreamingNotes(unittest.TestCase):
+    """大きなノートを行単位で変換するストリーミング処理のテスト"""
+
+    VAULT = {
+        "a.md": "# A\n#tagA\nLink to [[b]] and ![[img.png]]\n\n\n#x #y\nend [[c|C]]\n\n",
+        "b.md": "---\ntitle: b\ntags: [q]\n---\n\n\nBack to [A](a.md)\n#tagB\n",
+        os.path.join("Inbox", "c.md"): "Draft linking [[a | alias]]",
+        "img.png": "png",
+        "0123456789abcdef0123456789abcdef.md": "Already named, see [[c]]\n",
+        "d.md": "+++\ntitle = \"d\"\n+++\nbody [[a]]\r\nline2\r\n",
+        "e.md": "",
+    }
+
+    def setUp(self):
+        """テスト用の一時ディレクトリを作成"""
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        for module in (yfm_processor, link_processor, pipeline, streaming):
+            patcher = patch.object(module, 'logger', MagicMock(), create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.vault = TestPipeline(methodName='setUp')
+        self.vault.test_dir = self.test_dir
+        self.vault.VAULT = self.VAULT
+
+    def _run(self, functions, stream_min_bytes):
+        self.vault._create_vault()
+        with self.vault._uuid_sequence(), patch.object(streaming, 'STREAM_MIN_BYTES', stream_min_bytes):
+            result = pipeline.run_pipeline(self.test_dir, self.test_dir, functions, "yaml")
+        return result, self.vault._snapshot()
+
+    def test_streamed_notes_match_in_memory_results(self):
+        """行単位の変換結果がメモリ上の変換結果と一致することのテスト"""
+        for functions in (
+            TestPipeline.FUNCTIONS,
+            dict(TestPipeline.FUNCTIONS, function_create_yfm=False),
+            dict(TestPipeline.FUNCTIONS, function_rename_notes=False, function_convert_wikilinks=False),
+        ):
+            in_memory = self._run(functions, 10 ** 9)
+            with patch.object(pipeline, 'read_file_cross_platform', side_effect=AssertionError("loaded")):
+                streamed = self._run(functions, 0)
+            self.assertEqual(streamed, in_memory)
+
+    def test_summary_matches_content(self):
+        """一次走査の要約がノート全体から求めた値と一致することのテスト"""
+        path = os.path.join(self.test_dir, "note.md")
+        with open(path, 'w', newline='') as f:
+            f.write("---\ntitle: Note\n---\r\n#tag1 text\r\nSee [[other]] and [x](y.md)\r\nlast")
+        summary = streaming.summarize_note(path)
+        content = utils.read_file_cross_platform(path)
+
+        self.assertEqual(summary.hash, manifest.hash_content(content))
+        self.assertEqual(summary.head_lines, 3)
+        self.assertEqual(summary.tag_line(), yfm_processor.create_tag_line_from_lines(content))
+        self.assertEqual(summary.metadata(), manifest.extract_note_metadata(content))
+
+    def test_stream_operation_can_be_replayed(self):
+        """中断後に同じ操作を再実行しても結果が変わらないことのテスト"""
+        path = os.path.join(self.test_dir, "note.md")
+        with open(path, 'w') as f:
+            f.write("#tag1\nSee [[old]]\n")
+        operation = {
+            "op": "stream", "path": "note.md", "header": "---\nuid: u\n---\n", "head_lines": 0,
+            "body": "strip", "insert_line": None, "convert_wikilinks": True, "renames": {"old.md": "new.md"},
+        }
+
+        self.assertTrue(link_processor.apply_journal_operation(operation, self.test_dir))
+        with open(path) as f:
+            written = f.read()
+        self.assertFalse(link_processor.apply_journal_operation(operation, self.test_dir))
+        with open(path) as f:
+            self.assertEqual(f.read(), written)
+        self.assertEqual(written, "---\nuid: u\n---\n\nSee [old](new.md)\n")
+
+
+class TestBenchmarkVaultGenerator(unittest.TestCase):
+    """ベンチマーク用の合成Vault生成のテスト"""
+
+    def setUp(self):
+        """テスト用の一時ディレクトリを作成"""
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'benchmarks'))
+        self.addCleanup(sys.path.pop, 0)
+
+    def _snapshot(self, root):
+        snapshot = {}
+        for pathname, dirnames, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(pathname, filename)
+                with open(path, 'rb') as f:
+                    snapshot[os.path.relpath(path, root)] = f.read()
+        return snapshot
+
+    def test_generate_vault_is_deterministic(self):
+        """同じシードで同じVaultが生成されることのテスト"""
+        from generate_vault import generate_vault
+        
+        first = os.path.join(self.test_dir, "first")
+        second = os.path.join(self.test_dir, "second")
+        summary = generate_vault(first, 200, seed=7)
+        generate_vault(second, 200, seed=7)
+        
+        self.assertEqual(self._snapshot(first), self._snapshot(second))
+        self.assertEqual(summary["notes"], 200)
+        self.assertEqual(len(file_operations.get_files(first, "note")), 200)
+        self.assertEqual(len(file_operations.get_files(first, "image")), summary["images"])
+        # 全てのフロントマター形式が含まれる
+        self.assertTrue(all(count > 0 for count in summary["front_matter"].values()))
+        self.assertTrue(os.path.isdir(os.path.join(first, "Inbox")))
+
+
+class TestRunStats(unittest.TestCase):
+    """実行統計のテスト"""
+
+    def setUp(self):
+        """テスト用の一時ディレクトリを作成"""
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        for module in (yfm_processor, link_processor, pipeline, parallel):
+            patcher = patch.object(module, 'logger', MagicMock(), create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(stats.deactivate)
+
+    def _create_vault(self):
+        for name, content in (("a.md", "# A\n[[b]] [[c]]\n"), ("b.md", "# B\n[[a]]\n"), ("c.md", "# C\n")):
+            with open(os.path.join(self.test_dir, name), 'w') as f:
+                f.write(content)
+
+    def _run(self, jobs, latencies=True):
+        run_stats = stats.RunStats(latencies)
+        stats.activate(run_stats)
+        pipeline.run_pipeline(self.test_dir, self.test_dir, TestPipeline.FUNCTIONS, "yaml", jobs=jobs)
+        stats.deactivate()
+        run_stats.finish()
+        return run_stats
+
+    def test_pipeline_stats(self):
+        """パイプラインの統計が記録されることのテスト"""
+        self._create_vault()
+        run_stats = self._run(jobs=1)
+        
+        totals = run_stats.totals()
+        self.assertEqual(totals["files_read"], 3)
+        self.assertEqual(totals["files_written"], 3)
+        self.assertGreater(totals["bytes_read"], 0)
+        self.assertGreater(totals["bytes_written"], totals["bytes_read"])
+        # WikiLink変換3件 + バックリンク置換3件
+        self.assertEqual(totals["links_rewritten"], 6)
+        self.assertIn("load", run_stats.stages)
+        self.assertIn("backlinks", run_stats.stages)
+        
+        report = run_stats.to_dict()
+        self.assertEqual(len(report["stages"]), len(run_stats.stages))
+        self.assertTrue(report["stages"][1]["slowest_files"])
+        self.assertTrue(any("Slowest files:" in line for line in run_stats.report_lines()))
+
+    def test_parallel_stats_are_merged(self):
+        """ワーカーの統計がマージされることのテスト"""
+        self._create_vault()
+        with patch.object(parallel, 'PARALLEL_MIN_FILES', 0):
+            run_stats = self._run(jobs=2)
+        
+        self.assertEqual(run_stats.totals()["links_rewritten"], 6)
+        self.assertEqual(len(run_stats.stages["frontmatter_and_wikilinks"].latencies), 3)
+
+    def test_history_stats_do_not_time_files(self):
+        """実行履歴のためだけの統計ではファイルごとの時間を計らないことのテスト"""
+        self._create_vault()
+        with patch.object(parallel, '_call_timed', side_effect=AssertionError("timed")):
+            run_stats = self._run(jobs=1, latencies=False)
+        self.assertEqual(run_stats.totals()["files_written"], 3)
+        self.assertEqual([stage_stats.latencies for stage_stats in run_stats.stages.values() if stage_stats.latencies], [])
+
+        for name in os.listdir(self.test_dir):
+            os.remove(os.path.join(self.test_dir, name))
+        self._create_vault()
+        with patch.object(parallel, 'PARALLEL_MIN_FILES', 0):
+            run_stats = self._run(jobs=2, latencies=False)
+        self.assertEqual(run_stats.totals()["links_rewritten"], 6)
+        self.assertEqual(run_stats.stages["frontmatter_and_wikilinks"].latencies, [])
+
+    def test_recording_without_collector(self):
+        """統計が無効の場合は何も記録されないことのテスト"""
+        stats.deactivate()
+        stats.record_read(100)
+        stats.record("links_rewritten", 3)
+        with stats.stage("nothing") as stage_stats:
+            self.assertIsNone(stage_stats)
+        self.assertFalse(stats.is_active())
+
+    def test_histogram(self):
+        """レイテンシのヒストグラムのテスト"""
+        stage_stats = stats.StageStats("test")
+        stage_stats.latencies = [(0.0005, "a"), (0.005, "b"), (0.05, "c"), (2.0, "d")]
+        self.assertEqual(stage_stats.histogram(), [1, 1, 1, 0, 1])
+        self.assertEqual(stage_stats.slowest(1), [(2.0, "d")])
+
+
+class TestLogging(unittest.TestCase):
+    """ログ出力と進捗表示のテスト"""
+
+    def setUp(self):
+        """テスト用の一時ディレクトリを作成"""
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        patcher = patch.object(progress, 'logger', MagicMock())
+        self.progress_logger = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _messages(self):
+        return [call.args[0] for call in self.progress_logger.info.call_args_list]
+
+    def test_progress_is_rate_limited(self):
+        """進捗が一定間隔でのみ件数・速度・残り時間付きで出力されることのテスト"""
+        times = iter([0.0, 0.5, 1.0, 1.5, 2.5, 3.0, 4.0])
+        with patch.object(progress.time, 'monotonic', lambda: next(times)):
+            reporter = progress.Progress("Test", 10, interval=1.0)
+            for _ in range(5):
+                reporter.update()
+            reporter.finish()
+        
+        messages = self._messages()
+        self.assertEqual(len(messages), 3)
+        self.assertEqual(messages[0], "Test: 2/10 files (20%), 2.0 files/s, ETA 0:04")
+        self.assertEqual(messages[1], "Test: 4/10 files (40%), 1.6 files/s, ETA 0:04")
+        self.assertEqual(messages[2], "Test: 5/10 files in 0:04 (1.2 files/s)")
+
+    def test_pool_reports_progress(self):
+        """ワーカープロセスの結果に対して進捗が出力されることのテスト"""
+        with patch.object(parallel, 'logger', MagicMock()), patch.object(parallel, 'PARALLEL_MIN_FILES', 0):
+            results = parallel.map_in_pool(_parallel_log_task, range(20), jobs=2, progress="Test")
+        
+        self.assertEqual(results, [i * 2 for i in range(20)])
+        self.assertTrue(self._messages()[-1].startswith("Test: 20/20 files in "))
+
+    def test_setup_logger_writes_through_queue(self):
+        """ログファイルがキュー経由で書かれ、quietではコンソールにINFOが出ないことのテスト"""
+        import logging
+        from logging.handlers import QueueHandler
+        root_logger = logging.getLogger()
+        self.addCleanup(root_logger.setLevel, root_logger.level)
+        self.addCleanup(utils.stop_logger)
+        
+        logger = utils.setup_logger(self.test_dir, "DEBUG", quiet=True)
+        handlers = [handler for handler in root_logger.handlers if handler in utils._log_handlers]
+        self.assertTrue(any(isinstance(handler, QueueHandler) for handler in handlers))
+        console_handler = next(handler for handler in handlers if not isinstance(handler, QueueHandler))
+        self.assertEqual(console_handler.level, logging.WARNING)
+        logger.debug("debug message")
+        logger.info("info message")
+        utils.stop_logger()
+        
+        self.assertFalse(any(handler in root_logger.handlers for handler in handlers))
+        with open(os.path.join(self.test_dir, config.LOG_FILE), encoding='utf-8') as f:
+            log = f.read()
+        self.assertIn("[DEBUG] debug message", log)
+        self.assertIn("[INFO] info message", log)
+
+
+class TestRunHistory(unittest.TestCase):
+    """実行履歴と性能劣化検出のテスト"""
+
+    def setUp(self):
+        """テスト用の一時ディレクトリを作成"""
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        self.addCleanup(stats.deactivate)
+
+    def _run(self, seconds, vault_files=1000, mode="pipeline"):
+        return {
+            "version": "1.0.0", "started": "2026-01-01T00:00:00", "mode": mode, "jobs": 4,
+            "vault_files": vault_files, "wall_seconds": seconds + 1.0,
+            "stages": {"load": 1.0, "backlinks": seconds},
+            "bytes_read": 0, "bytes_written": 0, "files_written": 0, "files_renamed": 0, "links_rewritten": 0,
+        }
+
+    def test_pipeline_run_is_recorded(self):
+        """パイプラインの実行が段階ごとの時間と変更数付きで記録されることのテスト"""
+        for name in ("a.md", "b.md"):
+            with open(os.path.join(self.test_dir, name), 'w') as f:
+                f.write("# " + name + "\n[[a]]\n")
+        run_stats = stats.RunStats()
+        stats.activate(run_stats)
+        with patch.object(pipeline, 'logger', MagicMock()), patch.object(link_processor, 'logger', MagicMock(), create=True):
+            pipeline.run_pipeline(self.test_dir, self.test_dir, TestPipeline.FUNCTIONS, "yaml")
+        stats.deactivate()
+        run_stats.finish()
+        
+        record = history.build_run_record(run_stats, "pipeline", jobs=1)
+        self.assertTrue(history.append_run(self.test_dir, record))
+        
+        runs = history.load_history(self.test_dir)
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(runs[0]["vault_files"], 2)
+        self.assertEqual(runs[0]["files_renamed"], 2)
+        self.assertEqual(runs[0]["files_written"], 2)
+        self.assertEqual(list(runs[0]["stages"]), list(run_stats.stages))
+        self.assertNotIn("targets", runs[0])
+
+    def test_history_keeps_recent_runs(self):
+        """古い実行が削除され、壊れた行が読み飛ばされることのテスト"""
+        with patch.object(history, 'HISTORY_MAX_RUNS', 3):
+            for seconds in range(5):
+                history.append_run(self.test_dir, self._run(seconds))
+        with open(history.get_history_path(self.test_dir), 'a') as f:
+            f.write("{broken\n")
+        
+        runs = history.load_history(self.test_dir)
+        self.assertEqual([run["stages"]["backlinks"] for run in runs], [2, 3, 4])
+
+    def test_regression_against_comparable_runs(self):
+        """同じ規模の実行と比べて遅い段階だけが検出されることのテスト"""
+        runs = [self._run(seconds) for seconds in (10.0, 11.0, 9.0, 10.5)]
+        
+        regressions = history.find_regressions(runs, self._run(20.0))
+        self.assertEqual([name for name, seconds, expected in regressions], ["backlinks", "total"])
+        self.assertEqual(regressions[0][2], 10.25)
+        # 通常の揺らぎは検出されない
+        self.assertEqual(history.find_regressions(runs, self._run(12.0)), [])
+        # 規模やモードが違う実行とは比較しない
+        self.assertEqual(history.find_regressions(runs, self._run(20.0, vault_files=2000)), [])
+        self.assertEqual(history.find_regressions(runs, self._run(20.0, mode="staged")), [])
+        # 比較できる実行が少なすぎる場合は検出しない
+        self.assertEqual(history.find_regressions(runs[:2], self._run(20.0)), [])
+
+    def test_history_command(self):
+        """historyサブコマンドが推移と劣化を表示することのテスト"""
+        from zettelkasten_normalizer import normalization_zettel
+        for seconds in (10.0, 11.0, 9.0, 20.0):
+            history.append_run(self.test_dir, self._run(seconds))
+        
+        with patch('sys.stdout', new=StringIO()) as output:
+            with self.assertRaises(SystemExit) as context:
+                normalization_zettel.main(["history", self.test_dir, "--check"])
+        self.assertEqual(context.exception.code, 1)
+        report = output.getvalue()
+        self.assertIn("SLOWER", report)
+        self.assertIn("backlinks took 20.00s, 2.0x its baseline of 10.00s", report)
+
+
+class TestChangePlan(unittest.TestCase):
+    """変更計画（--plan / apply）のテスト"""
+
+    def setUp(self):
+        """テスト用の一時ディレクトリを作成"""
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        for module in (yfm_processor, link_processor, pipeline, plan):
+            patcher = patch.object(module, 'logger', MagicMock(), create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.vault = TestPipeline(methodName='setUp')
+        self.vault.test_dir = self.test_dir
+
+    def _plan(self):
+        with self.vault._uuid_sequence():
+            result = pipeline.plan_pipeline(self.test_dir, self.test_dir, TestPipeline.FUNCTIONS, "yaml")
+        return result, plan.build_change_plan(result, self.test_dir, "yaml")
+
+    def test_plan_does_not_touch_vault(self):
+        """計画の作成でファイルが変更されないことのテスト"""
+        self.vault._create_vault()
+        before = self.vault._snapshot()
+        result, change_plan = self._plan()
+        
+        self.assertEqual(self.vault._snapshot(), before)
+        self.assertEqual(change_plan["summary"]["files_to_rename"], 4)
+        self.assertEqual(change_plan["summary"]["files_to_write"], 4)
+        diff = plan.render_diff(result, self.test_dir)
+        self.assertIn("--- a/a.md", diff)
+        self.assertIn("rename from img.png", diff)
+
+    def test_apply_matches_pipeline(self):
+        """計画の適用結果が通常実行の結果と一致することのテスト"""
+        self.vault._create_vault()
+        with self.vault._uuid_sequence():
+            pipeline.run_pipeline(self.test_dir, self.test_dir, TestPipeline.FUNCTIONS, "yaml")
+        expected = self.vault._snapshot()
+        
+        self.vault._create_vault()
+        _, change_plan = self._plan()
+        plan_path = os.path.join(self.test_dir, "..", os.path.basename(self.test_dir) + ".plan.json")
+        self.addCleanup(os.remove, plan_path)
+        plan.save_plan(change_plan, plan_path)
+        with patch.object(pipeline, 'read_file_cross_platform', side_effect=AssertionError):
+            result = plan.apply_plan(plan.load_plan(plan_path), self.test_dir)
+        
+        self.assertEqual(result, (4, 4))
+        self.assertEqual(self.vault._snapshot(), expected)
+
+    def test_interrupted_apply_can_be_resumed(self):
+        """適用途中で中断しても --resume でバックリンクまで書き終えられることのテスト"""
+        self.vault._create_vault()
+        with self.vault._uuid_sequence():
+            pipeline.run_pipeline(self.test_dir, self.test_dir, TestPipeline.FUNCTIONS, "yaml")
+        expected = self.vault._snapshot()
+
+        self.vault._create_vault()
+        _, change_plan = self._plan()
+        # リネームの後、最初の書き込みで中断
+        interrupt = TestRenameJournal._interrupt_on_call(self, link_processor, 'write_file_cross_platform', 1)
+        with interrupt, self.assertRaises(KeyboardInterrupt):
+            plan.apply_plan(change_plan, self.test_dir)
+        self.assertTrue(journal.RenameJournal.exists(self.test_dir))
+        # 中断された実行が残っている間は適用しない
+        self.assertIsNone(plan.apply_plan(change_plan, self.test_dir, force=True))
+
+        self.assertTrue(link_processor.resume_journal(self.test_dir))
+        self.assertEqual(self.vault._snapshot(), expected)
+
+    def test_apply_refuses_stale_plan(self):
+        """計画作成後に変更されたボールトには適用しないことのテスト"""
+        self.vault._create_vault()
+        _, change_plan = self._plan()
+        with open(os.path.join(self.test_dir, "a.md"), 'a') as f:
+            f.write("edited\n")
+        before = self.vault._snapshot()
+        
+        self.assertIsNone(plan.apply_plan(change_plan, self.test_dir))
+        self.assertEqual(self.vault._snapshot(), before)
+        self.assertEqual(plan.check_plan(change_plan, self.test_dir),
+                         ["file has changed since the plan was made: a.md"])
+
+
+class _ScriptedWatcher:
+    """イベントを順に返すテスト用のウォッチャー"""
+
+    def __init__(self, events):
+        self.events = list(events)
+        self.closed = False
+
+    def poll(self, timeout):
+        if self.events:
+            event = self.events.pop(0)
+            return event() if callable(event) else event
+        return set()
+
+    def close(self):
+        self.closed = True
+
+
+class TestWatchMode(unittest.TestCase):
+    """監視モードのテスト"""
+
+    def setUp(self):
+        """テスト用の一時ディレクトリを作成"""
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        for module in (yfm_processor, link_processor, pipeline, manifest, watcher):
+            patcher = patch.object(module, 'logger', MagicMock(), create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        with open(os.path.join(self.test_dir, "a.md"), 'w') as f:
+            f.write("# A\nSee [[new]]\n")
+
+    def _create_note(self):
+        path = os.path.join(self.test_dir, "new.md")
+        with open(path, 'w') as f:
+            f.write("# New\n")
+        # 以降はボールト全体を走査しないこと
+        patcher = patch.object(pipeline, 'get_files', side_effect=AssertionError("vault scanned"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return {path}
+
+    def test_new_note_is_normalized_with_index(self):
+        """作成されたノートだけが正規化され、インデックスでバックリンクが更新されることのテスト"""
+        scripted = _ScriptedWatcher([self._create_note])
+        batch_cnt = watcher.watch(self.test_dir, TestPipeline.FUNCTIONS, "yaml",
+                                  debounce=0, watcher=scripted, max_batches=1)
+        
+        self.assertEqual(batch_cnt, 1)
+        self.assertTrue(scripted.closed)
+        notes = [f for f in os.listdir(self.test_dir) if f.endswith(".md")]
+        self.assertEqual(len(notes), 2)
+        self.assertNotIn("new.md", notes)
+        linking = [f for f in notes if "See [" in open(os.path.join(self.test_dir, f)).read()][0]
+        new_note = [f for f in notes if f != linking][0]
+        with open(os.path.join(self.test_dir, linking)) as f:
+            self.assertIn("(" + new_note + ")", f.read())
+
+    def test_own_writes_are_skipped(self):
+        """自身の書き込みによるイベントが無視されることのテスト"""
+        with patch.object(watcher, 'run_pipeline', wraps=pipeline.run_pipeline) as run:
+            files = lambda: {os.path.join(self.test_dir, f) for f in os.listdir(self.test_dir)}
+            watcher.watch(self.test_dir, TestPipeline.FUNCTIONS, "yaml",
+                          debounce=0, watcher=_ScriptedWatcher([files]), max_batches=1)
+        # 初回の正規化のみ実行される
+        self.assertEqual(run.call_count, 1)
+
+    def test_manifest_backlink_index(self):
+        """マニフェストのバックリンクインデックスが更新されることのテスト"""
+        vault_manifest = manifest.VaultManifest(self.test_dir)
+        path = os.path.join(self.test_dir, "a.md")
+        vault_manifest.record(path, "[[b]] [c](c.md)")
+        self.assertEqual(vault_manifest.linking_files({"b", "x"}), {path})
+        vault_manifest.record(path, "[[x]]")
+        self.assertEqual(vault_manifest.linking_files({"b", "c.md"}), set())
+        self.assertEqual(vault_manifest.linking_files({"x"}), {path})
+        vault_manifest.remove(path)
+        self.assertEqual(vault_manifest.linking_files({"x"}), set())
+
+    @unittest.skipUnless(sys.platform.startswith("linux"), "inotify is only available on Linux")
+    def test_inotify_watcher(self):
+        """inotifyで作成・削除が検出されることのテスト"""
+        inotify = watcher.InotifyWatcher(self.test_dir)
+        self.addCleanup(inotify.close)
+        os.makedirs(os.path.join(self.test_dir, ".hidden"))
+        path = os.path.join(self.test_dir, "b.md")
+        with open(path, 'w') as f:
+            f.write("B\n")
+        self.assertEqual(inotify.poll(1), {path})
+        os.remove(path)
+        self.assertEqual(inotify.poll(1), {path})
+        self.assertEqual(inotify.poll(0), set())
+
+
+@unittest.skipUnless(hasattr(__import__('socket'), 'AF_UNIX'), "Unix domain sockets are not available")
+class TestNormalizationServer(unittest.TestCase):
+    """常駐サーバーのテスト"""
+
+    def setUp(self):
+        """テスト用の一時ディレクトリを作成"""
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        for module in (yfm_processor, link_processor, pipeline, manifest, watcher, server):
+            patcher = patch.object(module, 'logger', MagicMock(), create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        with open(os.path.join(self.test_dir, "a.md"), 'w') as f:
+            f.write("# A\n")
+        self.socket_path = os.path.join(self.test_dir, "test.sock")
+
+    def _start(self, events):
+        normalization_server = server.NormalizationServer(
+            self.test_dir, TestPipeline.FUNCTIONS, "yaml", socket_path=self.socket_path,
+            watcher=_ScriptedWatcher(events))
+        self.addCleanup(normalization_server.close)
+        normalization_server.start()
+        return normalization_server
+
+    def test_request_uses_index_and_dirty_notes(self):
+        """要求されたノートだけを走査なしで正規化し、外部で変更されたノートのリンクも更新することのテスト"""
+        linker = os.path.join(self.test_dir, "linker.md")
+        normalization_server = self._start([set(), {linker}])
+        with open(os.path.join(self.test_dir, "new.md"), 'w') as f:
+            f.write("# New\n")
+        with open(linker, 'w') as f:
+            f.write("See [[new]]\n")
+
+        with patch.object(pipeline, 'scan_vault', side_effect=AssertionError("vault scanned")), \
+                patch.object(pipeline, 'get_files', side_effect=AssertionError("vault scanned")):
+            response = normalization_server.handle(
+                {"command": "normalize", "cwd": self.test_dir, "paths": ["new.md", "../outside.md"]})
+
+        self.assertTrue(response["ok"])
+        self.assertEqual(response["files_renamed"], 1)
+        self.assertEqual(response["linked_files_updated"], 1)
+        self.assertEqual(len(response["skipped"]), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.test_dir, "new.md")))
+        with open(linker) as f:
+            self.assertRegex(f.read(), r"See \[new\]\([0-9a-f]{32}\.md\)")
+
+    def test_client_round_trip(self):
+        """クライアントとソケットで通信し、停止要求で終了することのテスト"""
+        import socket
+        import threading
+        # 強制終了したサーバーが残したソケット
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(self.socket_path)
+        stale.close()
+
+        normalization_server = self._start([])
+        thread = threading.Thread(target=normalization_server.serve_forever)
+        thread.start()
+        try:
+            response = client.send_request(self.socket_path, {"command": "ping"}, timeout=10)
+            self.assertTrue(response["ok"])
+            response = client.send_request(self.socket_path, {"command": "stop"}, timeout=10)
+            self.assertTrue(response["ok"])
+        finally:
+            thread.join(timeout=10)
+        self.assertFalse(thread.is_alive())
+        normalization_server.close()
+        self.assertFalse(os.path.exists(self.socket_path))
+
+
+class TestRenameJournal(unittest.TestCase):
+    """リネームジャーナルと --resume のテスト"""
+
+    def setUp(self):
+        """テスト用の一時ディレクトリを作成"""
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        for module in (yfm_processor, link_processor, pipeline, journal):
+            patcher = patch.object(module, 'logger', MagicMock(), create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.vault = TestPipeline(methodName='setUp')
+        self.vault.test_dir = self.test_dir
+
+    def _interrupt_on_call(self, target, name, call_no):
+        """call_no回目の呼び出しでプロセスが中断されたように振る舞う"""
+        original = getattr(target, name)
+        calls = []
+        
+        def interrupted(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == call_no:
+                raise KeyboardInterrupt
+            return original(*args, **kwargs)
+        return patch.object(target, name, side_effect=interrupted)
+
+    def _run_staged(self):
+        notes = file_operations.get_files(self.test_dir, "note")
+        link_processor.rename_notes_with_links(notes, self.test_dir)
+
+    def _assert_resume_matches(self, run, target, name, call_no):
+        self.vault._create_vault()
+        with self.vault._uuid_sequence():
+            run()
+        expected = self.vault._snapshot()
+        
+        self.vault._create_vault()
+        with self.vault._uuid_sequence():
+            with self._interrupt_on_call(target, name, call_no):
+                with self.assertRaises(KeyboardInterrupt):
+                    run()
+        self.assertTrue(journal.RenameJournal.exists(self.test_dir))
+        
+        self.assertTrue(link_processor.resume_journal(self.test_dir))
+        self.assertFalse(journal.RenameJournal.exists(self.test_dir))
+        self.assertEqual(self.vault._snapshot(), expected)
+
+    def test_resume_staged_renames(self):
+        """リネーム途中で中断した段階的実行を再開できることのテスト"""
+        self._assert_resume_matches(self._run_staged, link_processor.shutil, 'move', 2)
+
+    def test_resume_staged_backlinks(self):
+        """バックリンク書き換え途中で中断した段階的実行を再開できることのテスト"""
+        # 3ノートのUID挿入の後、最初のバックリンク書き換えで中断
+        self._assert_resume_matches(self._run_staged, link_processor, 'write_file_cross_platform', 4)
+
+    def test_resume_pipeline(self):
+        """書き込み途中で中断したパイプラインを再開できることのテスト"""
+        run = lambda: pipeline.run_pipeline(self.test_dir, self.test_dir, TestPipeline.FUNCTIONS, "yaml")
+        self._assert_resume_matches(run, link_processor, 'write_file_cross_platform', 3)
+
+    def test_resume_after_failed_rename(self):
+        """リネームに失敗したノートが書き込まれず、再開後に正しく正規化されることのテスト"""
+        run = lambda: pipeline.run_pipeline(self.test_dir, self.test_dir, TestPipeline.FUNCTIONS, "yaml")
+        self.vault._create_vault()
+        with self.vault._uuid_sequence():
+            run()
+        expected = self.vault._snapshot()
+        
+        self.vault._create_vault()
+        before = self.vault._snapshot()
+        original_move = shutil.move
+        
+        def failing_move(source, destination):
+            if os.path.basename(source) == "b.md":
+                raise OSError("simulated failure")
+            return original_move(source, destination)
+        with self.vault._uuid_sequence():
+            with patch.object(link_processor.shutil, 'move', side_effect=failing_move):
+                run()
+        self.assertTrue(journal.RenameJournal.exists(self.test_dir))
+        # 失敗したリネームの移動先は作られず、元のノートが残る（再開用の書き込み内容は隠しファイルに残る）
+        snapshot = self.vault._snapshot()
+        self.assertEqual(snapshot["b.md"], before["b.md"])
+        del snapshot[config.JOURNAL_FILE]
+        snapshot = {name: content for name, content in snapshot.items() if not name.endswith(".staged")}
+        self.assertEqual(len(snapshot), len(before))
+        
+        self.assertTrue(link_processor.resume_journal(self.test_dir))
+        self.assertFalse(journal.RenameJournal.exists(self.test_dir))
+        self.assertEqual(self.vault._snapshot(), expected)
+
+    def test_journal_holds_hashes_in_bounded_lines(self):
+        """ジャーナルがノート内容を持たず、操作を上限件数ごとの行に記録することのテスト"""
+        with patch.object(journal, 'JOURNAL_BATCH_OPERATIONS', 2):
+            self._assert_resume_matches(
+                lambda: pipeline.run_pipeline(self.test_dir, self.test_dir, TestPipeline.FUNCTIONS, "yaml"),
+                link_processor, 'write_file_cross_platform', 1)
+
+        self.vault._create_vault()
+        with self.vault._uuid_sequence(), patch.object(journal, 'JOURNAL_BATCH_OPERATIONS', 2), \
+                self._interrupt_on_call(link_processor, 'write_file_cross_platform', 1):
+            with self.assertRaises(KeyboardInterrupt):
+                pipeline.run_pipeline(self.test_dir, self.test_dir, TestPipeline.FUNCTIONS, "yaml")
+        with open(os.path.join(self.test_dir, config.JOURNAL_FILE), encoding="utf-8") as f:
+            text = f.read()
+        self.assertNotIn("Back to", text)
+        batches = [record["operations"] for record in map(json.loads, text.splitlines()) if "operations" in record]
+        self.assertGreater(len(batches), 1)
+        self.assertTrue(all(len(batch) <= 2 for batch in batches))
+        writes = [operation for batch in batches for operation in batch if operation["op"] == "write"]
+        self.assertTrue(writes and all("content" not in operation for operation in writes))
+
+    def test_incomplete_plan_is_dropped(self):
+        """記録途中で中断した計画は実行されず、退避した内容も削除されることのテスト"""
+        path = os.path.join(self.test_dir, "a.md")
+        with open(path, 'w') as f:
+            f.write("old\n")
+        operation = link_processor.stage_write_operation({"op": "write", "path": "a.md"}, "new\n", self.test_dir)
+        staged_path = os.path.join(self.test_dir, operation["staged"])
+        self.assertTrue(os.path.exists(staged_path))
+        rename_journal = journal.RenameJournal(self.test_dir)
+        rename_journal.begin({"stage": "test"}, [operation])
+        rename_journal.close()
+        with open(rename_journal.path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        # 計画の終わりの印が書かれる前に中断
+        with open(rename_journal.path, 'w', encoding="utf-8") as f:
+            f.write("\n".join(lines[:-1]) + "\n")
+
+        loaded = journal.RenameJournal.load(self.test_dir)
+        self.assertEqual((loaded.pending(), loaded.unplanned), ([], [operation]))
+        self.assertTrue(link_processor.resume_journal(self.test_dir))
+        self.assertFalse(os.path.exists(staged_path))
+        self.assertFalse(journal.RenameJournal.exists(self.test_dir))
+        with open(path) as f:
+            self.assertEqual(f.read(), "old\n")
+
+    def test_rename_never_replaces_a_file(self):
+        """リネーム先が既に存在する場合は上書きしないことのテスト"""
+        for name in ("a.md", "b.md"):
+            with open(os.path.join(self.test_dir, name), 'w') as f:
+                f.write(name)
+        with self.assertRaises(FileExistsError):
+            link_processor.apply_journal_operation({"op": "rename", "type": "note", "from": "a.md", "to": "b.md"}, self.test_dir)
+        with open(os.path.join(self.test_dir, "b.md")) as f:
+            self.assertEqual(f.read(), "b.md")
+        self.assertTrue(os.path.exists(os.path.join(self.test_dir, "a.md")))
+
+    def test_torn_last_line_is_ignored(self):
+        """クラッシュで途切れた最終行が無視されることのテスト"""
+        rename_journal = journal.RenameJournal(self.test_dir)
+        rename_journal.begin({"stage": "test"}, [{"op": "write", "path": "a.md", "content": "a"},
+                                                 {"op": "write", "path": "b.md", "content": "b"}])
+        rename_journal.complete(0)
+        rename_journal.close()
+        with open(rename_journal.path, 'a') as f:
+            f.write('{"do')
+        
+        loaded = journal.RenameJournal.load(self.test_dir)
+        self.assertEqual(loaded.pending(), [(1, {"op": "write", "path": "b.md", "content": "b"})])
+        with self.assertRaises(FileExistsError):
+            journal.RenameJournal(self.test_dir).begin({}, [])
+
+
+class TestBatchTargets(unittest.TestCase):
+    """複数ターゲットの一括処理のテスト"""
+
+    def setUp(self):
+        """テスト用の一時ディレクトリを作成"""
+        self.test_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.test_dir)
+        for module in (yfm_processor, link_processor, pipeline):
+            patcher = patch.object(module, 'logger', MagicMock(), create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.vault = TestPipeline(methodName='setUp')
+        self.vault.test_dir = self.test_dir
+        self.vault._create_vault()
+
+    def test_collect_targets(self):
+        """-t の繰り返しと --files-from からターゲットを集めることのテスト"""
+        from zettelkasten_normalizer import normalization_zettel
+        a = os.path.join(self.test_dir, "a.md")
+        b = os.path.join(self.test_dir, "b.md")
+        c = os.path.join(self.test_dir, "Inbox", "c.md")
+        list_file = os.path.join(self.test_dir, "files.txt")
+        with open(list_file, 'w') as f:
+            f.write(c + "\n" + os.path.join(self.test_dir, "deleted.md") + "\n" + os.path.abspath(__file__) + "\n")
+        args = normalization_zettel.parse_arguments([self.test_dir, "-t", a, "-t", b, "--files-from", list_file])
+        with patch('sys.stdout', new_callable=StringIO):
+            targets = normalization_zettel.collect_targets(args, self.test_dir)
+        self.assertEqual(targets, [a, b, c])
+        # ターゲットが1つだけなら従来どおり
+        args = normalization_zettel.parse_arguments([self.test_dir, "-t", a])
+        self.assertIsNone(normalization_zettel.collect_targets(args, self.test_dir))
+
+    def test_batch_is_one_run_with_one_scan(self):
+        """一括処理でボールトの走査が1回で、段階的実行と結果が一致することのテスト"""
+        from zettelkasten_normalizer import normalization_zettel
+        targets = [os.path.join(".", os.path.relpath(os.path.join(self.test_dir, "a.md"))),
+                   os.path.join(self.test_dir, "img.png")]
+        snapshots = []
+        for use_pipeline in (False, True):
+            self.vault._create_vault()
+            with self.vault._uuid_sequence(), patch.object(os, 'scandir', wraps=os.scandir) as scandir:
+                normalization_zettel.execute_normalization(
+                    self.test_dir, self.test_dir, MagicMock(), TestPipeline.FUNCTIONS, "yaml",
+                    use_pipeline=use_pipeline, targets=targets)
+            # ルートとInboxの2フォルダ
+            self.assertEqual(scandir.call_count, 2)
+            snapshots.append(self.vault._snapshot())
+        self.assertEqual(snapshots[0], snapshots[1])
+        # a.md と画像だけがリネームされ、b.md のリンクは更新される
+        self.assertNotIn("a.md", snapshots[1])
+        self.assertNotIn("img.png", snapshots[1])
+        self.assertIn("b.md", snapshots[1])
+        self.assertNotIn("(a.md)", snapshots[1]["b.md"])
+
+    @unittest.skipUnless(shutil.which("git"), "git is not available")
+    def test_changed_since(self):
+        """--changed-since でgitの変更ファイルを集めることのテスト"""
+        import subprocess
+        from zettelkasten_normalizer import normalization_zettel
+        git = ["git", "-c", "user.name=test", "-c", "user.email=test@example.com"]
+        subprocess.run(git + ["init", "-q"], cwd=self.test_dir, check=True)
+        subprocess.run(git + ["add", "-A"], cwd=self.test_dir, check=True)
+        subprocess.run(git + ["commit", "-q", "-m", "vault"], cwd=self.test_dir, check=True)
+        with open(os.path.join(self.test_dir, "b.md"), 'a') as f:
+            f.write("edited\n")
+        with open(os.path.join(self.test_dir, "d.md"), 'w') as f:
+            f.write("new\n")
+        subprocess.run(git + ["add", "d.md"], cwd=self.test_dir, check=True)
+        changed = normalization_zettel.get_changed_files(self.test_dir, "HEAD")
+        self.assertEqual(changed, [os.path.join(self.test_dir, "b.md"), os.path.join(self.test_dir, "d.md")])
+
+
 class TestMainFunctions(unittest.TestCase):
     """メイン機能のテスト"""
 
@@ -449,9 +2269,10 @@ class TestArgumentParsing(unittest.TestCase):
             
             # 引数が正しく解析されることを確認
             self.assertEqual(args.root, '/test/path')
-            self.assertEqual(args.target, '/test/target')
+            self.assertEqual(args.target, ['/test/target'])
             self.assertTrue(args.yes)
             self.assertEqual(args.format, 'toml')
+            self.assertGreaterEqual(args.jobs, 1)
             # デフォルトでは全ての機能が有効（skipオプションがFalse）
             self.assertFalse(args.skip_frontmatter)
             self.assertFalse(args.skip_rename_notes)
@@ -556,9 +2377,72 @@ class TestArgumentParsing(unittest.TestCase):
             config.EXECUTION_FUNCTION_LIST.update(original_config)
 
 
+def strip_hashtag_lines_after_frontmatter(content):
+    """行単位でハッシュタグ行を取り除く参照実装（splice_frontmatterの検証用）"""
+    lines = content.split('\n')
+    
+    # Find where frontmatter ends
+    frontmatter_end_idx = -1
+    for i, line in enumerate(lines):
+        if i > 0 and line.strip() == '---':  # Found closing delimiter
+            frontmatter_end_idx = i
+            break
+    
+    # Fallback to removing every hashtag line if no frontmatter found
+    if frontmatter_end_idx <= 0:
+        return yfm_processor.strip_hashtag_lines(lines)
+    
+    # Process only the content after frontmatter for hashtag removal
+    frontmatter_lines = lines[:frontmatter_end_idx + 2]  # Include the blank line
+    content_lines = lines[frontmatter_end_idx + 2:]
+    
+    # Remove hashtag lines from content only
+    filtered_content = []
+    for line in content_lines:
+        if not yfm_processor.HASHTAG_LINE_PATTERN.match(line):
+            filtered_content.append(line)
+    
+    # Combine frontmatter with filtered content
+    final_content = '\n'.join(frontmatter_lines + filtered_content)
+    return final_content.rstrip('\n') + '\n'
+
+
 class TestFrontMatterParser(unittest.TestCase):
     """フロントマターパーサーのテスト"""
 
+    def test_frontmatter_length(self):
+        """フロントマターの終端位置の検出テスト"""
+        parser = frontmatter_parser.FrontMatterParser("yaml")
+        content = "---\ntitle: a\n---\nbody\n"
+        self.assertEqual(parser.frontmatter_length(content), len("---\ntitle: a\n---\n"))
+        # 閉じられていない、または終端行が途中で切れている場合
+        self.assertIsNone(parser.frontmatter_length("---\ntitle: a\n"))
+        self.assertIsNone(parser.frontmatter_length("---\ntitle: a\n--"))
+        self.assertIsNone(parser.frontmatter_length("# no front matter\n"))
+        json_content = '{\n"title": "{a}"\n}\nbody\n'
+        self.assertEqual(json_content[:parser.frontmatter_length(json_content)], '{\n"title": "{a}"\n}\n')
+
+    def test_parse_span_and_splice(self):
+        """オフセットでの解析と本文へのヘッダーの差し込みのテスト"""
+        parser = frontmatter_parser.FrontMatterParser("yaml")
+        content = "---\ntitle: a\n  ---  \n\n\nbody\n---\n"
+        self.assertEqual(parser.locate_frontmatter(content), ("yaml", 4, 13, 21))
+        metadata, body_start = parser.parse_frontmatter_span(content)
+        self.assertEqual(metadata, {"title": "a"})
+        self.assertEqual(content[body_start:], "\n\nbody\n---\n")
+        self.assertEqual(parser.parse_frontmatter(content), (metadata, "\n\nbody\n---\n"))
+        metadata["uid"] = "x"
+        self.assertEqual(parser.serialize_frontmatter(metadata, content, body_start),
+                         "---\nuid: x\ntitle: a\n---\n\nbody\n---\n")
+        self.assertEqual(parser.parse_frontmatter_span("no front matter"), (None, 0))
+        # ハッシュタグ行は本文からだけ取り除かれる
+        note = "---\ntitle: a\n---\n#tag\ntext #tag\n\n"
+        metadata, body_start = parser.parse_frontmatter_span(note)
+        spliced = yfm_processor.splice_frontmatter(metadata, note, body_start, parser)
+        self.assertEqual(spliced, strip_hashtag_lines_after_frontmatter(
+            parser.serialize_frontmatter(metadata, note[body_start:])))
+        self.assertEqual(spliced, "---\ntitle: a\n---\n\ntext #tag\n")
+
     def test_yaml_parser(self):
         """YAMLパーサーのテスト"""
         parser = frontmatter_parser.FrontMatterParser("yaml")